@@ -0,0 +1,138 @@
+"""Benchmark the HTML parser backends on a saved copy of the NXBrew game index
+
+Usage:
+
+    python benchmarks/parser_benchmark.py index.html
+    python benchmarks/parser_benchmark.py index.html --url https://nxbrew.net/
+
+If the file doesn't exist and --url is given, the index will be downloaded
+and saved there first. Each backend is run in its own process, so peak
+memory for one doesn't bleed into the next
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from nxbrew_dl.util import INDEX_PARSERS, get_index_entries, get_index_url, http_get
+
+
+def get_peak_memory_mb():
+    """Get the peak memory use of this process, in MB. None if we can't tell"""
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports in KB, macOS in bytes
+    if sys.platform == "darwin":
+        return peak / 1024**2
+    return peak / 1024
+
+
+def run_backend(
+    filename,
+    parser,
+    n_repeats,
+    queue,
+):
+    """Time parsing the index with a particular backend
+
+    Args:
+        filename (str): Saved index file
+        parser (str): Parser backend
+        n_repeats (int): Number of times to parse
+        queue (multiprocessing.Queue): Queue to put the results on
+    """
+
+    with open(filename, "rb") as f:
+        content = f.read()
+
+    start_memory = get_peak_memory_mb()
+
+    times = []
+    n_entries = 0
+    for _ in range(n_repeats):
+        start_time = time.perf_counter()
+        entries = get_index_entries(content, parser=parser)
+        times.append(time.perf_counter() - start_time)
+        n_entries = len(entries)
+
+    end_memory = get_peak_memory_mb()
+
+    memory = None
+    if start_memory is not None:
+        memory = end_memory - start_memory
+
+    queue.put(
+        {
+            "parser": parser,
+            "entries": n_entries,
+            "best": min(times),
+            "mean": sum(times) / len(times),
+            "memory": memory,
+        }
+    )
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("filename", help="Saved copy of the game index")
+    parser.add_argument(
+        "--url",
+        default=None,
+        help="NXBrew URL, to download the index from if the file doesn't exist",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=5,
+        help="Number of times to parse with each backend. Defaults to 5",
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.filename):
+        if args.url is None:
+            parser.error(f"{args.filename} not found, and no --url given")
+
+        r = http_get(get_index_url(args.url))
+        with open(args.filename, "wb") as f:
+            f.write(r.content)
+
+    size_mb = os.path.getsize(args.filename) / 1024**2
+    print(f"Index: {args.filename} ({size_mb:.2f}MB)")
+    print("")
+    print(f"{'Backend':<15}{'Entries':>10}{'Best (s)':>12}{'Mean (s)':>12}{'Peak mem (MB)':>16}")
+
+    queue = multiprocessing.Queue()
+
+    for index_parser in INDEX_PARSERS:
+        p = multiprocessing.Process(
+            target=run_backend,
+            args=(args.filename, index_parser, args.repeats, queue),
+        )
+        p.start()
+        result = queue.get()
+        p.join()
+
+        memory = "n/a"
+        if result["memory"] is not None:
+            memory = f"{result['memory']:.1f}"
+
+        print(
+            f"{result['parser']:<15}{result['entries']:>10}"
+            f"{result['best']:>12.3f}{result['mean']:>12.3f}{memory:>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
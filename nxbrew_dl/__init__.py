@@ -1,12 +1,18 @@
+import multiprocessing
 import sys
 from importlib.metadata import version
 
-from PySide6.QtWidgets import QApplication
 
-from .gui import MainWindow
+def run_nxbrew_gui():
+    # In the frozen app, parse worker processes start by running this
+    # again. This hands them off to multiprocessing instead of the GUI
+    multiprocessing.freeze_support()
 
+    # Only pull in Qt when we actually want the GUI
+    from PySide6.QtWidgets import QApplication
+
+    from .gui import MainWindow
 
-def run_nxbrew_gui():
     app = QApplication(sys.argv)
 
     window = MainWindow()
@@ -14,12 +20,32 @@ def run_nxbrew_gui():
 
     app.exec()
 
+
+def run_nxbrew_cli(argv=None):
+    multiprocessing.freeze_support()
+
+    from .cli import run_nxbrew_cli
+
+    return run_nxbrew_cli(argv)
+
+
+def __getattr__(name):
+    # Import the GUI lazily, so that headless use never loads PySide6
+    if name == "MainWindow":
+        from .gui import MainWindow
+
+        return MainWindow
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # Get the version
 __version__ = version(__name__)
 
 __all__ = [
     "MainWindow",
     "run_nxbrew_gui",
+    "run_nxbrew_cli",
 ]
 
 if __name__ == "__main__":
@@ -0,0 +1,404 @@
+import argparse
+import os
+import sys
+import time
+import traceback
+from urllib.parse import urlparse
+
+import nxbrew_dl
+from .nxbrew_dl import NXBrew
+from .util import (
+    GameCatalog,
+    NXBrewLogger,
+    UserCache,
+    configure_http,
+    crawl_catalog,
+    diff_game_dicts,
+    get_game_dict,
+    get_html_cache,
+    get_index_url,
+    load_yml,
+    wait_for_trash,
+)
+
+
+def get_parser():
+    """Get the argument parser for the command line interface"""
+
+    parser = argparse.ArgumentParser(
+        prog="nxbrew-dl-cli",
+        description="Download games from NXBrew without the GUI. By default, "
+        "will download everything in the cache (i.e. everything that's "
+        "been ticked in the GUI)",
+    )
+    parser.add_argument(
+        "--config",
+        default=os.path.join(os.getcwd(), "config.yml"),
+        help="Path to the user config, as saved by the GUI. Defaults to config.yml "
+        "in the current directory",
+    )
+    parser.add_argument(
+        "--game",
+        action="append",
+        default=[],
+        metavar="URL",
+        help="NXBrew URL of a game to download, on top of anything cached. "
+        "Can be given multiple times",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Parse everything, but don't download anything",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="If set, will keep running, waiting this long between runs",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running, checking the NXBrew index every --interval seconds "
+        "(default 1800) and only downloading games whose index entry has changed",
+    )
+    parser.add_argument(
+        "--crawl",
+        action="store_true",
+        help="Rather than downloading, crawl every game on NXBrew into a local "
+        "catalog database. Only pages that have changed since the last crawl "
+        "are parsed",
+    )
+    parser.add_argument(
+        "--force-crawl",
+        action="store_true",
+        help="With --crawl, re-parse every page, even if it hasn't changed",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "CRITICAL"],
+        help="Logging level. Defaults to INFO",
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=f"%(prog)s {nxbrew_dl.__version__}",
+    )
+
+    return parser
+
+
+def get_to_download(
+    user_cache,
+    urls,
+    general_config,
+    regex_config,
+    nxbrew_url,
+    logger,
+):
+    """Get games to download, from the cache and any URLs passed in
+
+    Args:
+        user_cache (UserCache): User cache
+        urls (list): Extra game URLs to download
+        general_config (dict): General configuration
+        regex_config (dict): Regex configuration
+        nxbrew_url (str): NXBrew URL
+        logger (logging.Logger): Logger instance
+    """
+
+    to_download = {user_cache[url]["name"]: url for url in user_cache}
+
+    if len(urls) == 0:
+        return to_download
+
+    # Look up names for any new games in the index
+    game_dict = get_game_dict(
+        general_config=general_config,
+        regex_config=regex_config,
+        nxbrew_url=nxbrew_url,
+    )
+    game_paths = {urlparse(url).path: game_dict[url] for url in game_dict}
+
+    for url in urls:
+        game = game_paths.get(urlparse(url).path, None)
+        if game is None:
+            logger.warning(f"Did not find {url} in the NXBrew index, skipping")
+            continue
+
+        to_download[game["short_name"]] = game["url"]
+
+    return to_download
+
+
+def get_changed_games(
+    to_download,
+    game_dict,
+    old_game_dict,
+    user_cache,
+):
+    """Get tracked games whose index entry has changed
+
+    Games are matched by URL path, in case the domain has changed. If a
+    tracked game has moved URL, the cache is moved over to match
+
+    Args:
+        to_download (dict): Tracked games, mapping name to URL
+        game_dict (dict): Current game index
+        old_game_dict (dict): Game index from the last check
+        user_cache (UserCache): User cache
+    """
+
+    delta = diff_game_dicts(old_game_dict, game_dict)
+
+    changed_games = {}
+    for game in delta["changed"] + delta["added"]:
+        changed_games[urlparse(game["url"]).path] = game
+    for renamed in delta["renamed"]:
+        changed_games[urlparse(renamed["old"]["url"]).path] = renamed["new"]
+
+    changed = {}
+    for name, url in to_download.items():
+        game = changed_games.get(urlparse(url).path, None)
+        if game is None:
+            continue
+
+        # If it's moved, move the cache with it
+        if urlparse(game["url"]).path != urlparse(url).path:
+            user_cache.rename_url(url, game["url"])
+
+        changed[name] = game["url"]
+
+    return changed
+
+
+def run_once(
+    args,
+    general_config,
+    regex_config,
+    user_cache,
+    html_cache,
+    old_game_dict,
+    logger,
+):
+    """Do a single run of NXBrew-dl
+
+    Returns the game index that was checked, in watch mode, so the next
+    run can tell what's changed
+
+    Args:
+        args (argparse.Namespace): Command line arguments
+        general_config (dict): General configuration
+        regex_config (dict): Regex configuration
+        user_cache (UserCache): User cache
+        html_cache (HTMLCache): HTML cache
+        old_game_dict (dict): Game index from the last run in watch
+            mode. None if this is the first run
+        logger (logging.Logger): Logger instance
+    """
+
+    # Re-read the config each time, in case it's been changed
+    user_config = load_yml(args.config)
+    if args.dry_run:
+        user_config["dry_run"] = True
+
+    nxbrew_url = user_config.get("nxbrew_url", "")
+
+    # If the domain's changed, move everything we've downloaded over to it
+    if "nxbrew" in nxbrew_url:
+        n_remapped = user_cache.remap_domain(nxbrew_url)
+        if n_remapped > 0:
+            logger.info(f"Updated {n_remapped} cached URL(s) to the new NXBrew URL")
+
+    to_download = get_to_download(
+        user_cache=user_cache,
+        urls=args.game,
+        general_config=general_config,
+        regex_config=regex_config,
+        nxbrew_url=nxbrew_url,
+        logger=logger,
+    )
+    clean_up = True
+    game_dict = None
+
+    # In watch mode, after the first full run only look at games that have
+    # changed in the index
+    if args.watch:
+
+        # Make sure we're looking at the latest index
+        html_cache.fetch(get_index_url(nxbrew_url))
+        game_dict = get_game_dict(
+            general_config=general_config,
+            regex_config=regex_config,
+            nxbrew_url=nxbrew_url,
+        )
+
+        if old_game_dict is not None:
+            to_download = get_changed_games(
+                to_download=to_download,
+                game_dict=game_dict,
+                old_game_dict=old_game_dict,
+                user_cache=user_cache,
+            )
+            clean_up = False
+
+            # And make sure we get the latest version of those pages
+            for url in to_download.values():
+                html_cache.fetch(url)
+
+            logger.info(f"Found {len(to_download)} tracked game(s) with changes")
+
+    if len(to_download) == 0:
+        if not args.watch:
+            logger.warning(
+                "Nothing to download. Tick some games in the GUI, or use --game"
+            )
+    else:
+        nx = NXBrew(
+            to_download=to_download,
+            general_config=general_config,
+            regex_config=regex_config,
+            user_config=user_config,
+            user_cache=user_cache,
+            logger=logger,
+        )
+        nx.run(clean_up=clean_up)
+
+    return game_dict
+
+
+def run_crawl(
+    args,
+    general_config,
+    regex_config,
+    logger,
+):
+    """Crawl every game on NXBrew into the local catalog
+
+    Args:
+        args (argparse.Namespace): Command line arguments
+        general_config (dict): General configuration
+        regex_config (dict): Regex configuration
+        logger (logging.Logger): Logger instance
+    """
+
+    user_config = load_yml(args.config)
+    catalog_config = general_config.get("catalog", {})
+
+    catalog = GameCatalog(
+        os.path.join(
+            os.getcwd(),
+            catalog_config.get("filename", "catalog.db"),
+        )
+    )
+
+    start_time = time.time()
+
+    crawl_catalog(
+        general_config=general_config,
+        regex_config=regex_config,
+        nxbrew_url=user_config.get("nxbrew_url", ""),
+        catalog=catalog,
+        max_workers=catalog_config.get("max_workers", 4),
+        rate_limit=catalog_config.get("rate_limit", 1.0),
+        parse_processes=general_config.get("parse_processes", None),
+        force=args.force_crawl,
+        logger=logger,
+    )
+
+    logger.info(
+        f"Catalog has {len(catalog)} games, crawled in {time.time() - start_time:.1f}s"
+    )
+
+    return True
+
+
+def run_nxbrew_cli(argv=None):
+    """Run NXBrew-dl from the command line
+
+    Args:
+        argv (list): Command line arguments. Defaults to None, which
+            will use sys.argv
+    """
+
+    args = get_parser().parse_args(argv)
+
+    logger = NXBrewLogger(log_level=args.log_level)
+
+    if not os.path.exists(args.config):
+        logger.warning(
+            f"Config file {args.config} not found. Set things up in the GUI first"
+        )
+        return 1
+
+    mod_dir = os.path.dirname(nxbrew_dl.__file__)
+    general_config = load_yml(os.path.join(mod_dir, "configs", "general.yml"))
+    regex_config = load_yml(os.path.join(mod_dir, "configs", "regex.yml"))
+
+    configure_http(general_config.get("http", None))
+
+    user_cache = UserCache(
+        os.path.join(
+            os.getcwd(),
+            general_config.get("user_cache_file", "cache.db"),
+        ),
+        json_file=os.path.join(os.getcwd(), "cache.json"),
+    )
+
+    interval = args.interval
+    if args.watch and interval is None:
+        interval = 1800
+
+    html_cache = get_html_cache(general_config.get("html_cache", None))
+    old_game_dict = None
+
+    while True:
+
+        try:
+            if args.crawl:
+                run_crawl(
+                    args=args,
+                    general_config=general_config,
+                    regex_config=regex_config,
+                    logger=logger,
+                )
+            else:
+                old_game_dict = run_once(
+                    args=args,
+                    general_config=general_config,
+                    regex_config=regex_config,
+                    user_cache=user_cache,
+                    html_cache=html_cache,
+                    old_game_dict=old_game_dict,
+                    logger=logger,
+                )
+        except Exception:
+
+            # If we're only running once, then just fall over
+            if interval is None:
+                raise
+
+            # Otherwise, log and try again next time
+            tb = traceback.format_exc()
+            for line in tb.splitlines():
+                logger.warning(line)
+
+        if interval is None:
+            break
+
+        logger.info(f"Sleeping for {interval}s")
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+    # Make sure anything we're deleting is gone before we exit
+    wait_for_trash()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_nxbrew_cli())
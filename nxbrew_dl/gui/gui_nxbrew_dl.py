@@ -34,12 +34,16 @@ from .gui_utils import (
 from .layout_nxbrew_dl import Ui_nxbrew_dl
 from ..nxbrew_dl import NXBrew
 from ..util import (
+    IndexSnapshot,
     check_github_version,
-    get_game_dict,
+    configure_http,
+    http_get,
+    iter_game_index,
     NXBrewLogger,
+    UserCache,
     load_yml,
     save_yml,
-    load_json,
+    wait_for_trash,
 )
 
 
@@ -81,6 +85,18 @@ class MainWindow(QMainWindow):
         self.logger = NXBrewLogger(log_level="INFO")
         self.logger.warning("Do not close this window!")
 
+        # Load in various config files
+        self.mod_dir = os.path.dirname(nxbrew_dl.__file__)
+
+        general_config_filename = os.path.join(self.mod_dir, "configs", "general.yml")
+        self.general_config = load_yml(general_config_filename)
+
+        regex_config_filename = os.path.join(self.mod_dir, "configs", "regex.yml")
+        self.regex_config = load_yml(regex_config_filename)
+
+        # Set up the shared HTTP transport
+        configure_http(self.general_config.get("http", None))
+
         # Check for version updates
         self.logger.info("Checking for new versions online")
         github_version, github_url = check_github_version()
@@ -98,15 +114,6 @@ class MainWindow(QMainWindow):
             url=github_url,
         )
 
-        # Load in various config files
-        self.mod_dir = os.path.dirname(nxbrew_dl.__file__)
-
-        general_config_filename = os.path.join(self.mod_dir, "configs", "general.yml")
-        self.general_config = load_yml(general_config_filename)
-
-        regex_config_filename = os.path.join(self.mod_dir, "configs", "regex.yml")
-        self.regex_config = load_yml(regex_config_filename)
-
         # Read in the user config, keeping the filename around so we can save it out later
         self.user_config_file = os.path.join(os.getcwd(), "config.yml")
         if os.path.exists(self.user_config_file):
@@ -122,12 +129,25 @@ class MainWindow(QMainWindow):
         reg_lang_button = self.ui.pushButtonRegionLanguage
         reg_lang_button.clicked.connect(lambda: self.regions_languages.show())
 
-        # Read in user cache, keeping the filename around so we can save it out later
-        self.user_cache_file = os.path.join(os.getcwd(), "cache.json")
-        if os.path.exists(self.user_cache_file):
-            self.user_cache = load_json(self.user_cache_file)
-        else:
-            self.user_cache = {}
+        # Open up the user cache, pulling in any old JSON cache
+        self.user_cache_file = os.path.join(
+            os.getcwd(),
+            self.general_config.get("user_cache_file", "cache.db"),
+        )
+        self.user_cache = UserCache(
+            self.user_cache_file,
+            json_file=os.path.join(os.getcwd(), "cache.json"),
+        )
+
+        # Keep track of the index between refreshes, so we can tell what's new
+        self.index_snapshot = IndexSnapshot(
+            os.path.join(
+                os.getcwd(),
+                self.general_config.get("index_snapshot_file", "index_snapshot.json"),
+            )
+        )
+        self.index_delta = None
+        self.new_urls = set()
 
         # Do an initial load of the config
         self.load_config()
@@ -135,6 +155,9 @@ class MainWindow(QMainWindow):
         # Set up the worker threads for later
         self.nxbrew_thread = None
         self.nxbrew_worker = None
+        self.index_thread = None
+        self.index_worker = None
+        self.cache_paths = set()
 
         # Help menu buttons
         documentation = self.ui.actionDocumentation
@@ -176,6 +199,14 @@ class MainWindow(QMainWindow):
         self.search_bar = self.ui.lineEditSearch
         self.search_bar.textChanged.connect(self.update_display)
 
+        # And the option to only show what's new since the last refresh. This
+        # is only available once there's a previous refresh to compare to
+        self.new_only = self.ui.checkBoxNewOnly
+        self.new_only.setEnabled(False)
+        self.new_only.stateChanged.connect(
+            lambda: self.update_display(self.search_bar.text())
+        )
+
         self.load_table()
 
     def setup_update_notification(
@@ -204,8 +235,8 @@ class MainWindow(QMainWindow):
 
         return update_box
 
-    def get_game_dict(self):
-        """Get game dictionary from NXBrew A-Z page"""
+    def check_nxbrew_url(self):
+        """Check that the NXBrew URL looks sensible, and that we can reach it"""
 
         if "nxbrew" not in self.user_config.get("nxbrew_url", ""):
             self.logger.warning(
@@ -214,42 +245,49 @@ class MainWindow(QMainWindow):
             return False
 
         try:
-            _ = requests.get(self.user_config["nxbrew_url"])
-        except (requests.exceptions.SSLError, requests.exceptions.MissingSchema) as e:
+            _ = http_get(self.user_config["nxbrew_url"])
+        except (requests.exceptions.SSLError, requests.exceptions.MissingSchema):
             self.logger.warning(
                 "Error found in NXBrew URL! Enter one that works and refresh the game list!"
             )
             return False
 
-        try:
-            self.game_dict = get_game_dict(
-                general_config=self.general_config,
-                regex_config=self.regex_config,
-                nxbrew_url=self.user_config["nxbrew_url"],
-            )
-        except Exception as e:
-            self.logger.warning(
-                "Error found retreiving game list, try another URL"
-            )
-            return False
-
+        return True
 
     def update_display(self, text):
         """When using the search bar, show/hide rows
 
+        If only showing new games, will also hide anything that isn't
+        new since the last refresh
+
         Args:
             text (str): Text to filter out rows
         """
 
+        new_only = self.new_only.isChecked() and self.index_delta is not None
+
         for r in range(self.game_table.rowCount()):
             r_text = self.game_table.item(r, 0).text()
-            if text.lower() in r_text.lower():
+            r_url = self.game_table.item(r, 0).toolTip()
+
+            if new_only and r_url not in self.new_urls:
+                self.game_table.hideRow(r)
+            elif text.lower() in r_text.lower():
                 self.game_table.showRow(r)
             else:
                 self.game_table.hideRow(r)
 
     def load_table(self):
-        """Load the game table, disable things until we're done"""
+        """Load the game table, disable things until we're done
+
+        The index is parsed in a background thread, and rows are added
+        as games come in, so the table fills up while the index is
+        still downloading
+        """
+
+        # If we're already loading, let that finish
+        if self.index_thread is not None:
+            return False
 
         self.ui.centralwidget.setEnabled(False)
 
@@ -258,41 +296,139 @@ class MainWindow(QMainWindow):
         self.load_config()
 
         self.game_dict = {}
-        self.get_game_dict()
 
         # Clear out the old table and search bar
         self.search_bar.clear()
         self.game_table.setRowCount(0)
 
-        # Add rows to the game dict
-        for name in self.game_dict:
-            row = add_row_to_table(self.game_table, self.game_dict[name])
-            self.game_dict[name].update(
+        if not self.check_nxbrew_url():
+            self.ui.centralwidget.setEnabled(True)
+            return False
+
+        # Check rows that are in the cache as they come in. Match by path,
+        # in case the domain's changed
+        self.cache_paths = set(self.user_cache.get_paths())
+
+        self.index_thread = QThread()
+        self.index_worker = IndexWorker(
+            general_config=self.general_config,
+            regex_config=self.regex_config,
+            nxbrew_url=self.user_config["nxbrew_url"],
+            logger=self.logger,
+        )
+
+        self.index_worker.moveToThread(self.index_thread)
+        self.index_thread.started.connect(self.index_worker.run)
+
+        self.index_worker.games_found.connect(self.add_games_to_table)
+        self.index_worker.finished.connect(self.finish_load_table)
+
+        # Delete the thread once we're done
+        self.index_worker.finished.connect(self.index_thread.quit)
+        self.index_worker.finished.connect(self.index_worker.deleteLater)
+        self.index_thread.finished.connect(self.index_thread.deleteLater)
+
+        self.index_thread.start()
+
+        return True
+
+    @Slot(list)
+    def add_games_to_table(self, games):
+        """Add a batch of games from the index to the table
+
+        Args:
+            games (list): List of game dictionaries
+        """
+
+        # Don't sort while we're adding rows, else they'll move from under us
+        sorting_enabled = self.game_table.isSortingEnabled()
+        self.game_table.setSortingEnabled(False)
+
+        for game in games:
+            row = add_row_to_table(self.game_table, game)
+            game.update(
                 {
                     "row": row,
                 }
             )
+            self.game_dict[game["url"]] = game
+
+            if urlparse(game["url"]).path in self.cache_paths:
+                r = self.game_table.rowCount() - 1
+                self.game_table.item(r, 1).setCheckState(Qt.CheckState.Checked)
 
-        # If in cache, check the row here
-        for cache_item in self.user_cache:
-            found_cache_item = False
+        self.game_table.setSortingEnabled(sorting_enabled)
 
-            cache_item_path = urlparse(cache_item).path
+        return True
 
-            for r in range(self.game_table.rowCount()):
+    @Slot(bool)
+    def finish_load_table(self, complete):
+        """Once the whole index is in, work out what's changed and re-enable things
 
-                table_item_path = urlparse(self.game_table.item(r, 0).toolTip()).path
+        Args:
+            complete (bool): Whether the whole index was read. If not, we
+                don't compare to the last refresh or touch the cache, since
+                anything missing would look like it's been removed
+        """
 
-                if table_item_path == cache_item_path:
-                    self.game_table.item(r, 1).setCheckState(Qt.CheckState.Checked)
-                    found_cache_item = True
-                    break
+        self.index_thread = None
+        self.index_worker = None
 
-            if found_cache_item:
-                continue
+        if complete and len(self.game_dict) > 0:
+
+            # Work out what's new since the last refresh
+            self.update_index_delta()
+
+            # If the NXBrew domain has changed, move the cache over to match
+            n_remapped = self.user_cache.remap_domain(self.user_config["nxbrew_url"])
+            if n_remapped > 0:
+                self.logger.info(
+                    f"Updated {n_remapped} cached URL(s) to the new NXBrew URL"
+                )
 
         self.ui.centralwidget.setEnabled(True)
 
+        return True
+
+    def update_index_delta(self):
+        """Compare the game index to the last refresh, and log what's changed"""
+
+        delta = self.index_snapshot.update(self.game_dict)
+
+        # If this is the first time, there's nothing to compare to, so
+        # don't let anything be filtered by it
+        if delta is None:
+            self.index_delta = None
+            self.new_urls = set()
+            self.new_only.setChecked(False)
+            self.new_only.setEnabled(False)
+            return False
+
+        self.index_delta = delta
+        self.new_only.setEnabled(True)
+        self.new_urls = set(
+            [g["url"] for g in delta["added"]]
+            + [g["new"]["url"] for g in delta["renamed"]]
+        )
+
+        self.logger.info(
+            f"Since last refresh: {len(delta['added'])} new, "
+            f"{len(delta['removed'])} removed, "
+            f"{len(delta['renamed'])} renamed, "
+            f"{len(delta['changed'])} updated"
+        )
+        for g in delta["added"]:
+            self.logger.info(f"\tNew: {g['long_name']}")
+        for g in delta["renamed"]:
+            self.logger.info(
+                f"\tRenamed: {g['old']['long_name']} -> {g['new']['long_name']}"
+            )
+
+        # Keep the filter up to date
+        self.update_display(self.search_bar.text())
+
+        return True
+
     def load_config(
         self,
     ):
@@ -479,6 +615,15 @@ class MainWindow(QMainWindow):
             self.logger.info("Closing down. Will save config")
             self.save_config()
 
+        # Stop loading the index, if we're part way through
+        if getattr(self, "index_worker", None) is not None:
+            self.index_worker.stop()
+            self.index_thread.quit()
+            self.index_thread.wait()
+
+        # Make sure anything we're deleting is gone, else it'll be killed part way
+        wait_for_trash()
+
         event.accept()
 
     def enable_disable_ui(self, mode="disable"):
@@ -523,6 +668,80 @@ class MainWindow(QMainWindow):
         return True
 
 
+class IndexWorker(QObject):
+    """Parses the game index in the background, passing games back as they come in"""
+
+    games_found = Signal(list)
+    finished = Signal(bool)
+
+    def __init__(
+        self,
+        general_config,
+        regex_config,
+        nxbrew_url,
+        logger,
+        batch_interval=0.1,
+    ):
+        """Initialise the index worker
+
+        Args:
+            general_config (dict): Dictionary of general configuration
+            regex_config (dict): Dictionary of regex configuration
+            nxbrew_url (str): NXBrew URL
+            logger (logging.Logger): Logger instance
+            batch_interval (float): Time (in seconds) to collect games
+                for before passing them back, so the table isn't updated
+                for every single game. Defaults to 0.1
+        """
+        super().__init__()
+
+        self.general_config = general_config
+        self.regex_config = regex_config
+        self.nxbrew_url = nxbrew_url
+        self.logger = logger
+        self.batch_interval = batch_interval
+
+        self.stopped = False
+
+    def stop(self):
+        """Stop parsing the index at the next game"""
+
+        self.stopped = True
+
+    def run(self):
+        """Parse the index, passing back batches of games"""
+
+        batch = []
+        last_emit = time.time()
+        complete = False
+
+        try:
+            for game in iter_game_index(
+                general_config=self.general_config,
+                regex_config=self.regex_config,
+                nxbrew_url=self.nxbrew_url,
+            ):
+                if self.stopped:
+                    break
+
+                batch.append(game)
+
+                if time.time() - last_emit >= self.batch_interval:
+                    self.games_found.emit(batch)
+                    batch = []
+                    last_emit = time.time()
+            else:
+                complete = True
+
+        except Exception:
+            self.logger.warning("Error found retrieving game list, try another URL")
+
+        if len(batch) > 0:
+            self.games_found.emit(batch)
+
+        self.finished.emit(complete)
+
+
 class NXBrewWorker(QObject):
     """Handles running NXBrew so GUI doesn't hang"""
 
@@ -555,8 +774,8 @@ class NXBrewWorker(QObject):
                 Defaults to None, which will load in from expected path
             user_config (dict): Dictionary of user configuration.
                 Defaults to None, which will load in from expected path
-            user_cache (dict): Dictionary of user cache configuration.
-                Defaults to None, which will load in from expected path
+            user_cache (UserCache): User cache. Defaults to None,
+                which will load in from expected path
             logger (logging.Logger): Logger instance. Defaults to None,
                 which will set up its own logger
         """
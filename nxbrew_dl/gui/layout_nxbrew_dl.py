@@ -273,6 +273,11 @@ class Ui_nxbrew_dl(object):
 
         self.horizontalLayoutSearch.addItem(self.horizontalSpacer_2)
 
+        self.checkBoxNewOnly = QCheckBox(self.centralwidget)
+        self.checkBoxNewOnly.setObjectName(u"checkBoxNewOnly")
+
+        self.horizontalLayoutSearch.addWidget(self.checkBoxNewOnly)
+
         self.pushButtonRefresh = QPushButton(self.centralwidget)
         self.pushButtonRefresh.setObjectName(u"pushButtonRefresh")
         icon3 = QIcon(QIcon.fromTheme(u"view-refresh"))
@@ -469,6 +474,10 @@ class Ui_nxbrew_dl(object):
 #endif // QT_CONFIG(statustip)
         self.lineEditDiscordURL.setText("")
         self.labelSearch.setText(QCoreApplication.translate("nxbrew_dl", u"Search:", None))
+#if QT_CONFIG(statustip)
+        self.checkBoxNewOnly.setStatusTip(QCoreApplication.translate("nxbrew_dl", u"If checked, will only show games that are new since the last refresh", None))
+#endif // QT_CONFIG(statustip)
+        self.checkBoxNewOnly.setText(QCoreApplication.translate("nxbrew_dl", u"New Only", None))
         self.pushButtonRefresh.setText(QCoreApplication.translate("nxbrew_dl", u"Refresh", None))
         ___qtablewidgetitem = self.tableGames.horizontalHeaderItem(0)
         ___qtablewidgetitem.setText(QCoreApplication.translate("nxbrew_dl", u"Name", None));
@@ -1,28 +1,62 @@
 import copy
 import os
-import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
 import myjdapi
 import numpy as np
+from myjdapi.exception import MYJDException
 from pathvalidate import sanitize_filename
 
 import nxbrew_dl
 from ..util import (
+    JDownloaderState,
+    JDownloaderWaiter,
+    JobJournal,
+    LockedJDownloaderDevice,
+    MirrorScoreboard,
     NXBrewLogger,
+    UserCache,
+    configure_http,
     discord_push,
     load_yml,
-    load_json,
-    save_json,
-    get_html_page,
-    get_languages,
-    get_thumb_url,
-    get_dl_dict,
+    get_html_cache,
+    get_html_content,
+    get_parse_config,
+    get_parse_pool,
+    submit_parse,
     bypass_ouo,
     bypass_1link,
+    get_journal_key,
+    get_trash_worker,
 )
 
+# Extraction statuses that mean JDownloader has given up on a package
+EXTRACTION_FAILURES = [
+    "ERROR",
+    "ERROR_CRC",
+    "ERROR_NOT_ENOUGH_SPACE",
+    "ERROR_FILE_NOT_FOUND",
+    "PASSWORD_NOT_FOUND",
+]
+
+# Job info that's saved to the journal, so we can pick jobs back up
+JOURNAL_JOB_KEYS = [
+    "name",
+    "url",
+    "dl_key",
+    "dl_key_clean",
+    "full_name",
+    "thumb_url",
+    "package_name",
+    "package_id",
+    "dl_site",
+    "dl_dict",
+    "out_dir",
+    "tried_sites",
+]
+
 
 def add_ordered_score(
     releases,
@@ -84,7 +118,8 @@ class NXBrew:
             general_config (dict): Dictionary for default configuration
             regex_config (dict): Dictionary for regex configuration
             user_config (dict): Dictionary for user configuration
-            user_cache (dict): Cache dictionary
+            user_cache (UserCache): User cache. If None, will open
+                the one in the current directory
             logger (logging.logger): Logger instance. If None, will set up a new one
         """
 
@@ -102,6 +137,9 @@ class NXBrew:
             regex_config = load_yml(regex_config_filename)
         self.regex_config = regex_config
 
+        # Set up the shared HTTP transport
+        configure_http(self.general_config.get("http", None))
+
         # Read in the user config
         user_config_file = os.path.join(os.getcwd(), "config.yml")
         if user_config is None:
@@ -118,15 +156,23 @@ class NXBrew:
         self.region_prefs.insert(0, "All")
         self.language_prefs.insert(0, "All")
 
-        # Read in user cache, keeping the filename around so we can save it out later
-        user_cache_file = os.path.join(os.getcwd(), "cache.json")
+        # Open up the user cache, pulling in any old JSON cache
         if user_cache is None:
-            if os.path.exists(user_cache_file):
-                user_cache = load_json(user_cache_file)
-            else:
-                user_cache = {}
+            user_cache = UserCache(
+                os.path.join(
+                    os.getcwd(),
+                    self.general_config.get("user_cache_file", "cache.db"),
+                ),
+                json_file=os.path.join(os.getcwd(), "cache.json"),
+            )
         self.user_cache = user_cache
-        self.user_cache_file = user_cache_file
+
+        # Keep a journal of in-flight jobs, so we can pick up where we left off
+        journal_file = os.path.join(
+            os.getcwd(),
+            self.general_config.get("journal_file", "journal.json"),
+        )
+        self.journal = JobJournal(journal_file)
 
         if logger is None:
             logger = NXBrewLogger(log_level="INFO")
@@ -145,7 +191,66 @@ class NXBrew:
         self.logger.update_redact_filter(jd_device_name)
 
         self.logger.info(f"Connecting to device {jd_device_name}")
-        self.jd_device = jd.get_device(jd_device_name)
+
+        # Wrap the device so we can safely talk to it from the background poller
+        self.jd_device = LockedJDownloaderDevice(jd.get_device(jd_device_name))
+
+        # Listen for events on a separate connection, so waiting on them
+        # doesn't hold up anything else. If we can't, share the main one
+        try:
+            event_jd = myjdapi.Myjdapi()
+            event_jd.set_app_key("nxbrewdl")
+            event_jd.connect(self.user_config["jd_user"], self.user_config["jd_pass"])
+            event_device = LockedJDownloaderDevice(event_jd.get_device(jd_device_name))
+        except MYJDException:
+            event_device = self.jd_device
+
+        # Set up waiting on JDownloader, preferring events over polling
+        jd_config = self.general_config.get("jdownloader", {})
+        self.waiter = JDownloaderWaiter(
+            event_device,
+            use_events=jd_config.get("use_events", True),
+            min_interval=jd_config.get("poll_min_interval", 0.5),
+            max_interval=jd_config.get("poll_max_interval", 10),
+            backoff=jd_config.get("poll_backoff", 1.5),
+            event_poll_timeout=jd_config.get("event_poll_timeout", 2000),
+            logger=self.logger,
+        )
+
+        # Keep a local mirror of JDownloader state, that all the waiting reads from
+        self.jd_state = JDownloaderState(
+            self.jd_device,
+            waiter=self.waiter,
+            logger=self.logger,
+        )
+
+        # Give packages a little time after finishing before we remove them
+        self.settle_time = jd_config.get("settle_time", 2)
+
+        # How long to wait for packages to turn up in the download list
+        self.move_timeout = jd_config.get("move_timeout", 60)
+
+        # How long a package can go without making progress, and how long it
+        # can take in total, before we give up on that download site
+        self.stall_timeout = jd_config.get("stall_timeout", 600)
+        self.download_timeout = jd_config.get("download_timeout", 21600)
+
+        # How many download sites to check at once
+        self.mirror_probe_count = max(jd_config.get("mirror_probe_count", 1), 1)
+
+        # Keep track of how download sites are doing, to decide which to try first
+        mirror_config = self.general_config.get("mirror_stats", {})
+        self.mirror_scoreboard = None
+        if mirror_config.get("enabled", True):
+            self.mirror_scoreboard = MirrorScoreboard(
+                filename=os.path.join(
+                    os.getcwd(),
+                    mirror_config.get("filename", "mirror_stats.json"),
+                ),
+                half_life=mirror_config.get("half_life", 86400),
+                min_samples=mirror_config.get("min_samples", 2),
+                degraded_online_rate=mirror_config.get("degraded_online_rate", 0.5),
+            )
 
         # Discord stuff
         discord_url = self.user_config.get("discord_url", "")
@@ -159,10 +264,41 @@ class NXBrew:
 
         self.dry_run = self.user_config.get("dry_run", False)
 
-    def run(self):
-        """Run NXBrew-dl"""
+        # How many games ahead to fetch and parse while we're downloading
+        self.prefetch_depth = self.general_config.get("prefetch_depth", 2)
+
+        # Pages are parsed in a pool of processes, so parsing doesn't fight
+        # the GUI (or each other) for the GIL. We only ever parse as many
+        # pages at once as we prefetch, so don't start more processes than that
+        self.parse_config = get_parse_config(self.general_config)
+        parse_processes = self.general_config.get("parse_processes", None)
+        if parse_processes is None:
+            parse_processes = os.cpu_count() or 1
+        parse_processes = min(parse_processes, max(self.prefetch_depth, 1))
+        self.parse_pool = get_parse_pool(parse_processes)
+
+        # How many packages we'll have in JDownloader at once, and the
+        # packages that are currently in flight
+        self.max_packages = self.general_config.get("max_concurrent_packages", 3)
+        self.jobs = []
+
+        # Keep track of anything that needed retrying, or failed outright
+        self.run_summary = {
+            "retries": [],
+            "failures": [],
+        }
 
-        n_downloads = len(self.to_download)
+    def run(
+        self,
+        clean_up=True,
+    ):
+        """Run NXBrew-dl
+
+        Args:
+            clean_up (bool): If True, will remove anything that's not in
+                the list of things to download from the cache and disk.
+                Defaults to True
+        """
 
         if self.progress_bar is not None:
             # Reset progress bar to 0
@@ -173,45 +309,253 @@ class NXBrew:
         self.logger.info(f"{' ' * 30}STARTING NXBREW-DL{' ' * 30}")
         self.logger.info(f"=" * 80)
 
-        for i_name, name in enumerate(self.to_download):
+        names = list(self.to_download.keys())
 
-            progress_val = 100 * (i_name + 1) / n_downloads
+        try:
+            if not self.dry_run:
+                self.resume_jobs()
+            self.download_all(names)
+        finally:
+            self.jd_state.stop()
 
-            url = self.to_download[name]
+        # Clean up
+        if clean_up:
+            self.logger.info("Performing final cache/disk clean up")
+            self.logger.info("")
 
-            if self.progress_bar is not None:
-                self.progress_bar_label.setText(f"{i_name + 1}/{n_downloads}: {name}")
+            self.clean_up_cache()
 
+        self.log_run_summary()
+
+        # Summarise how much we've hit the page cache
+        html_cache = get_html_cache(self.general_config.get("html_cache", None))
+        cache_stats = html_cache.get_stats()
+        self.logger.info(
+            f"Page cache: {cache_stats['hits'] + cache_stats['stale_hits']} hit(s), "
+            f"{cache_stats['revalidated']} unchanged, {cache_stats['misses']} downloaded"
+        )
+        self.logger.info("")
+
+        self.logger.info("All done!")
+        self.logger.info("")
+
+        return True
+
+    def download_all(
+        self,
+        names,
+    ):
+        """Download everything, and wait for JDownloader to finish up
+
+        Args:
+            names (list): Names of games to download, in order
+        """
+
+        n_downloads = len(names)
+
+        # Fetch and parse pages ahead of time in the background, so that once
+        # JDownloader is done with one game the next is ready to go
+        with ThreadPoolExecutor(max_workers=max(self.prefetch_depth, 1)) as executor:
+
+            prefetched = {}
+
+            for i_name, name in enumerate(names):
+
+                # Top up the look-ahead queue
+                for i_prefetch in range(i_name, i_name + self.prefetch_depth + 1):
+                    if i_prefetch >= n_downloads or i_prefetch in prefetched:
+                        continue
+                    prefetched[i_prefetch] = executor.submit(
+                        self.get_game_info,
+                        url=self.to_download[names[i_prefetch]],
+                    )
+
+                progress_val = 100 * (i_name + 1) / n_downloads
+
+                url = self.to_download[name]
+
+                if self.progress_bar is not None:
+                    self.progress_bar_label.setText(
+                        f"{i_name + 1}/{n_downloads}: {name}"
+                    )
+
+                self.logger.info("")
+                self.logger.info(f"=" * 80)
+                self.logger.info(f"Starting download for: {name}")
+                self.logger.info("")
+                self.download_game(
+                    name=name,
+                    url=url,
+                    game_info=prefetched.pop(i_name).result(),
+                )
+                self.logger.info(f"=" * 80)
+                self.logger.info("")
+
+                if self.progress_bar is not None:
+                    # Reset progress bar to 0
+                    self.progress_bar.setValue(progress_val)
+
+        # Let everything that's still in JDownloader finish up
+        if len(self.jobs) > 0:
+            self.logger.info("Waiting for remaining downloads to complete")
             self.logger.info("")
-            self.logger.info(f"=" * 80)
-            self.logger.info(f"Starting download for: {name}")
-            self.logger.info("")
-            self.download_game(
-                name=name,
-                url=url,
+        self.wait_for_jobs(wait_for_all=True)
+
+        return True
+
+    def resume_jobs(self):
+        """Pick up jobs from the journal that were in flight when we last stopped
+
+        Anything that was finished but didn't make it into the cache is
+        added. Anything that was sent to JDownloader and is still there is
+        reattached, so we wait on the existing package rather than adding
+        the links all over again. Everything else is left for download_game
+        to pick up, reusing any links we've already resolved. Anything for a
+        game (or download type) that's no longer selected is dropped
+        """
+
+        entries = self.journal.get_entries()
+        if len(entries) == 0:
+            return True
+
+        self.logger.info("Checking for downloads left over from the last run")
+
+        # Make sure we're looking at the current state of JDownloader,
+        # including anything we might need to find by name
+        package_names = [
+            entry["job"]["package_name"]
+            for entry in entries.values()
+            if entry.get("job", None) is not None
+        ]
+        for package_name in package_names:
+            self.jd_state.watch_name(package_name)
+
+        generation = self.jd_state.invalidate()
+        self.jd_state.wait_until(lambda: True, generation=generation)
+
+        for key, entry in entries.items():
+
+            job = entry.get("job", None)
+            if job is None:
+                self.journal.remove(key)
+                continue
+
+            job["journal_key"] = key
+
+            if not self.is_job_selected(job):
+                self.logger.info(f"\t{job['full_name']}: No longer selected, dropping")
+                self.journal.remove(key)
+                continue
+
+            # If this was done, make sure it's in the cache and move on
+            if entry["state"] == "done":
+                self.logger.info(f"\t{job['full_name']}: Already downloaded")
+                self.complete_job(job, post_to_discord=False)
+                continue
+
+            if entry["state"] not in ["submitted", "downloading", "extracting"]:
+                continue
+
+            # Look for the package, first by UUID and then by name
+            p = self.jd_state.get_package(job["package_id"])
+            if p is None:
+                p = self.jd_state.get_package(name=job["package_name"])
+
+            if p is None:
+                self.logger.info(
+                    f"\t{job['full_name']}: Not found in JDownloader, will add again"
+                )
+                self.journal.update(key, "resolved")
+                continue
+
+            self.logger.info(
+                f"\t{job['full_name']}: Reattaching to JDownloader package"
             )
-            self.logger.info(f"=" * 80)
-            self.logger.info("")
 
-            if self.progress_bar is not None:
-                # Reset progress bar to 0
-                self.progress_bar.setValue(progress_val)
+            self.user_cache.add_game(job["url"], job["name"])
 
-        # Clean up
-        self.logger.info("Performing final cache/disk clean up")
-        self.logger.info("")
+            job["resolved_links"] = entry.get("resolved_links", {})
+            self.track_job(job, package_id=p["uuid"], dl_site=job["dl_site"])
+            self.jd_state.watch(job["package_id"])
+            self.jobs.append(job)
 
-        self.clean_up_cache()
+        for package_name in package_names:
+            self.jd_state.unwatch_name(package_name)
 
-        self.logger.info("All done!")
         self.logger.info("")
 
         return True
 
+    def is_job_selected(
+        self,
+        job,
+    ):
+        """Check whether a job is still something we want to download
+
+        The game needs to be in the list to download (matching by URL
+        path, in case the domain's changed), and DLC and updates need to
+        still be turned on
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        url_paths = [urlparse(url).path for url in self.to_download.values()]
+        if urlparse(job.get("url", "")).path not in url_paths:
+            return False
+
+        if job.get("dl_key", None) == "dlc" and not self.user_config["download_dlc"]:
+            return False
+
+        if (
+            job.get("dl_key", None) == "update"
+            and not self.user_config["download_update"]
+        ):
+            return False
+
+        return True
+
+    def get_game_info(
+        self,
+        url,
+    ):
+        """Fetch and parse a game page
+
+        This doesn't touch JDownloader, the cache, or the logger, so is
+        safe to run in the background while other games are downloading.
+        Returns a dictionary with the thumbnail URL, the languages, whether
+        we found a requested language, and the parsed download dictionary
+        (None if there's no requested language)
+
+        Args:
+            url (str): URL to fetch
+        """
+
+        # Get the page. This is cached per-URL, so we only re-download if it's
+        # changed. Since this decides what we download, never use a stale page
+        content = get_html_content(
+            url,
+            cache=True,
+            cache_config=self.general_config.get("html_cache", None),
+            allow_stale=False,
+        )
+
+        # Parse in a separate process, so we don't hold up anything else
+        # while we do it
+        game_info = submit_parse(
+            self.parse_pool,
+            content,
+            parse_config=self.parse_config,
+            language_prefs=self.language_prefs,
+        ).result()
+
+        return game_info
+
     def download_game(
         self,
         name,
         url,
+        game_info=None,
     ):
         """Download game given URL
 
@@ -223,25 +567,15 @@ class NXBrew:
         Args:
             name (str): Name of game to download
             url (str): URL to download
+            game_info (dict): Pre-fetched game info, from get_game_info.
+                Defaults to None, which will fetch and parse the page here
         """
 
-        # Get the soup
-        soup = get_html_page(
-            url,
-            cache_filename="game.html",
-        )
+        if game_info is None:
+            game_info = self.get_game_info(url)
 
-        # Get thumbnail URL
-        thumb_url = get_thumb_url(
-            soup,
-        )
-
-        # Get languages
-        langs = get_languages(
-            soup,
-            lang_dict=self.general_config["languages"],
-        )
-        langs.sort()
+        thumb_url = game_info["thumb_url"]
+        langs = game_info["languages"]
 
         self.logger.info(f"Found languages across all releases:")
         for l in langs:
@@ -249,38 +583,16 @@ class NXBrew:
         self.logger.info("")
 
         # If the language we want isn't in here, then skip
-        found_language = False
-        for lang in langs:
-            for lang_pref in self.language_prefs:
-                if lang == lang_pref:
-                    found_language = True
-                    break
-            if found_language:
-                break
-
-        if not found_language:
+        if not game_info["found_language"]:
             self.logger.warning(f"Did not find any requested language:")
             for l in self.language_prefs:
                 self.logger.warning(f"\t{l}")
             self.logger.warning("")
             return False
 
-        # Pull out useful things from the config
-        regions = list(self.general_config["regions"].keys())
-        regionless_titles = self.general_config["regionless_titles"]
-        languages = self.general_config["languages"]
-        implied_languages = self.general_config["implied_languages"]
         dl_sites = self.general_config["dl_sites"]
 
-        dl_dict = get_dl_dict(
-            soup,
-            regions=regions,
-            regionless_titles=regionless_titles,
-            languages=languages,
-            implied_languages=implied_languages,
-            dl_sites=dl_sites,
-            dl_mappings=self.dl_mappings,
-        )
+        dl_dict = game_info["dl_dict"]
         n_releases = len(dl_dict)
 
         if n_releases == 0:
@@ -435,29 +747,19 @@ class NXBrew:
 
         # If we've updated URLs, check for that here and update as appropriate
         if url not in self.user_cache:
-            url_path = urlparse(url).path
-            for cache_url in self.user_cache:
-                cache_url_path = urlparse(cache_url).path
-
-                # If we match, rename and delete
-                if url_path == cache_url_path:
-                    self.user_cache[url] = self.user_cache[cache_url]
-                    del self.user_cache[cache_url]
-                    break
+            cache_url = self.user_cache.get_url_by_path(urlparse(url).path)
+            if cache_url is not None:
+                self.user_cache.rename_url(cache_url, url)
 
         # Add unique URL to cache if it's not already there
         if url not in self.user_cache:
             self.logger.debug(f"Adding {name} to cache")
-            self.user_cache[url] = {}
-            self.user_cache[url]["name"] = name
+            self.user_cache.add_game(url, name)
 
         # Add thumbnail URL to cache if it's not already there, or potentially update
-        if "thumb_url" not in self.user_cache[url]:
-            self.logger.debug("Adding thumbnail URL to cache")
-            self.user_cache[url]["thumb_url"] = thumb_url
-        if self.user_cache[url]["thumb_url"] != thumb_url:
+        if self.user_cache[url].get("thumb_url", None) != thumb_url:
             self.logger.debug("Updating thumbnail URL")
-            self.user_cache[url]["thumb_url"] = thumb_url
+            self.user_cache.set_thumb_url(url, thumb_url)
 
         # Hooray! We're finally ready to start downloading. Map things to folder and let's get going
         self.logger.info("Beginning download process:")
@@ -475,16 +777,21 @@ class NXBrew:
                     "dl_name_mapping"
                 ]
 
-                if dl_key not in self.user_cache[url]:
-                    self.user_cache[url][dl_key] = []
-
                 # Loop over items in the list
                 for dl_info in dl_dict[dl_key]:
 
-                    if dl_info["full_name"] in self.user_cache[url][dl_key]:
+                    journal_key = get_journal_key(url, dl_key, dl_info["full_name"])
+
+                    if self.user_cache.has_item(url, dl_key, dl_info["full_name"]):
                         self.logger.info(
                             f"\t{dl_key_clean}: {dl_info['full_name']} already downloaded. Will skip"
                         )
+                    elif any(
+                        [j.get("journal_key", None) == journal_key for j in self.jobs]
+                    ):
+                        self.logger.info(
+                            f"\t{dl_key_clean}: {dl_info['full_name']} already downloading. Will skip"
+                        )
                     else:
                         self.logger.info(
                             f"\tDownloading {dl_key_clean}: {dl_info['full_name']}"
@@ -494,33 +801,526 @@ class NXBrew:
                         # Sanitize the package name so we're safe here
                         package_name = sanitize_filename(name)
 
-                        self.run_jdownloader(
+                        job = {
+                            "name": name,
+                            "url": url,
+                            "dl_key": dl_key,
+                            "dl_key_clean": dl_key_clean,
+                            "full_name": dl_info["full_name"],
+                            "thumb_url": thumb_url,
+                            "package_name": package_name,
+                            "package_id": None,
+                            "journal_key": journal_key,
+                        }
+
+                        # If we got part way through this last time, pick up
+                        # any links we'd already resolved
+                        entry = self.journal.get(journal_key)
+                        if entry is not None:
+                            job["resolved_links"] = entry.get("resolved_links", {})
+
+                        self.queue_job(
+                            job=job,
                             dl_dict=dl_info,
                             out_dir=out_dir,
-                            package_name=package_name,
                         )
                         self.logger.info("")
 
-                        # Update and save out cache
-                        self.user_cache[url][dl_key].append(dl_info["full_name"])
-                        save_json(
-                            self.user_cache,
-                            self.user_cache_file,
-                            sort_key="name",
-                        )
+        self.logger.info("")
+        self.logger.info("All downloads queued")
 
-                        # Post to discord
-                        if self.discord_url is not None:
-                            self.post_to_discord(
-                                name=name,
-                                url=url,
-                                added_type=dl_key_clean,
-                                description=dl_info["full_name"],
-                                thumb_url=thumb_url,
-                            )
+        return True
 
-        self.logger.info("")
-        self.logger.info("All downloads complete")
+    def queue_job(
+        self,
+        job,
+        dl_dict,
+        out_dir,
+    ):
+        """Send a job off to JDownloader, once there's space for it
+
+        We keep a limited number of packages in JDownloader at once. If
+        we're full, or a package with the same name is still in flight
+        (which JDownloader would merge together), wait for something to
+        finish first
+
+        Args:
+            job (dict): Dictionary of job info
+            dl_dict (dict): Dictionary of download files
+            out_dir: Directory to save downloaded files
+        """
+
+        while len(self.jobs) >= self.max_packages or any(
+            [j["package_name"] == job["package_name"] for j in self.jobs]
+        ):
+            self.wait_for_jobs()
+
+        # Keep hold of everything we need to send it again on another site
+        job["dl_dict"] = dl_dict
+        job["out_dir"] = out_dir
+        job["tried_sites"] = []
+        job.setdefault("resolved_links", {})
+
+        self.journal_job(job, "parsed")
+
+        package_id = self.submit_job(job)
+
+        # If there's no package, nothing made it to JDownloader, so don't
+        # count this as downloaded
+        if package_id is None:
+            job["dl_site"] = "Every download site"
+            job["failure"] = "was offline or failed"
+            self.abandon_job(job)
+            return True
+
+        self.jobs.append(job)
+
+        return True
+
+    def submit_job(
+        self,
+        job,
+    ):
+        """Send a job to JDownloader, skipping any sites already tried
+
+        Resets the progress tracking for the job, and returns the
+        package UUID in the download list (or None if nothing could
+        be found)
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        package_id, dl_site = self.submit_to_jdownloader(
+            dl_dict=job["dl_dict"],
+            out_dir=job["out_dir"],
+            package_name=job["package_name"],
+            skip_sites=job["tried_sites"],
+            resolved_links=job.setdefault("resolved_links", {}),
+            journal_key=job.get("journal_key", None),
+        )
+
+        self.track_job(job, package_id=package_id, dl_site=dl_site)
+
+        if dl_site is not None:
+            job["tried_sites"].append(dl_site)
+
+        if package_id is not None:
+            self.journal_job(job, "submitted")
+
+        return package_id
+
+    def track_job(
+        self,
+        job,
+        package_id,
+        dl_site,
+    ):
+        """Set the package for a job, and reset its progress tracking
+
+        Args:
+            job (dict): Dictionary of job info
+            package_id (int): Package UUID in the download list
+            dl_site (str): Download site the package is from
+        """
+
+        now = time.time()
+
+        job["package_id"] = package_id
+        job["dl_site"] = dl_site
+        job["submitted_time"] = now
+        job["progress_time"] = now
+        job["bytes_loaded"] = 0
+        job["finished_time"] = None
+        job["missing_time"] = None
+        job["removed"] = False
+        job["failure"] = None
+        job["speed_total"] = 0
+        job["speed_samples"] = 0
+
+        return True
+
+    def journal_job(
+        self,
+        job,
+        state,
+    ):
+        """Record the state of a job in the journal
+
+        Args:
+            job (dict): Dictionary of job info
+            state (str): Journal state
+        """
+
+        if job.get("journal_key", None) is None:
+            return False
+
+        return self.journal.update(
+            job["journal_key"],
+            state,
+            job={k: job[k] for k in JOURNAL_JOB_KEYS if k in job},
+            resolved_links=job.get("resolved_links", {}),
+        )
+
+    def wait_for_jobs(
+        self,
+        wait_for_all=False,
+    ):
+        """Wait for in-flight packages to finish, and complete them
+
+        Args:
+            wait_for_all (bool): If True, will wait for every package to
+                finish. Otherwise, will return as soon as one has.
+                Defaults to False
+        """
+
+        while len(self.jobs) > 0:
+
+            finished_jobs = self.jd_state.wait_until(self.get_finished_jobs)
+
+            for job in finished_jobs:
+
+                # If the package has been removed from JDownloader, then
+                # don't try to download it again
+                if job["removed"]:
+                    self.abandon_job(job)
+                    self.jobs.remove(job)
+                    self.logger.info("")
+                    continue
+
+                # If things have gone wrong, try and move on to another site
+                if job["failure"] is not None:
+                    if not self.failover_job(job):
+                        self.jobs.remove(job)
+                        self.logger.info("")
+                    continue
+
+                self.jobs.remove(job)
+
+                self.logger.info(
+                    f"\t{job['name']}: {job['dl_key_clean']}: {job['full_name']}"
+                )
+                self.finish_package(job["package_id"])
+                self.record_download_speed(job)
+                self.complete_job(job)
+                self.logger.info("")
+
+            if not wait_for_all:
+                break
+
+        return True
+
+    def get_finished_jobs(self):
+        """Get in-flight jobs that have finished downloading and extracting
+
+        Packages need to have been seen as finished for at least the settle
+        time, to make sure JDownloader is done with them. Jobs that have
+        stalled, run out of time, or failed to extract are also returned,
+        with the reason in "failure". Returns None if nothing has finished
+        """
+
+        finished_jobs = []
+
+        for job in self.jobs:
+            self.sample_download_speed(job)
+
+            job["failure"] = self.get_job_failure(job)
+            if job["failure"] is not None:
+                finished_jobs.append(job)
+                continue
+
+            # Keep the journal up to date with where we are
+            p = self.jd_state.get_package(job["package_id"])
+            if p is not None:
+                if p.get("finished", False):
+                    self.journal_job(job, "extracting")
+                elif p.get("bytesLoaded", 0) > 0:
+                    self.journal_job(job, "downloading")
+
+            if self.is_package_finished(job["package_id"]):
+                if job.get("finished_time", None) is None:
+                    job["finished_time"] = time.time()
+                if time.time() - job["finished_time"] >= self.settle_time:
+                    finished_jobs.append(job)
+            else:
+                job["finished_time"] = None
+
+        if len(finished_jobs) == 0:
+            return None
+
+        return finished_jobs
+
+    def get_job_failure(
+        self,
+        job,
+    ):
+        """Check whether an in-flight job has stalled or failed
+
+        Keeps track of when the package last made progress. The stall clock
+        only runs while JDownloader is actually downloading the package, so
+        packages waiting in its queue aren't counted as stalled. Returns a
+        reason if the package has made no progress for the stall timeout,
+        has taken longer than the download timeout, or failed to extract.
+        If the package has gone missing from JDownloader for the move
+        timeout (e.g. it's been removed by hand), flags the job as removed
+        and returns a reason. Otherwise, returns None
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        now = time.time()
+
+        p = self.jd_state.get_package(job["package_id"])
+        if p is None:
+            if job["missing_time"] is None:
+                job["missing_time"] = now
+
+            if now - job["missing_time"] > self.move_timeout:
+                job["removed"] = True
+                return "removed from JDownloader"
+
+            return self.get_job_timeout(job, now=now)
+
+        job["missing_time"] = None
+
+        links = self.jd_state.get_links(job["package_id"])
+
+        for status in links:
+            if status.get("extractionStatus", None) in EXTRACTION_FAILURES:
+                return f"extraction failed ({status['extractionStatus']})"
+
+        # Only start the stall clock once JDownloader is working on the package
+        active = p.get("running", False) or any(
+            [status.get("running", False) for status in links]
+        )
+        if not active or p.get("bytesLoaded", 0) > job["bytes_loaded"]:
+            job["bytes_loaded"] = max(p.get("bytesLoaded", 0), job["bytes_loaded"])
+            job["progress_time"] = now
+
+        # Once downloading's done, we're just waiting on extraction
+        if (
+            not p.get("finished", False)
+            and self.stall_timeout is not None
+            and now - job["progress_time"] > self.stall_timeout
+        ):
+            return f"stalled for {now - job['progress_time']:.0f}s"
+
+        return self.get_job_timeout(job, now=now)
+
+    def get_job_timeout(
+        self,
+        job,
+        now=None,
+    ):
+        """Check whether an in-flight job has taken longer than the download timeout
+
+        Returns a reason if it has, otherwise None
+
+        Args:
+            job (dict): Dictionary of job info
+            now (float): Current time. Defaults to None, which will use
+                the time now
+        """
+
+        if now is None:
+            now = time.time()
+
+        if (
+            self.download_timeout is not None
+            and now - job["submitted_time"] > self.download_timeout
+        ):
+            return f"not done after {now - job['submitted_time']:.0f}s"
+
+        return None
+
+    def abandon_job(
+        self,
+        job,
+    ):
+        """Give up on a job without trying another download site
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        self.logger.warning(
+            f"\t{job['package_name']}: {job['dl_site']} {job['failure']}, giving up"
+        )
+
+        self.jd_state.unwatch(job["package_id"])
+
+        self.run_summary["failures"].append(
+            {
+                "name": job["package_name"],
+                "full_name": job.get("full_name", job["package_name"]),
+                "dl_site": job["dl_site"],
+                "reason": job["failure"],
+                "outcome": "giving up",
+            }
+        )
+
+        # Start from scratch next time
+        if job.get("journal_key", None) is not None:
+            self.journal.remove(job["journal_key"])
+
+        return True
+
+    def failover_job(
+        self,
+        job,
+    ):
+        """Remove a failed package, and try again with the next download site
+
+        Returns True if the job has been sent off again, False if
+        we've run out of sites
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        self.logger.warning(
+            f"\t{job['package_name']}: {job['dl_site']} {job['failure']}, "
+            f"will remove and try with another download client"
+        )
+
+        # Get rid of the package, and anything it's downloaded so far
+        self.jd_device.downloads.cleanup(
+            action="DELETE_ALL",
+            mode="REMOVE_LINKS_AND_DELETE_FILES",
+            selection_type="SELECTED",
+            package_ids=[job["package_id"]],
+        )
+        self.jd_state.unwatch(job["package_id"])
+        self.jd_state.invalidate()
+
+        # This counts against the site
+        if self.mirror_scoreboard is not None:
+            self.mirror_scoreboard.record_check(job["dl_site"], online=False)
+
+        retry = {
+            "name": job["package_name"],
+            "full_name": job.get("full_name", job["package_name"]),
+            "dl_site": job["dl_site"],
+            "reason": job["failure"],
+        }
+
+        package_id = self.submit_job(job)
+        if package_id is None:
+            self.logger.warning(
+                f"\t{job['package_name']}: No more download sites to try, giving up"
+            )
+            self.run_summary["failures"].append(retry)
+
+            # Start from scratch next time
+            if job.get("journal_key", None) is not None:
+                self.journal.remove(job["journal_key"])
+            return False
+
+        retry["new_dl_site"] = job["dl_site"]
+        self.run_summary["retries"].append(retry)
+
+        return True
+
+    def log_run_summary(self):
+        """Log any downloads that needed retrying, or failed outright"""
+
+        for retry in self.run_summary["retries"]:
+            self.logger.info(
+                f"Retried {retry['full_name']}: {retry['dl_site']} {retry['reason']}, "
+                f"switched to {retry['new_dl_site']}"
+            )
+
+        for failure in self.run_summary["failures"]:
+            outcome = failure.get("outcome", "no other download sites left")
+            self.logger.warning(
+                f"Failed {failure['full_name']}: {failure['dl_site']} {failure['reason']}, "
+                f"{outcome}"
+            )
+
+        if len(self.run_summary["retries"]) + len(self.run_summary["failures"]) > 0:
+            self.logger.info("")
+
+        return True
+
+    def sample_download_speed(
+        self,
+        job,
+    ):
+        """Keep track of the download speed for an in-flight job
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        p = self.jd_state.get_package(job["package_id"])
+        if p is None or p.get("speed", 0) <= 0:
+            return False
+
+        job["speed_total"] = job.get("speed_total", 0) + p["speed"]
+        job["speed_samples"] = job.get("speed_samples", 0) + 1
+
+        return True
+
+    def record_download_speed(
+        self,
+        job,
+    ):
+        """Record the average download speed for a finished job
+
+        Args:
+            job (dict): Dictionary of job info
+        """
+
+        if self.mirror_scoreboard is None or job.get("speed_samples", 0) == 0:
+            return False
+
+        speed = job["speed_total"] / job["speed_samples"]
+        self.mirror_scoreboard.record_download(job["dl_site"], speed)
+
+        self.logger.debug(
+            f"Average speed from {job['dl_site']}: {speed / 1024 ** 2:.2f}MB/s"
+        )
+
+        return True
+
+    def complete_job(
+        self,
+        job,
+        post_to_discord=True,
+    ):
+        """Update the cache and post to Discord for a finished job
+
+        Args:
+            job (dict): Dictionary of job info
+            post_to_discord (bool): If True, will post to Discord if
+                set up. Defaults to True
+        """
+
+        url = job["url"]
+        dl_key = job["dl_key"]
+
+        # Mark as done first, so if we die before the cache is saved we know
+        # to add it next time
+        self.journal_job(job, "done")
+
+        # Update the cache
+        self.user_cache.add_game(url, job["name"])
+        self.user_cache.add_item(url, dl_key, job["full_name"])
+
+        # And now it's safely in the cache, we can forget about it
+        if job.get("journal_key", None) is not None:
+            self.journal.remove(job["journal_key"])
+
+        # Post to discord
+        if post_to_discord and self.discord_url is not None:
+            self.post_to_discord(
+                name=job["name"],
+                url=url,
+                added_type=job["dl_key_clean"],
+                description=job["full_name"],
+                thumb_url=job["thumb_url"],
+            )
 
         return True
 
@@ -566,30 +1366,46 @@ class NXBrew:
 
         return releases
 
-    def run_jdownloader(
+    def submit_to_jdownloader(
         self,
         dl_dict,
         out_dir,
         package_name,
+        skip_sites=None,
+        resolved_links=None,
+        journal_key=None,
     ):
-        """Grab links and download through JDownloader
+        """Grab links and send them to the JDownloader download list
 
         Will look through download sites in priority order,
         bypassing shortened links if required and checking
-        everything's online. Then, will download, extract,
-        and clean up at the end
+        everything's online. Sites are checked in batches of
+        mirror_probe_count, and the highest priority site that's
+        fully online wins. If we're keeping mirror statistics,
+        sites are reordered based on how they've been doing
+        recently. Returns the package UUID in the download list
+        and the download site, or None for both if nothing was
+        found
 
         Args:
             dl_dict (dict): Dictionary of download files
             out_dir: Directory to save downloaded files
             package_name (str): Name of package to define subdirectories
                 and keep track of links
+            skip_sites (list): Download sites to skip, e.g. because
+                they've already failed. Defaults to None
+            resolved_links (dict): Mapping of links to their resolved
+                (unshortened) versions, which will be reused and updated.
+                Defaults to None
+            journal_key (str): If set, will record resolved links in the
+                journal under this key. Defaults to None
         """
 
-        package_id = None
-        dl_site = None
+        if skip_sites is None:
+            skip_sites = []
 
-        # Loop over download sites, hit the first one we find
+        # Get the sites we can actually use, in priority order
+        candidate_sites = []
         for dl_site in self.general_config["dl_sites"]:
 
             if dl_site in self.general_config["dl_sites_no_jdownload"]:
@@ -597,185 +1413,345 @@ class NXBrew:
                 continue
 
             if dl_site in dl_dict:
-                dl_links = dl_dict[dl_site]
-                self.logger.info(f"\t\tTrying {dl_site}:")
-
-                for d in dl_links:
+                candidate_sites.append(dl_site)
 
-                    # Redact the link
-                    self.logger.update_redact_filter(d)
-
-                    self.logger.info(f"\t\t\tLink: {d}")
-                    if "ouo" in d:
-                        self.logger.info(
-                            f"\t\t\t\t{d} detected as OUO shortened link. Will bypass"
-                        )
-                        d_final = bypass_ouo(d, logger=self.logger)
-                    elif "1link" in d:
-                        self.logger.info(
-                            f"\t\t\t\t{d} detected as 1link shortened link. Will bypass"
-                        )
-                        d_final = bypass_1link(d, logger=self.logger)
-                    else:
-                        d_final = copy.deepcopy(d)
-
-                    # Redact the link
-                    self.logger.update_redact_filter(d_final)
-
-                    self.logger.info(f"\t\t\t\tAdding {d_final} to JDownloader")
-                    self.jd_device.linkgrabber.add_links(
-                        [
-                            {
-                                "autostart": False,
-                                "links": d_final,
-                                "destinationFolder": out_dir,
-                                "packageName": package_name,
-                            }
-                        ]
-                    )
-
-                # Check that the package has been added
-                package_added = False
-                while not package_added:
-                    time.sleep(1)
-
-                    package_list = self.jd_device.linkgrabber.query_packages()
-
-                    for p in package_list:
-
-                        if package_added:
-                            continue
-
-                        if p["name"] == package_name:
-                            package_added = True
+        if len(candidate_sites) == 0:
+            raise ValueError("Expecting the package_id to be defined")
 
-                # Check that all links have been added
-                all_added = False
-                while not all_added:
-                    time.sleep(1)
-                    package_list = self.jd_device.linkgrabber.query_packages()
+        candidate_sites = [d for d in candidate_sites if d not in skip_sites]
+        if len(candidate_sites) == 0:
+            return None, None
 
-                    found_package = False
-                    child_count = None
+        # Put the healthiest, fastest sites first
+        if self.mirror_scoreboard is not None:
+            for dl_site in self.mirror_scoreboard.get_degraded_sites(candidate_sites):
+                self.logger.info(
+                    f"\t\t{dl_site} has been unreliable recently, will try it last"
+                )
+            candidate_sites = self.mirror_scoreboard.sort_sites(candidate_sites)
 
-                    for p in package_list:
+        package_id = None
+        dl_site = None
+        link_ids = []
 
-                        if found_package:
-                            continue
+        # Try sites in batches, taking the highest priority one that's fully online
+        while len(candidate_sites) > 0 and package_id is None:
 
-                        if p["name"] == package_name:
-                            child_count = p["childCount"]
-                            found_package = True
+            batch = candidate_sites[: self.mirror_probe_count]
+            candidate_sites = candidate_sites[len(batch) :]
 
-                    if child_count == len(dl_links):
-                        all_added = True
+            probes = self.probe_sites(
+                dl_dict=dl_dict,
+                dl_sites=batch,
+                out_dir=out_dir,
+                package_name=package_name,
+                resolved_links=resolved_links,
+                journal_key=journal_key,
+            )
 
-                # Next up, we want to do a check that all the files are online and happy
-                package_list = self.jd_device.linkgrabber.query_packages()
-                for p in package_list:
-                    if p["name"] == package_name:
-                        package_id = p["uuid"]
-                        break
+            for site in batch:
+                probe = probes[site]
 
-                if package_id is None:
-                    raise ValueError(
-                        f"Did not find associated package with name {package_name}"
+                if self.mirror_scoreboard is not None:
+                    self.mirror_scoreboard.record_check(
+                        site,
+                        online=probe["online"],
+                        time_to_online=probe["time_to_online"],
                     )
 
-                file_list = self.jd_device.linkgrabber.query_links()
-                any_offline = False
-                for f in file_list:
-                    if f["packageUUID"] == package_id:
-                        if not f["availability"] == "ONLINE":
-                            self.logger.warning(
-                                "\t\t\tLink(s) offline, will remove and try with another download client"
-                            )
-                            any_offline = True
-                            break
+                if package_id is None and probe["online"]:
+                    dl_site = site
+                    package_id = probe["package_id"]
+                    link_ids = probe["link_ids"]
 
-                if any_offline:
-                    self.jd_device.linkgrabber.remove_links(package_ids=[package_id])
+                    # Give the package its real name back
+                    if probe["package_name"] != package_name:
+                        self.jd_device.linkgrabber.rename_package(
+                            package_id, package_name
+                        )
                     continue
 
-                break
+                # Anything else gets thrown away
+                if not probe["online"]:
+                    self.logger.warning(
+                        f"\t\t\t{site}: Link(s) offline, will remove and try with another download client"
+                    )
+                self.jd_device.linkgrabber.remove_links(
+                    package_ids=[probe["package_id"]]
+                )
+                self.jd_state.unwatch(probe["package_id"])
 
-        if dl_site is None:
-            raise ValueError("Expecting dl_site to be defined")
+            self.jd_state.invalidate()
 
+        # If everything's offline, then warn and return
         if package_id is None:
-            raise ValueError("Expecting the package_id to be defined")
-
-        # Finally, we need to pull the links out as well to move them
-        # to the download list
-        link_list = self.jd_device.linkgrabber.query_links()
-        link_ids = []
-        for l in link_list:
-            if l["packageUUID"] == package_id:
-                link_ids.append(l["uuid"])
+            self.logger.warning(
+                f"Did not find associated package with name {package_name}"
+            )
+            return None, None
 
         # Hooray! We've got stuff online. Start downloading
         self.logger.info(f"\t\t\tSuccess! Will download from {dl_site}")
         self.logger.info(f"\t\tStarting download")
+        self.jd_state.watch_name(package_name)
         self.jd_device.linkgrabber.move_to_downloadlist(
             link_ids=link_ids, package_ids=[package_id]
         )
+        self.jd_state.unwatch(package_id)
+        generation = self.jd_state.invalidate()
 
         # The package ID changes when it moves to downloads so find it again
         package_id = None
 
-        package_list = self.jd_device.downloads.query_packages()
-        for p in package_list:
-            if p["name"] == package_name:
-                package_id = p["uuid"]
-                break
+        def check_package_moved():
+            p = self.jd_state.get_package(
+                name=package_name,
+                list_name="downloads",
+            )
+            if p is not None:
+                return p["uuid"]
+            return None
+
+        try:
+            package_id = self.jd_state.wait_until(
+                check_package_moved,
+                generation=generation,
+                timeout=self.move_timeout,
+            )
+        except TimeoutError:
+            pass
+        finally:
+            self.jd_state.unwatch_name(package_name)
 
         # If everything's offline, then we'll fail here, so warn and return
         if package_id is None:
             self.logger.warning(
                 f"Did not find associated package with name {package_name}"
             )
-            return True
+            return None, None
+
+        self.jd_state.watch(package_id)
+
+        return package_id, dl_site
+
+    def probe_sites(
+        self,
+        dl_dict,
+        dl_sites,
+        out_dir,
+        package_name,
+        resolved_links=None,
+        journal_key=None,
+    ):
+        """Send links for several download sites to JDownloader at once
+
+        Each site gets its own package in the linkgrabber, so JDownloader
+        checks them all in parallel. Returns a dictionary for each site
+        with the package name and UUID, the link UUIDs, whether all
+        the links are online, and how long it took to find out
+
+        Args:
+            dl_dict (dict): Dictionary of download files
+            dl_sites (list): Download sites to probe
+            out_dir: Directory to save downloaded files
+            package_name (str): Name of package to define subdirectories
+                and keep track of links
+            resolved_links (dict): Mapping of links to their resolved
+                (unshortened) versions, which will be reused and updated.
+                Defaults to None
+            journal_key (str): If set, will record resolved links in the
+                journal under this key. Defaults to None
+        """
+
+        if resolved_links is None:
+            resolved_links = {}
+
+        probes = {}
+        packages = []
+
+        for dl_site in dl_sites:
+
+            dl_links = dl_dict[dl_site]
+            self.logger.info(f"\t\tTrying {dl_site}:")
+
+            final_links = []
+            for d in dl_links:
+
+                # Redact the link
+                self.logger.update_redact_filter(d)
+
+                self.logger.info(f"\t\t\tLink: {d}")
+                if d in resolved_links:
+                    self.logger.info(f"\t\t\t\tAlready resolved {d}")
+                    d_final = resolved_links[d]
+                elif "ouo" in d:
+                    self.logger.info(
+                        f"\t\t\t\t{d} detected as OUO shortened link. Will bypass"
+                    )
+                    d_final = bypass_ouo(d, logger=self.logger)
+                elif "1link" in d:
+                    self.logger.info(
+                        f"\t\t\t\t{d} detected as 1link shortened link. Will bypass"
+                    )
+                    d_final = bypass_1link(d, logger=self.logger)
+                else:
+                    d_final = copy.deepcopy(d)
+
+                # Redact the link
+                self.logger.update_redact_filter(d_final)
+
+                self.logger.info(f"\t\t\t\tAdding {d_final} to JDownloader")
+                final_links.append(d_final)
+                resolved_links[d] = d_final
+
+            # If we're probing multiple sites, keep the packages separate
+            probe_name = package_name
+            if len(dl_sites) > 1:
+                probe_name = f"{package_name} [{dl_site}]"
 
-        # Query status occasionally, to make sure the download is complete and
-        # extraction is done
-        finished = False
-        while not finished:
-            time.sleep(1)
-            dl_status = self.jd_device.downloads.query_packages(
+            probes[dl_site] = {
+                "package_name": probe_name,
+                "n_links": len(dl_links),
+            }
+
+            packages.append(
+                {
+                    "links": final_links,
+                    "out_dir": out_dir,
+                    "package_name": probe_name,
+                }
+            )
+
+        if journal_key is not None:
+            self.journal.update(journal_key, "resolved", resolved_links=resolved_links)
+
+        # Send all the links over in one go, rather than one call per part
+        start_time = time.time()
+        for dl_site in dl_sites:
+            self.jd_state.watch_name(probes[dl_site]["package_name"])
+        self.add_links_to_jdownloader(packages)
+        generation = self.jd_state.invalidate()
+
+        for dl_site in dl_sites:
+
+            probe_name = probes[dl_site]["package_name"]
+            n_links = probes[dl_site]["n_links"]
+
+            # Wait until the package has turned up with all its links in,
+            # and grab its UUID
+            def check_package_added():
+                p = self.jd_state.get_package(
+                    name=probe_name,
+                    list_name="linkgrabber",
+                )
+                if p is not None and p.get("childCount", 0) == n_links:
+                    return p["uuid"]
+                return None
+
+            package_id = self.jd_state.wait_until(
+                check_package_added,
+                generation=generation,
+            )
+            probes[dl_site]["package_id"] = package_id
+
+            self.jd_state.watch(package_id)
+            self.jd_state.unwatch_name(probe_name)
+
+        # Next up, we want to do a check that all the files are online and happy
+        generation = self.jd_state.invalidate()
+
+        for dl_site in dl_sites:
+
+            package_id = probes[dl_site]["package_id"]
+
+            file_list = self.jd_state.wait_until(
+                lambda: self.jd_state.get_links(
+                    package_id,
+                    list_name="linkgrabber",
+                ),
+                generation=generation,
+            )
+
+            probes[dl_site]["time_to_online"] = time.time() - start_time
+            probes[dl_site]["link_ids"] = [f["uuid"] for f in file_list]
+            probes[dl_site]["online"] = all(
+                [f.get("availability", None) == "ONLINE" for f in file_list]
+            )
+
+        return probes
+
+    def add_links_to_jdownloader(
+        self,
+        packages,
+    ):
+        """Add links for one or more packages to the JDownloader linkgrabber
+
+        All the links for a package are sent as a single newline-separated
+        request. The My.JDownloader API only takes one package per call,
+        so several packages will be one call each
+
+        Args:
+            packages (list): List of dictionaries, each with "links" (list
+                of links), "out_dir" (directory to save to) and
+                "package_name" (name of the package)
+        """
+
+        for package in packages:
+            self.jd_device.linkgrabber.add_links(
                 [
                     {
-                        "packageUUIDs": [package_id],
-                        "status": True,
-                        "finished": True,
+                        "autostart": False,
+                        "links": "\n".join(package["links"]),
+                        "destinationFolder": package["out_dir"],
+                        "packageName": package["package_name"],
                     }
                 ]
             )
-            if "finished" not in dl_status[0]:
+
+        return True
+
+    def is_package_finished(
+        self,
+        package_id,
+    ):
+        """Check whether a package has finished downloading and extracting
+
+        Args:
+            package_id (int): Package UUID in the download list
+        """
+
+        package = self.jd_state.get_package(package_id=package_id)
+        if package is None:
+            finished = False
+        else:
+            finished = package.get("finished", False)
+
+        # Hunt through to make sure extraction is also complete,
+        # only once everything is downloaded
+        if finished:
+            dl_status = self.jd_state.get_links(package_id)
+
+            # If we haven't got the links in yet, we can't tell
+            if len(dl_status) < package.get("childCount", 0):
                 finished = False
-            else:
-                finished = dl_status[0]["finished"]
-
-            # Hunt through to make sure extraction is also complete,
-            # only once everything is downloaded
-            if finished:
-                dl_status = self.jd_device.downloads.query_links(
-                    [
-                        {
-                            "packageUUIDs": [package_id],
-                            "status": True,
-                            "extractionStatus": True,
-                            "finished": True,
-                        }
-                    ]
-                )
-                for status in dl_status:
-                    if "extractionStatus" in status:
-                        if status["extractionStatus"] != "SUCCESSFUL":
-                            finished = False
-                            break
 
-        # Wait for a bit, just to ensure everything is good
-        time.sleep(5)
+            for status in dl_status:
+                if "extractionStatus" in status:
+                    if status["extractionStatus"] != "SUCCESSFUL":
+                        finished = False
+                        break
+
+        return finished
+
+    def finish_package(
+        self,
+        package_id,
+    ):
+        """Remove a finished package's links from JDownloader
+
+        Args:
+            package_id (int): Package UUID in the download list
+        """
 
         self.logger.info("\t\tFiles successfully downloaded")
 
@@ -787,6 +1763,9 @@ class NXBrew:
             package_ids=[package_id],
         )
 
+        self.jd_state.unwatch(package_id)
+        self.jd_state.invalidate()
+
         self.logger.info("\t\tLinks removed from JDownloader")
 
         return True
@@ -824,24 +1803,29 @@ class NXBrew:
         return True
 
     def clean_up_cache(self):
-        """Remove items from the cache and on disk, if needed, and do a final save"""
+        """Remove items from the cache and on disk, if needed"""
+
+        # Big directories get moved out of the way and deleted in the background
+        trash = get_trash_worker(
+            os.path.join(
+                self.user_config["download_dir"],
+                self.general_config.get("trash_dir", ".nxbrew-dl_trash"),
+            ),
+            logger=self.logger,
+        )
 
-        # First, scan through for any games that are no longer check
-        games = [g for g in self.to_download]
-        games_to_delete = []
-        keys_to_delete = []
+        # First, find any games that are no longer checked
+        cache_games = {}
+        for d, cache_entry in self.user_cache.items():
+            cache_games.setdefault(cache_entry["name"], []).append(d)
 
-        for d in self.user_cache:
-            cache_game = self.user_cache[d]["name"]
-            if cache_game not in games:
-                games_to_delete.append(cache_game)
-                keys_to_delete.append(d)
+        games_to_delete = sorted(set(cache_games) - set(self.to_download))
 
         if len(games_to_delete) > 0:
 
             self.logger.info(f"\tRemoving games:")
 
-            for i, g in enumerate(games_to_delete):
+            for g in games_to_delete:
 
                 g_sanitized = sanitize_filename(g)
 
@@ -854,10 +1838,11 @@ class NXBrew:
                     )
                     if os.path.exists(g_dir):
                         self.logger.info(f"\t\tRemoving {g}: {dl_mapping}")
-                        shutil.rmtree(g_dir)
+                        trash.delete(g_dir)
 
                 # And remove from the cache
-                self.user_cache.pop(keys_to_delete[i])
+                for d in cache_games[g]:
+                    del self.user_cache[d]
 
             self.logger.info("")
 
@@ -881,16 +1866,8 @@ class NXBrew:
                     dl_dir,
                 )
                 if os.path.exists(out_dir):
-                    shutil.rmtree(out_dir)
-
-                for d in self.user_cache:
-                    self.user_cache[d].pop(key, [])
+                    trash.delete(out_dir)
 
-        # Save out the cache
-        save_json(
-            self.user_cache,
-            self.user_cache_file,
-            sort_key="name",
-        )
+                self.user_cache.remove_dl_key(key)
 
         return True
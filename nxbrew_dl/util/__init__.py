@@ -1,24 +1,100 @@
+from .cache_tools import HTMLCache, get_html_cache
+from .catalog_tools import GameCatalog, crawl_catalog
 from .discord_tools import discord_push
 from .download_tools import get_dl_dict, bypass_ouo, bypass_1link
 from .github_tools import check_github_version
-from .html_tools import get_html_page, get_game_dict, get_languages, get_thumb_url
+from .http_tools import (
+    configure_http,
+    get_session,
+    get_cffi_session,
+    http_get,
+    http_post,
+)
+from .html_tools import (
+    HTML_PARSERS,
+    INDEX_PARSERS,
+    get_html_content,
+    get_html_page,
+    get_game_dict,
+    get_game_entry,
+    get_index_entries,
+    get_index_url,
+    get_languages,
+    get_soup,
+    get_thumb_url,
+    iter_game_index,
+)
+from .jdownloader_tools import (
+    JDownloaderState,
+    JDownloaderWaiter,
+    LockedJDownloaderDevice,
+)
+from .index_tools import IndexSnapshot, diff_game_dicts, normalise_name
+from .journal_tools import JobJournal, get_journal_key
 from .io_tools import load_yml, save_yml, load_json, save_json
 from .log_utils import NXBrewLogger
+from .mirror_tools import MirrorScoreboard
+from .parse_tools import (
+    PageAnalysis,
+    analyse_page,
+    get_parse_config,
+    get_parse_pool,
+    parse_game_page,
+    submit_parse,
+)
 from .regex_tools import check_has_filetype, get_game_name
+from .trash_tools import TrashWorker, get_trash_worker, wait_for_trash
+from .user_cache_tools import UserCache
 
 __all__ = [
+    "HTML_PARSERS",
+    "INDEX_PARSERS",
     "NXBrewLogger",
+    "JDownloaderState",
+    "JDownloaderWaiter",
+    "GameCatalog",
+    "JobJournal",
+    "LockedJDownloaderDevice",
+    "MirrorScoreboard",
+    "PageAnalysis",
+    "TrashWorker",
+    "UserCache",
+    "HTMLCache",
+    "IndexSnapshot",
+    "get_html_cache",
+    "analyse_page",
+    "crawl_catalog",
+    "diff_game_dicts",
     "discord_push",
     "get_dl_dict",
     "bypass_ouo",
     "bypass_1link",
     "check_github_version",
+    "configure_http",
+    "get_session",
+    "get_cffi_session",
+    "http_get",
+    "http_post",
+    "get_journal_key",
+    "get_trash_worker",
+    "wait_for_trash",
+    "get_html_content",
     "get_html_page",
+    "get_parse_config",
+    "get_parse_pool",
     "get_game_dict",
+    "get_game_entry",
+    "get_index_entries",
+    "get_index_url",
     "check_has_filetype",
     "get_game_name",
     "get_languages",
+    "get_soup",
+    "normalise_name",
     "get_thumb_url",
+    "iter_game_index",
+    "parse_game_page",
+    "submit_parse",
     "load_yml",
     "save_yml",
     "load_json",
@@ -0,0 +1,608 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from .http_tools import http_get
+
+# Keep track of caches by directory, so that everything pointing at the same
+# place shares the same index and lock
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+
+def get_html_cache(cache_config=None):
+    """Get a (shared) HTML cache instance
+
+    Args:
+        cache_config (dict): Dictionary of cache configuration, as
+            in the "html_cache" section of the general config.
+            Defaults to None, which will use the HTMLCache defaults
+    """
+
+    if cache_config is None:
+        cache_config = {}
+
+    cache_dir = cache_config.get("cache_dir", "html_cache")
+    cache_dir = os.path.abspath(cache_dir)
+
+    with CACHES_LOCK:
+        if cache_dir not in CACHES:
+            CACHES[cache_dir] = HTMLCache(
+                cache_dir=cache_dir,
+                ttl=cache_config.get("ttl", 600),
+                stale_while_revalidate=cache_config.get("stale_while_revalidate", 0),
+                max_size_mb=cache_config.get("max_size_mb", 200),
+                compress=cache_config.get("compress", True),
+                flush_interval=cache_config.get("flush_interval", 30),
+            )
+
+    return CACHES[cache_dir]
+
+
+class HTMLCache:
+
+    def __init__(
+        self,
+        cache_dir="html_cache",
+        ttl=600,
+        stale_while_revalidate=0,
+        max_size_mb=200,
+        compress=True,
+        flush_interval=30,
+    ):
+        """On-disk HTTP cache for HTML pages
+
+        Each URL gets its own cache entry, which points to a file named
+        by the hash of its content, so identical pages are only stored
+        once and it's cheap to tell whether a page has actually changed.
+        Entries are fresh for the TTL, after which they are revalidated
+        using ETag/Last-Modified headers, so unchanged pages come back as
+        a cheap 304. Within the stale-while-revalidate window, the stale
+        page is returned straight away and revalidated in the background.
+        Once the cache grows beyond the maximum size, the least recently
+        used entries are evicted. Changes to the index are kept in memory,
+        and written out at most every flush interval, and on exit
+
+        Args:
+            cache_dir (str): Directory to store the cache in. Defaults
+                to "html_cache"
+            ttl (float): Time (in seconds) that an entry is considered
+                fresh for. Defaults to 600
+            stale_while_revalidate (float): Time (in seconds) after the
+                TTL that a stale entry will be served while revalidating
+                in the background. Defaults to 0, which will always
+                revalidate stale entries before returning them
+            max_size_mb (float): Maximum size of the cache, in MB.
+                Defaults to 200
+            compress (bool): If True, will gzip pages on disk. Defaults
+                to True
+            flush_interval (float): Minimum time (in seconds) between
+                writes of the index to disk. Defaults to 30
+        """
+
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_size = max_size_mb * 1024**2
+        self.compress = compress
+        self.flush_interval = flush_interval
+
+        self.index_file = os.path.join(self.cache_dir, "index.json")
+
+        self.lock = threading.Lock()
+        self.revalidating = set()
+
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+        }
+
+        self.index = self.load_index()
+
+        # Keep track of how many URLs point at each file, and the total size
+        # of those files, so we don't have to scan the whole index each time
+        self.file_refs = Counter()
+        self.file_sizes = {}
+        self.total_size = 0
+        for entry in self.index.values():
+            self.add_file_ref(entry["filename"], entry["size"])
+
+        self.dirty = False
+        self.last_saved = time.time()
+
+        atexit.register(self.flush)
+
+    def load_index(self):
+        """Load the cache index, dropping anything that's gone missing on disk"""
+
+        if not os.path.exists(self.index_file):
+            return {}
+
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+        index = {
+            url: entry
+            for url, entry in index.items()
+            if os.path.exists(os.path.join(self.cache_dir, entry["filename"]))
+        }
+
+        return index
+
+    def save_index(self):
+        """Save the cache index, atomically replacing the old one
+
+        This should be called with the lock held
+        """
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+        self.dirty = False
+        self.last_saved = time.time()
+
+    def mark_dirty(self):
+        """Mark the index as changed, saving it if it's been long enough
+
+        This should be called with the lock held
+        """
+
+        self.dirty = True
+
+        if time.time() - self.last_saved >= self.flush_interval:
+            self.save_index()
+
+    def flush(self):
+        """Write the index to disk, if anything's changed"""
+
+        with self.lock:
+            if self.dirty:
+                self.save_index()
+
+        return True
+
+    def get(
+        self,
+        url,
+        allow_stale=True,
+    ):
+        """Get the content for a URL, going to the network only if needed
+
+        Args:
+            url (str): URL to get
+            allow_stale (bool): If True, will serve stale entries within the
+                stale-while-revalidate window. If False, stale entries are
+                always revalidated first. Defaults to True
+        """
+
+        with self.lock:
+            entry = self.index.get(url, None)
+            if entry is not None:
+                entry = dict(entry)
+
+        # If we've got nothing, then download
+        if entry is None:
+            return self.fetch(url)
+
+        content = self.read_entry(entry)
+        if content is None:
+            return self.fetch(url)
+
+        age = time.time() - entry["fetched"]
+
+        # Fresh, so just use that
+        if age <= self.ttl:
+            self.touch(url, stat="hits")
+            return content
+
+        # Stale, but within the window where we'll revalidate in the background
+        if allow_stale and age <= self.ttl + self.stale_while_revalidate:
+            self.touch(url, stat="stale_hits")
+            self.revalidate_in_background(url)
+            return content
+
+        # Otherwise, revalidate now
+        return self.fetch(url)
+
+    def fetch(
+        self,
+        url,
+    ):
+        """Fetch a URL, sending along any validators we have
+
+        Args:
+            url (str): URL to fetch
+        """
+
+        with self.lock:
+            entry = self.index.get(url, None)
+            if entry is not None:
+                entry = dict(entry)
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag", None) is not None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified", None) is not None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = http_get(url, headers=headers)
+
+        # Not modified, so bump the entry and move on
+        if r.status_code == 304 and entry is not None:
+            content = self.read_entry(entry)
+            if content is not None:
+                self.mark_revalidated(url)
+                return content
+
+            # If the file's disappeared from under us, go again without validators
+            r = http_get(url)
+
+        # Don't pass off error pages (e.g. from Cloudflare) as content
+        r.raise_for_status()
+
+        with self.lock:
+            self.stats["misses"] += 1
+
+        # Only cache things that are successful
+        if r.status_code == 200:
+            self.store(
+                url,
+                content=r.content,
+                etag=r.headers.get("ETag", None),
+                last_modified=r.headers.get("Last-Modified", None),
+            )
+
+        return r.content
+
+    def iter_content(
+        self,
+        url,
+        chunk_size=65536,
+    ):
+        """Get the content for a URL in chunks, as it downloads
+
+        Fresh pages come straight from the cache. Otherwise, the page is
+        revalidated, and if it's changed it's streamed in, so callers can
+        start working on it straight away. Once it's all arrived, it's
+        stored in the cache as usual
+
+        Args:
+            url (str): URL to get
+            chunk_size (int): Size of each chunk, in bytes. Defaults
+                to 65536
+        """
+
+        with self.lock:
+            entry = self.index.get(url, None)
+            if entry is not None:
+                entry = dict(entry)
+
+        content = None
+        if entry is not None:
+            content = self.read_entry(entry)
+
+        # Fresh, so just use that
+        if content is not None and time.time() - entry["fetched"] <= self.ttl:
+            self.touch(url, stat="hits")
+            for i in range(0, len(content), chunk_size):
+                yield content[i : i + chunk_size]
+            return
+
+        # Only send validators if we've got something to fall back on
+        headers = {}
+        if content is not None:
+            if entry.get("etag", None) is not None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified", None) is not None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = http_get(url, headers=headers, stream=True)
+
+        try:
+
+            # Not modified, so bump the entry and use what we've got
+            if r.status_code == 304 and content is not None:
+                self.mark_revalidated(url)
+                for i in range(0, len(content), chunk_size):
+                    yield content[i : i + chunk_size]
+                return
+
+            r.raise_for_status()
+
+            with self.lock:
+                self.stats["misses"] += 1
+
+            chunks = []
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                chunks.append(chunk)
+                yield chunk
+
+            # Only cache things that are successful
+            if r.status_code == 200:
+                self.store(
+                    url,
+                    content=b"".join(chunks),
+                    etag=r.headers.get("ETag", None),
+                    last_modified=r.headers.get("Last-Modified", None),
+                )
+
+        finally:
+            r.close()
+
+    def mark_revalidated(
+        self,
+        url,
+    ):
+        """Mark a URL as having been revalidated, and so fresh again
+
+        Args:
+            url (str): URL that's been revalidated
+        """
+
+        with self.lock:
+            self.stats["revalidated"] += 1
+            if url in self.index:
+                self.index[url]["fetched"] = time.time()
+                self.index[url]["accessed"] = time.time()
+                self.mark_dirty()
+
+    def revalidate_in_background(
+        self,
+        url,
+    ):
+        """Revalidate a URL in a background thread
+
+        Args:
+            url (str): URL to revalidate
+        """
+
+        with self.lock:
+            if url in self.revalidating:
+                return
+            self.revalidating.add(url)
+
+        def revalidate():
+            try:
+                self.fetch(url)
+            except requests.exceptions.RequestException:
+                pass
+            finally:
+                with self.lock:
+                    self.revalidating.discard(url)
+
+        thread = threading.Thread(target=revalidate, daemon=True)
+        thread.start()
+
+    def store(
+        self,
+        url,
+        content,
+        etag=None,
+        last_modified=None,
+    ):
+        """Store content for a URL, evicting old entries if needed
+
+        Args:
+            url (str): URL of the content
+            content (bytes): Content to store
+            etag (str): ETag header. Defaults to None
+            last_modified (str): Last-Modified header. Defaults to None
+        """
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        filename = f"{content_hash}.html"
+        if self.compress:
+            filename += ".gz"
+
+        with self.lock:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+
+            # Only write if we don't already have this exact content. Write to a
+            # temporary file first, so readers never see half a page
+            full_filename = os.path.join(self.cache_dir, filename)
+            if not os.path.exists(full_filename):
+                if self.compress:
+                    data = gzip.compress(content)
+                else:
+                    data = content
+
+                tmp_filename = f"{full_filename}.tmp"
+                with open(tmp_filename, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_filename, full_filename)
+
+            old_entry = self.index.get(url, None)
+
+            now = time.time()
+            self.index[url] = {
+                "filename": filename,
+                "content_hash": content_hash,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched": now,
+                "accessed": now,
+                "size": os.path.getsize(full_filename),
+            }
+            self.add_file_ref(filename, self.index[url]["size"])
+
+            # If the page has changed, we might be able to get rid of the old file
+            if old_entry is not None:
+                self.remove_file_ref(old_entry["filename"])
+
+            self.evict()
+            self.mark_dirty()
+
+    def evict(self):
+        """Evict least recently used entries until we're under the maximum size"""
+
+        if self.total_size <= self.max_size:
+            return
+
+        urls = sorted(self.index, key=lambda u: self.index[u]["accessed"])
+
+        for url in urls:
+            if self.total_size <= self.max_size:
+                break
+
+            # Always keep the newest entry, even if it's huge
+            if len(self.index) == 1:
+                break
+
+            entry = self.index.pop(url)
+            self.remove_file_ref(entry["filename"])
+
+    def add_file_ref(
+        self,
+        filename,
+        size,
+    ):
+        """Note that a URL points at a cached file
+
+        Args:
+            filename (str): Filename within the cache directory
+            size (int): Size of the file, in bytes
+        """
+
+        # Files can be shared between URLs, so only count the size once
+        if self.file_refs[filename] == 0:
+            self.file_sizes[filename] = size
+            self.total_size += size
+
+        self.file_refs[filename] += 1
+
+    def remove_file_ref(
+        self,
+        filename,
+    ):
+        """Note that a URL no longer points at a cached file
+
+        If no other URLs point to it, the file is removed. Returns True
+        if the file was removed, False otherwise
+
+        Args:
+            filename (str): Filename within the cache directory
+        """
+
+        self.file_refs[filename] -= 1
+        if self.file_refs[filename] > 0:
+            return False
+
+        self.file_refs.pop(filename)
+        self.total_size -= self.file_sizes.pop(filename, 0)
+
+        full_filename = os.path.join(self.cache_dir, filename)
+        if os.path.exists(full_filename):
+            os.remove(full_filename)
+
+        return True
+
+    def is_fresh(
+        self,
+        url,
+    ):
+        """Check whether a URL is cached and still within its TTL
+
+        Args:
+            url (str): URL to check
+        """
+
+        with self.lock:
+            entry = self.index.get(url, None)
+
+        if entry is None:
+            return False
+
+        return time.time() - entry["fetched"] <= self.ttl
+
+    def get_content_hash(
+        self,
+        url,
+    ):
+        """Get the content hash for a cached URL. Returns None if not cached
+
+        Args:
+            url (str): URL to get the content hash for
+        """
+
+        with self.lock:
+            entry = self.index.get(url, {})
+
+        return entry.get("content_hash", None)
+
+    def get_stats(self):
+        """Get cache statistics
+
+        Returns a dictionary of hits (fresh pages served from the cache),
+        stale hits (stale pages served while revalidating), revalidated
+        (pages that were checked and hadn't changed), and misses (pages
+        that were downloaded in full), along with the number of entries
+        and total size on disk
+        """
+
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.index)
+            stats["size_mb"] = self.total_size / 1024**2
+
+        return stats
+
+    def touch(
+        self,
+        url,
+        stat=None,
+    ):
+        """Update the last accessed time for a URL
+
+        Args:
+            url (str): URL to update
+            stat (str): If set, will increment this statistic. Defaults
+                to None
+        """
+
+        with self.lock:
+            if stat is not None:
+                self.stats[stat] += 1
+            if url in self.index:
+                self.index[url]["accessed"] = time.time()
+                self.mark_dirty()
+
+    def read_entry(
+        self,
+        entry,
+    ):
+        """Read the content for a cache entry. Returns None if it's missing
+
+        Args:
+            entry (dict): Cache entry
+        """
+
+        full_filename = os.path.join(self.cache_dir, entry["filename"])
+
+        try:
+            with open(full_filename, "rb") as f:
+                content = f.read()
+            if entry["filename"].endswith(".gz"):
+                content = gzip.decompress(content)
+        except (OSError, EOFError):
+            return None
+
+        return content
@@ -0,0 +1,440 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from .cache_tools import get_html_cache
+from .html_tools import get_game_dict
+from .parse_tools import get_parse_config, get_parse_pool, submit_parse
+from .user_cache_tools import Transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    url_path TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    short_name TEXT NOT NULL,
+    long_name TEXT NOT NULL,
+    content_hash TEXT,
+    crawled REAL,
+    thumb_url TEXT,
+    languages TEXT,
+    regions TEXT,
+    dl_sites TEXT,
+    dl_dict TEXT,
+    error TEXT
+);
+"""
+
+# Columns that are stored as JSON
+JSON_COLUMNS = ["languages", "regions", "dl_sites", "dl_dict"]
+
+
+def get_mirror_coverage(
+    dl_dict,
+    dl_sites,
+):
+    """Count how many downloadable items each download site has links for
+
+    Args:
+        dl_dict (dict): Download dictionary, from get_dl_dict
+        dl_sites (list): List of download sites
+    """
+
+    coverage = {}
+
+    for release in dl_dict.values():
+        for dl_key, items in release.items():
+            if dl_key in ["regions", "languages"]:
+                continue
+            for item in items:
+                for site in dl_sites:
+                    if len(item.get(site, [])) > 0:
+                        coverage[site] = coverage.get(site, 0) + 1
+
+    return coverage
+
+
+class HostRateLimiter:
+
+    def __init__(
+        self,
+        rate_limit=1.0,
+    ):
+        """Thread-safe limit on how often we hit each host
+
+        Args:
+            rate_limit (float): Maximum requests per second, per host.
+                Defaults to 1. Set to 0 or None to turn off
+        """
+
+        self.min_interval = 0
+        if rate_limit:
+            self.min_interval = 1 / rate_limit
+
+        self.lock = threading.Lock()
+        self.next_time = {}
+
+    def wait(
+        self,
+        url,
+    ):
+        """Block until we're allowed to make a request to this URL's host
+
+        Args:
+            url (str): URL we're about to request
+        """
+
+        host = urlparse(url).netloc
+
+        # Reserve the next slot, then sleep outside the lock
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_time.get(host, now))
+            self.next_time[host] = slot + self.min_interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+        return True
+
+
+class GameCatalog:
+
+    def __init__(
+        self,
+        filename="catalog.db",
+        timeout=30,
+    ):
+        """Local SQLite database of every game on NXBrew
+
+        For each game, stores the parsed releases (regions, languages,
+        download links), along with a per-site count of how many items
+        have links, so we can plan without hitting the site. Games are
+        keyed by URL path, so a domain change doesn't mean starting over,
+        and each entry keeps the hash of the page it was parsed from so
+        unchanged pages can be skipped
+
+        Args:
+            filename (str): Database file. Defaults to "catalog.db"
+            timeout (float): Time (in seconds) to wait for other processes
+                to finish writing. Defaults to 30
+        """
+
+        self.filename = filename
+        self.timeout = timeout
+
+        self.local = threading.local()
+
+        conn = self.get_connection()
+        conn.executescript(SCHEMA)
+
+    def get_connection(self):
+        """Get a database connection for the current thread"""
+
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            conn = sqlite3.connect(
+                self.filename,
+                timeout=self.timeout,
+                isolation_level=None,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+
+        return conn
+
+    def get_content_hashes(self):
+        """Get a dictionary of URL path to the hash of the page we last parsed
+
+        Pages that failed to parse aren't included, so they'll be retried
+        """
+
+        rows = self.get_connection().execute(
+            "SELECT url_path, content_hash FROM games WHERE error IS NULL"
+        )
+
+        return {url_path: content_hash for url_path, content_hash in rows}
+
+    def upsert(
+        self,
+        game,
+        content_hash,
+        page_info=None,
+        error=None,
+        dl_sites=None,
+    ):
+        """Add or update a game in the catalog
+
+        Args:
+            game (dict): Game dictionary, from get_game_dict
+            content_hash (str): Hash of the page content
+            page_info (dict): Parsed page, from parse_game_page. Defaults
+                to None, e.g. if parsing failed
+            error (str): Error message, if parsing failed. Defaults to None
+            dl_sites (list): List of download sites, for the mirror
+                coverage. Defaults to None, which will use an empty list
+        """
+
+        if page_info is None:
+            page_info = {}
+        if dl_sites is None:
+            dl_sites = []
+
+        dl_dict = page_info.get("dl_dict", None)
+
+        regions = None
+        dl_site_coverage = None
+        if dl_dict is not None:
+            regions = []
+            for release in dl_dict.values():
+                for region in release["regions"]:
+                    if region not in regions:
+                        regions.append(region)
+            dl_site_coverage = get_mirror_coverage(dl_dict, dl_sites=dl_sites)
+
+        values = {
+            "url_path": urlparse(game["url"]).path,
+            "url": game["url"],
+            "short_name": game["short_name"],
+            "long_name": game["long_name"],
+            "content_hash": content_hash,
+            "crawled": time.time(),
+            "thumb_url": page_info.get("thumb_url", None),
+            "languages": page_info.get("languages", None),
+            "regions": regions,
+            "dl_sites": dl_site_coverage,
+            "dl_dict": dl_dict,
+            "error": error,
+        }
+        for key in JSON_COLUMNS:
+            if values[key] is not None:
+                values[key] = json.dumps(values[key])
+
+        columns = list(values.keys())
+        updates = ", ".join([f"{c} = excluded.{c}" for c in columns[1:]])
+
+        with Transaction(self.get_connection()) as conn:
+            conn.execute(
+                f"INSERT INTO games ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['?'] * len(columns))}) "
+                f"ON CONFLICT (url_path) DO UPDATE SET {updates}",
+                [values[c] for c in columns],
+            )
+
+        return True
+
+    def touch(
+        self,
+        game,
+    ):
+        """Mark a game as checked, keeping the URL and names up to date
+
+        Args:
+            game (dict): Game dictionary, from get_game_dict
+        """
+
+        with Transaction(self.get_connection()) as conn:
+            conn.execute(
+                "UPDATE games SET url = ?, short_name = ?, long_name = ?, crawled = ? "
+                "WHERE url_path = ?",
+                (
+                    game["url"],
+                    game["short_name"],
+                    game["long_name"],
+                    time.time(),
+                    urlparse(game["url"]).path,
+                ),
+            )
+
+        return True
+
+    def remove_missing(
+        self,
+        url_paths,
+    ):
+        """Remove any games that aren't in a list of URL paths
+
+        Returns the number of games removed
+
+        Args:
+            url_paths (list): URL paths to keep
+        """
+
+        url_paths = set(url_paths)
+
+        with Transaction(self.get_connection()) as conn:
+            rows = conn.execute("SELECT url_path FROM games").fetchall()
+            to_remove = [(row[0],) for row in rows if row[0] not in url_paths]
+            conn.executemany("DELETE FROM games WHERE url_path = ?", to_remove)
+
+        return len(to_remove)
+
+    def get_entries(self):
+        """Get every game in the catalog, as a dictionary keyed by URL"""
+
+        conn = self.get_connection()
+        cur = conn.execute("SELECT * FROM games ORDER BY short_name")
+        columns = [c[0] for c in cur.description]
+
+        entries = {}
+        for row in cur:
+            entry = dict(zip(columns, row))
+            for key in JSON_COLUMNS:
+                if entry[key] is not None:
+                    entry[key] = json.loads(entry[key])
+            entries[entry["url"]] = entry
+
+        return entries
+
+    def __len__(self):
+        """Get the number of games in the catalog"""
+
+        return self.get_connection().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+
+def crawl_catalog(
+    general_config,
+    regex_config,
+    nxbrew_url,
+    catalog,
+    max_workers=4,
+    rate_limit=1.0,
+    parse_processes=None,
+    force=False,
+    logger=None,
+):
+    """Crawl every game page on NXBrew into the catalog
+
+    Pages are fetched through the HTML cache by a bounded pool of
+    threads, with a per-host rate limit on anything that needs to go to
+    the network. Each page is hashed, and only parsed if it's changed
+    since the last crawl. Parsing is farmed out to a pool of processes,
+    so it isn't held up by the GIL. Results are written as we go, so an
+    interrupted crawl can just be started again. Returns a dictionary of
+    how many pages were parsed, unchanged, and failed
+
+    Args:
+        general_config (dict): General configuration
+        regex_config (dict): Regex configuration
+        nxbrew_url (str): NXBrew URL
+        catalog (GameCatalog): Catalog to write to
+        max_workers (int): Maximum number of pages to fetch at once.
+            Defaults to 4
+        rate_limit (float): Maximum requests per second to each host.
+            Defaults to 1
+        parse_processes (int): Number of processes to parse pages with.
+            Defaults to None, which will use one per CPU. If 0, will
+            parse in this process
+        force (bool): If True, will re-parse every page, even if it
+            hasn't changed. Defaults to False
+        logger (logging.Logger): Logger instance. Defaults to None
+    """
+
+    html_cache = get_html_cache(general_config.get("html_cache", None))
+    rate_limiter = HostRateLimiter(rate_limit)
+
+    game_dict = get_game_dict(
+        general_config=general_config,
+        regex_config=regex_config,
+        nxbrew_url=nxbrew_url,
+    )
+
+    n_removed = catalog.remove_missing([urlparse(url).path for url in game_dict])
+    content_hashes = catalog.get_content_hashes()
+
+    if logger is not None:
+        logger.info(
+            f"Crawling {len(game_dict)} games ({n_removed} removed from the catalog)"
+        )
+
+    def fetch(url):
+        if html_cache.is_fresh(url):
+            return html_cache.get(url)
+
+        # Otherwise, revalidate now rather than using a stale page. Only
+        # this counts against the rate limit
+        rate_limiter.wait(url)
+        return html_cache.fetch(url)
+
+    parse_config = get_parse_config(general_config)
+    parse_pool = get_parse_pool(parse_processes)
+
+    stats = {
+        "parsed": 0,
+        "unchanged": 0,
+        "failed": 0,
+    }
+    n_done = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        # Keep track of what each future is for, and whether it's a fetch
+        # or a parse, so we can deal with them in whatever order they finish
+        pending = {
+            executor.submit(fetch, url): ("fetch", game_dict[url], None)
+            for url in game_dict
+        }
+
+        while len(pending) > 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                stage, game, content_hash = pending.pop(future)
+
+                if stage == "fetch":
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        stats["failed"] += 1
+                        n_done += 1
+                        if logger is not None:
+                            logger.warning(f"Could not fetch {game['url']}: {e}")
+                        continue
+
+                    content_hash = hashlib.sha256(content).hexdigest()
+                    old_content_hash = content_hashes.get(
+                        urlparse(game["url"]).path, None
+                    )
+
+                    if not force and old_content_hash == content_hash:
+                        catalog.touch(game)
+                        stats["unchanged"] += 1
+                        n_done += 1
+                    else:
+                        parse_future = submit_parse(
+                            parse_pool,
+                            content,
+                            parse_config=parse_config,
+                        )
+                        pending[parse_future] = ("parse", game, content_hash)
+                        continue
+
+                else:
+                    try:
+                        catalog.upsert(
+                            game,
+                            content_hash=content_hash,
+                            page_info=future.result(),
+                            dl_sites=parse_config["dl_sites"],
+                        )
+                        stats["parsed"] += 1
+                    except Exception as e:
+                        catalog.upsert(game, content_hash=content_hash, error=str(e))
+                        stats["failed"] += 1
+                    n_done += 1
+
+                if logger is not None and (
+                    n_done % 100 == 0 or n_done == len(game_dict)
+                ):
+                    logger.info(
+                        f"Crawled {n_done}/{len(game_dict)} games "
+                        f"({stats['parsed']} parsed, {stats['unchanged']} unchanged, "
+                        f"{stats['failed']} failed)"
+                    )
+
+    return stats
@@ -1,4 +1,6 @@
-from discordwebhook import Discord
+import json
+
+from .http_tools import http_post
 
 
 def discord_push(
@@ -12,9 +14,15 @@ def discord_push(
         embeds (list): List of dictionaries of embeds
     """
 
-    discord = Discord(url=url)
-    discord.post(
-        embeds=embeds,
+    data = {
+        "tts": False,
+        "embeds": embeds,
+    }
+
+    http_post(
+        url,
+        data=json.dumps(data),
+        headers={"Content-Type": "application/json"},
     )
 
     return True
@@ -2,14 +2,23 @@ import copy
 import random
 import re
 import time
+from collections import namedtuple
 from urllib.parse import urlparse
 
-import requests
-from bs4 import BeautifulSoup
-from curl_cffi import requests as cffi_requests
+from bs4 import BeautifulSoup, Tag
 
+from .http_tools import get_cffi_session, http_get, http_post
 from .regex_tools import parse_languages
 
+BYPASS_HEADERS = {
+    "authority": "ouo.io",
+    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
+    "cache-control": "max-age=0",
+    "referer": "http://www.google.com/ig/adde?moduleurl=",
+    "upgrade-insecure-requests": "1",
+}
+
 ANCHOR_URL = (
     "https://www.google.com/recaptcha/api2/anchor?"
     "ar=1&k=6Lcr1ncUAAAAAH3cghg6cOTPGARa8adOf-y9zv2x&"
@@ -20,6 +29,81 @@ ANCHOR_URL = (
     "cb=ahgyd1gkfkhe"
 )
 
+# A paragraph from the download section of a page. The name is the text
+# before any brackets, and links are (text, href) tuples
+Paragraph = namedtuple("Paragraph", ["text", "name", "links"])
+EMPTY_PARAGRAPH = Paragraph(text="", name="", links=[])
+
+
+def get_download_paragraphs(soup):
+    """Flatten the download section of a page into a list of paragraphs
+
+    Finds the "Download Links" heading, and then pulls out the text and
+    links of every paragraph after it, in order, so the page only needs
+    to be walked once
+
+    Args:
+        soup (bs4.BeautifulSoup): soup object to parse
+    """
+
+    found_tag = None
+    for s in soup.find_all("strong"):
+        if "download links" in s.text.lower():
+            found_tag = s
+            break
+
+    if found_tag is None:
+        raise ValueError("No download links found")
+
+    # Walk the elements directly, rather than going through the much
+    # slower find_all machinery for every paragraph
+    paragraphs = []
+    for tag in found_tag.next_elements:
+        if isinstance(tag, Tag) and tag.name == "p":
+            paragraphs.append(get_paragraph_from_tag(tag))
+
+    return paragraphs
+
+
+def get_paragraph_from_tag(tag):
+    """Pull the text, name and links out of a paragraph tag
+
+    Args:
+        tag (bs4.Tag): Paragraph tag
+    """
+
+    text = tag.text
+    links = [
+        (h.text, h["href"])
+        for h in tag.descendants
+        if isinstance(h, Tag) and h.name == "a" and h.get("href") is not None
+    ]
+
+    paragraph = Paragraph(
+        text=text,
+        name=text.split("(")[0],
+        links=links,
+    )
+
+    return paragraph
+
+
+def get_paragraph(
+    paragraphs,
+    i,
+):
+    """Get a paragraph by index, or an empty one if we've run off the end
+
+    Args:
+        paragraphs (list): List of paragraphs, from get_download_paragraphs
+        i (int): Index of the paragraph
+    """
+
+    if i < len(paragraphs):
+        return paragraphs[i]
+
+    return EMPTY_PARAGRAPH
+
 
 def get_dl_dict(
     soup,
@@ -34,7 +118,9 @@ def get_dl_dict(
 
     Will look through the page to find various links
     (base game, DLC, updates) per download site and
-    add them to a dictionary
+    add them to a dictionary. The download section is flattened
+    into a list of paragraphs once, and then parsed in a single
+    pass over that list
 
     Args:
         soup (bs4.BeautifulSoup): soup object to parse
@@ -51,6 +137,47 @@ def get_dl_dict(
             an empty dict
     """
 
+    paragraphs = get_download_paragraphs(soup)
+
+    dl_dict = parse_download_paragraphs(
+        paragraphs,
+        dl_sites=dl_sites,
+        dl_mappings=dl_mappings,
+        regions=regions,
+        languages=languages,
+        regionless_titles=regionless_titles,
+        implied_languages=implied_languages,
+    )
+
+    return dl_dict
+
+
+def parse_download_paragraphs(
+    paragraphs,
+    dl_sites,
+    dl_mappings,
+    regions=None,
+    languages=None,
+    regionless_titles=None,
+    implied_languages=None,
+):
+    """Parse download links out of the paragraphs of a download section
+
+    Args:
+        paragraphs (list): List of paragraphs, from get_download_paragraphs
+        dl_sites (list): List of download sites in preference order
+        dl_mappings (dict): Dictionary of mappings for download types
+        regions (list): list of regions potentially parse. Defaults
+            to None, which will use an empty list
+        languages (dict): list of languages potentially parse. Defaults
+            to None, which will use an empty dict
+        regionless_titles (list): list of titles that have no region info.
+            Defaults to None, which will use an empty list
+        implied_languages (dict): Dictionary of mappings from regions
+            to implied languages. Defaults to None, which will use
+            an empty dict
+    """
+
     if regions is None:
         regions = []
 
@@ -62,38 +189,26 @@ def get_dl_dict(
 
     dl_dict = {}
 
-    # Find the strong tags, then start hunting
-
-    strong_tag = soup.findAll("strong")
-
-    # Find the tag
-    found_tag = None
-    for s in strong_tag:
-        if "download links" in s.text.lower():
-            found_tag = s
-            break
-
-    if found_tag is None:
-        raise ValueError("No download links found")
+    # If a release doesn't have any of these, then we're done
+    dl_keys = []
+    for dl_mapping in dl_mappings:
+        dl_keys.extend(list(dl_mappings[dl_mapping]["dl_tags"].keys()))
 
-    tag = found_tag.find_next("p")
-
-    # Keep looping over to keep finding regions
-    still_hunting = True
+    i = 0
     release_number = 1
 
-    while still_hunting:
+    # Keep looping over to keep finding regions
+    while True:
 
-        current_release = f"release_{release_number}"
-        dl_dict[current_release] = {}
+        paragraph = get_paragraph(paragraphs, i)
 
         # We may find a region here, so change the current region and then start looping over tags
-        parsed_regions = parse_regions(tag, regions)
+        parsed_regions = parse_regions(paragraph, regions)
 
         if len(parsed_regions) > 0:
 
             # Parse out languages
-            parsed_languages = parse_language_tag(tag, languages)
+            parsed_languages = parse_language_tag(paragraph, languages)
 
             # If we haven't found anything, use implied languages
             if len(parsed_languages) == 0:
@@ -105,117 +220,100 @@ def get_dl_dict(
             if len(parsed_languages) == 0:
                 parsed_languages = ["All"]
 
-            tag = tag.find_next("p")
+            i += 1
 
         # Alternatively, we might find something that looks like a region title,
         # but doesn't contain any useful info
 
-        elif any([n in tag.text for n in regionless_titles]):
+        elif any([n in paragraph.text for n in regionless_titles]):
 
             parsed_regions = ["All"]
             parsed_languages = ["All"]
-            tag = tag.find_next("p")
+            i += 1
 
         else:
             parsed_regions = ["All"]
             parsed_languages = ["All"]
 
-        dl_dict[current_release]["regions"] = parsed_regions
-        dl_dict[current_release]["languages"] = parsed_languages
+        release = {
+            "regions": parsed_regions,
+            "languages": parsed_languages,
+        }
 
         # We are within a region now, so search for "Base Game/Update/DLC" here.
         # Keep looping until we don't find anything. Keep things in list form
         # so that we can potentially have multiples within each region
-        still_hunting_dl = True
+        found_anything_dl = True
 
-        while still_hunting_dl:
+        while found_anything_dl:
             found_anything_dl = False
 
             for dl_mapping in dl_mappings:
 
-                tag_no_brackets = tag.text.split("(")[0]
-
+                paragraph = get_paragraph(paragraphs, i)
                 tag_names = dl_mappings[dl_mapping]["tag_names"]
 
-                if any([n in tag_no_brackets for n in tag_names]):
-
-                    if dl_mapping in ["Base Game", "DLC", "Update"]:
-                        tag, parsed_dict = parse_dl_tags(
-                            tag,
-                            dict_key=dl_mapping.lower(),
-                            dl_sites=dl_sites,
-                            dl_mappings=dl_mappings,
-                        )
-                    else:
-                        raise ValueError(
-                            f"Name should contain one of: {', '.join(dl_mappings.keys())}. Got {tag.text}"
-                        )
+                if not any([n in paragraph.name for n in tag_names]):
+                    continue
 
-                    # If we don't have an empty dictionary, add things in now
-                    if len(parsed_dict) > 0:
+                if dl_mapping not in ["Base Game", "DLC", "Update"]:
+                    raise ValueError(
+                        f"Name should contain one of: {', '.join(dl_mappings.keys())}. Got {paragraph.text}"
+                    )
 
-                        # Get out the key, and append to the full dictionary
-                        parsed_keys = list(parsed_dict.keys())
-
-                        for parsed_key in parsed_keys:
-                            if parsed_key not in dl_dict[current_release]:
-                                dl_dict[current_release][parsed_key] = []
-
-                            # Strip any extraneous whitespace
-                            parsed_dict[parsed_key]["full_name"] = parsed_dict[
-                                parsed_key
-                            ]["full_name"].strip()
-
-                            dl_dict[current_release][parsed_key].append(
-                                parsed_dict[parsed_key]
-                            )
-
-                    found_anything_dl = True
+                i, parsed_dict = parse_dl_tags(
+                    paragraphs,
+                    i,
+                    dict_key=dl_mapping.lower(),
+                    dl_sites=dl_sites,
+                    dl_mappings=dl_mappings,
+                )
 
-            # If we haven't found anything, jump out here
-            if not found_anything_dl:
-                still_hunting_dl = False
+                # Add in anything we've found, stripping any extraneous whitespace
+                for parsed_key in parsed_dict:
+                    parsed_dict[parsed_key]["full_name"] = parsed_dict[parsed_key][
+                        "full_name"
+                    ].strip()
+                    release.setdefault(parsed_key, []).append(parsed_dict[parsed_key])
 
-        # If we don't have anything useful in here, delete the release and leave
-        dl_keys = []
-        for dl_mapping in dl_mappings:
-            dl_keys.extend(list(dl_mappings[dl_mapping]["dl_tags"].keys()))
+                found_anything_dl = True
 
-        if not any([n in dl_dict[current_release] for n in dl_keys]):
-            del dl_dict[current_release]
-            still_hunting = False
+        # If we don't have anything useful in here, leave
+        if not any([n in release for n in dl_keys]):
+            break
 
+        dl_dict[f"release_{release_number}"] = release
         release_number += 1
 
     return dl_dict
 
 
-def parse_regions(tag, regions):
-    """Parse regions from tag
+def parse_regions(paragraph, regions):
+    """Parse regions from a download paragraph
 
     Args:
-        tag (bs4.Tag): tag object to parse
+        paragraph (Paragraph): paragraph to parse
         regions (list): list of regions potentially parse
     """
     parsed_regions = []
 
     for region in regions:
-        if region.lower() in tag.text.lower():
+        if region.lower() in paragraph.text.lower():
             parsed_regions.append(region)
 
     return parsed_regions
 
 
-def parse_language_tag(tag, languages=None):
-    """From a soup tag, find things in square brackets and parse as potential languages
+def parse_language_tag(paragraph, languages=None):
+    """Find things in square brackets in a download paragraph, and parse as languages
 
     Args:
-        tag (bs4.Tag): tag object to parse
+        paragraph (Paragraph): paragraph to parse
         languages (dict): Dictionary of languages potentially parse
     """
 
     # Figure out if we have anything here. It should be between square brackets
-    t = tag.text
+    t = paragraph.text
 
     reg = re.findall(r"\[(.*?)\]", t)
 
@@ -233,7 +331,8 @@ def parse_language_tag(tag, languages=None):
 
 
 def parse_dl_tags(
-    tag,
+    paragraphs,
+    i,
     dict_key,
     dl_sites,
     dl_mappings,
@@ -241,10 +340,12 @@ def parse_dl_tags(
     """Parse out links for games, updates, and DLC
 
     These can either be spread out over paragraphs or inline,
-    so we distinguish between those cases here
+    so we distinguish between those cases here. Returns the index
+    of the next paragraph after the links, and the parsed links
 
     Args:
-        tag (bs4.Tag): starting tag object
+        paragraphs (list): List of paragraphs, from get_download_paragraphs
+        i (int): Index of the paragraph with the name in
         dict_key (str): key to distinguish different file types
         dl_sites (list): list of DL sites to look for in links
         dl_mappings (dict): Dictionary of names to map to download types
@@ -252,7 +353,7 @@ def parse_dl_tags(
 
     link_dict = {}
 
-    t = tag.text
+    t = get_paragraph(paragraphs, i).text
 
     # Start by distinguishing whether we're a base game or something else
     if dict_key == "base game":
@@ -273,89 +374,70 @@ def parse_dl_tags(
     link_dict[link_dict_key]["full_name"] = t
 
     # Loop until we're no longer finding links
-    finding_links = True
-    while finding_links:
-        found_site = False
-        tag = tag.find_next("p")
-        t = tag.text
+    while True:
+        i += 1
+        paragraph = get_paragraph(paragraphs, i)
 
         site = None
-        for site in dl_sites:
-            if site in t:
-                link_dict[link_dict_key][site] = []
-                found_site = True
+        for dl_site in dl_sites:
+            if dl_site in paragraph.text:
+                site = dl_site
                 break
 
-        if found_site:
-            # Find all the hrefs
-            href = tag.find_all("a", href=True)
-
-            # There can be inline tags, where the link is the download site name
-            found_inline = False
-
-            for h in href:
-                ht = h.text
-
-                for inline_site in dl_sites:
-                    if inline_site in ht:
-
-                        if inline_site not in link_dict[link_dict_key]:
-                            link_dict[link_dict_key][inline_site] = []
-
-                        link_dict[link_dict_key][inline_site].append(h["href"])
+        if site is None:
+            break
 
-                        found_inline = True
-                        break
+        link_dict[link_dict_key][site] = []
 
-            # Otherwise, parse out the text and go from there
-            if not found_inline:
+        # There can be inline tags, where the link is the download site name
+        found_inline = False
 
-                for h in href:
-                    ht = h.text
+        for ht, href in paragraph.links:
+            for inline_site in dl_sites:
+                if inline_site in ht:
+                    link_dict[link_dict_key].setdefault(inline_site, []).append(href)
+                    found_inline = True
+                    break
 
-                    # If there's some weird phantom link, skip
-                    if ht == "":
-                        continue
+        if found_inline:
+            continue
 
-                    # There's an edge case here where the "base game" can actually have everything in there
-                    found_all_in_one = False
+        # Otherwise, parse out the text and go from there
+        for ht, href in paragraph.links:
 
-                    for dl_mapping in dl_mappings:
+            # If there's some weird phantom link, skip
+            if ht == "":
+                continue
 
-                        tag_names = dl_mappings[dl_mapping]["tag_names"]
+            # There's an edge case here where the "base game" can actually have
+            # everything in there. Each line of these starts the entry afresh
+            found_all_in_one = False
 
-                        if any([n in ht for n in tag_names]):
+            for dl_mapping in dl_mappings:
 
-                            if dl_mapping not in link_dict:
-                                link_dict[dl_mapping.lower()] = {}
-                                link_dict[dl_mapping.lower()]["full_name"] = ht
-                                link_dict[dl_mapping.lower()][site] = []
-                            link_dict[dl_mapping.lower()][site].append(h["href"])
+                tag_names = dl_mappings[dl_mapping]["tag_names"]
 
-                            found_all_in_one = True
-                            break
+                if any([n in ht for n in tag_names]):
+                    link_dict[dl_mapping.lower()] = {
+                        "full_name": ht,
+                        site: [href],
+                    }
+                    found_all_in_one = True
+                    break
 
-                    # If we just have a link, put that in now
-                    if not found_all_in_one:
-                        link_dict[link_dict_key][site].append(h["href"])
+            # If we just have a link, put that in now
+            if not found_all_in_one:
+                link_dict[link_dict_key][site].append(href)
 
-        else:
-            finding_links = False
-
-    # Finally, hunt through to the next tag WITHOUT a link in
-    found_links = True
-    while found_links:
-        links = tag.find_all("a", href=True)
-        if len(links) == 0:
-            found_links = False
-        else:
-            tag = tag.find_next("p", href=False)
+    # Finally, hunt through to the next paragraph WITHOUT a link in
+    while len(get_paragraph(paragraphs, i).links) > 0:
+        i += 1
 
     # If we only have a name in here, then clear out the dictionary and leave
     if len(link_dict[link_dict_key]) == 1:
         link_dict = {}
 
-    return tag, link_dict
+    return i, link_dict
 
 
 def RecaptchaV3():
@@ -363,16 +445,17 @@ def RecaptchaV3():
 
     url_base = "https://www.google.com/recaptcha/"
     post_data = "v={}&reason=q&c={}&k={}&co={}"
-    client = requests.Session()
-    client.headers.update({"content-type": "application/x-www-form-urlencoded"})
+    h = {"content-type": "application/x-www-form-urlencoded"}
     matches = re.findall(r"([api2|enterprise]+)/anchor\?(.*)", ANCHOR_URL)[0]
     url_base += matches[0] + "/"
     params = matches[1]
-    res = client.get(url_base + "anchor", params=params)
+    res = http_get(url_base + "anchor", params=params, headers=h)
     token = re.findall(r'"recaptcha-token" value="(.*?)"', res.text)[0]
     params = dict(pair.split("=") for pair in params.split("&"))
     post_data = post_data.format(params["v"], token, params["k"], params["co"])
-    res = client.post(url_base + "reload", params=f'k={params["k"]}', data=post_data)
+    res = http_post(
+        url_base + "reload", params=f'k={params["k"]}', data=post_data, headers=h
+    )
     answer = re.findall(r'"rresp","(.*?)"', res.text)[0]
     return answer
 
@@ -402,22 +485,14 @@ def bypass_ouo(
     if impersonate is None:
         impersonate = random.choice(["chrome", "safari", "edge"])
 
-    client = cffi_requests.Session()
-    client.headers.update(
-        {
-            "authority": "ouo.io",
-            "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-            "cache-control": "max-age=0",
-            "referer": "http://www.google.com/ig/adde?moduleurl=",
-            "upgrade-insecure-requests": "1",
-        }
-    )
+    # Reuse the pooled connection, but start each bypass with fresh cookies
+    client = get_cffi_session()
+    client.cookies.clear()
 
     tempurl = url.replace("ouo.press", "ouo.io")
     p = urlparse(tempurl)
     temp_url_id = tempurl.split("/")[-1]
-    res = client.get(tempurl, impersonate=impersonate)
+    res = client.get(tempurl, headers=BYPASS_HEADERS, impersonate=impersonate)
 
     # If we get a weird response, try again
     status_code = res.status_code
@@ -457,9 +532,9 @@ def bypass_ouo(
         if inputs is None:
 
             if logger is not None:
-                logger.warning(f"Page load error. Waiting then retrying")
+                logger.warning("Page load error. Waiting then retrying")
             else:
-                print(f"Page load error. Waiting then retrying")
+                print("Page load error. Waiting then retrying")
 
             time.sleep(10)
             bypassed_url = bypass_ouo(
@@ -473,7 +548,7 @@ def bypass_ouo(
         data = {i.get("name"): i.get("value") for i in inputs}
         data["x-token"] = RecaptchaV3()
 
-        h = {"content-type": "application/x-www-form-urlencoded"}
+        h = {**BYPASS_HEADERS, "content-type": "application/x-www-form-urlencoded"}
 
         # Catch any rejections
         res = client.post(
@@ -532,19 +607,11 @@ def bypass_1link(
     if impersonate is None:
         impersonate = random.choice(["chrome", "safari", "edge"])
 
-    client = cffi_requests.Session()
-    client.headers.update(
-        {
-            "authority": "ouo.io",
-            "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-            "cache-control": "max-age=0",
-            "referer": "http://www.google.com/ig/adde?moduleurl=",
-            "upgrade-insecure-requests": "1",
-        }
-    )
+    # Reuse the pooled connection, but start each bypass with fresh cookies
+    client = get_cffi_session()
+    client.cookies.clear()
 
-    res = client.get(url, impersonate=impersonate)
+    res = client.get(url, headers=BYPASS_HEADERS, impersonate=impersonate)
 
     # If we get a weird response, try again
     status_code = res.status_code
@@ -582,7 +649,12 @@ def bypass_1link(
     else:
 
         # Get that next URL, disallowing redirects
-        res = client.get(next_url, impersonate=impersonate, allow_redirects=False)
+        res = client.get(
+            next_url,
+            headers=BYPASS_HEADERS,
+            impersonate=impersonate,
+            allow_redirects=False,
+        )
 
         # If we get a weird response, try again
         status_code = res.status_code
@@ -1,42 +1,302 @@
-import os
 from urllib.parse import urljoin
 
-import requests
-from bs4 import BeautifulSoup
+import lxml.etree
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
 
+from .cache_tools import get_html_cache
+from .http_tools import http_get
 from .regex_tools import get_game_name, check_has_filetype, parse_languages
 
+# Backends we can use to build soups. lxml is a lot faster than the
+# pure-Python html.parser
+HTML_PARSERS = ["html.parser", "lxml"]
+
+# Backends for parsing the game index. lxml-xpath skips bs4 entirely
+INDEX_PARSERS = HTML_PARSERS + ["lxml-xpath"]
+
+# Only build the part of the game index we actually use
+INDEX_STRAINER = SoupStrainer("div", id="easyindex-index")
+
+
+def get_index_url(nxbrew_url):
+    """Get the URL of the NXBrew game index
+
+    Args:
+        nxbrew_url (string): NXBrew URL
+    """
+
+    return urljoin(nxbrew_url, "Index/game-index/games/")
+
+
+def get_html_content(
+    url,
+    cache=False,
+    cache_config=None,
+    allow_stale=True,
+):
+    """Get the raw content of an HTML page
+
+    Args:
+        url (string): URL
+        cache (bool): If True, will go through the on-disk HTML cache,
+            which revalidates pages once they're stale. Defaults to False
+        cache_config (dict): Dictionary of cache configuration. Defaults
+            to None, which will use the default cache settings
+        allow_stale (bool): If False, stale cached pages will always be
+            revalidated before being returned, even within the cache's
+            stale-while-revalidate window. Defaults to True
+    """
+
+    if not cache:
+        r = http_get(url)
+        return r.content
+
+    html_cache = get_html_cache(cache_config)
+    content = html_cache.get(url, allow_stale=allow_stale)
+
+    return content
+
+
+def get_soup(
+    content,
+    parser="lxml",
+    parse_only=None,
+):
+    """Parse HTML content into a soup
+
+    Args:
+        content (bytes): Raw HTML
+        parser (string): Parser backend, one of HTML_PARSERS. Defaults
+            to "lxml"
+        parse_only (bs4.SoupStrainer): If set, will only build the parts
+            of the page that match this. Defaults to None, which will
+            parse everything
+    """
+
+    if parser not in HTML_PARSERS:
+        raise ValueError(f"parser should be one of {HTML_PARSERS}, not {parser}")
+
+    soup = BeautifulSoup(content, parser, parse_only=parse_only)
+
+    return soup
+
 
 def get_html_page(
     url,
     cache=False,
-    cache_filename="index.html",
+    cache_config=None,
+    parser="lxml",
 ):
     """Get an HTML page as a soup
 
     Args:
         url (string): URL
-        cache (bool): If True, will save the game index as a cache. Defaults to False
-        cache_filename (string): Filename to cache file to. Defaults to "index.html"
+        cache (bool): If True, will go through the on-disk HTML cache,
+            which revalidates pages once they're stale. Defaults to False
+        cache_config (dict): Dictionary of cache configuration. Defaults
+            to None, which will use the default cache settings
+        parser (string): Parser backend, one of HTML_PARSERS. Defaults
+            to "lxml"
     """
 
-    if not cache:
-        r = requests.get(url)
-        soup = BeautifulSoup(r.content, "html.parser")
-    else:
-        if not os.path.exists(cache_filename):
-            r = requests.get(url)
-            with open(cache_filename, mode="wb") as f:
-                f.write(r.content)
-            r = r.content
-        else:
-            with open(cache_filename, mode="rb") as f:
-                r = f.read()
-        soup = BeautifulSoup(r, "html.parser")
+    content = get_html_content(
+        url,
+        cache=cache,
+        cache_config=cache_config,
+    )
+    soup = get_soup(content, parser=parser)
 
     return soup
 
 
+def get_index_entries(
+    content,
+    parser="lxml-xpath",
+):
+    """Pull the (long name, URL) pairs out of the game index
+
+    Args:
+        content (bytes): Raw HTML of the game index
+        parser (string): Parser backend, one of INDEX_PARSERS. "lxml-xpath"
+            uses lxml directly, without building a soup. Otherwise, only
+            the index itself is built into a soup. Defaults to "lxml-xpath"
+    """
+
+    if parser not in INDEX_PARSERS:
+        raise ValueError(f"parser should be one of {INDEX_PARSERS}, not {parser}")
+
+    entries = []
+
+    if parser == "lxml-xpath":
+
+        # lxml will assume Latin-1 if we don't tell it otherwise, so pick up
+        # the declared encoding like bs4 would
+        encoding = EncodingDetector.find_declared_encoding(content, is_html=True)
+        html_parser = lxml.html.HTMLParser(encoding=encoding or "utf-8")
+        tree = lxml.html.document_fromstring(content, parser=html_parser)
+
+        for item in tree.xpath('//div[@id="easyindex-index"]//li'):
+            entries.append((item.text_content(), item.find(".//a").get("href")))
+
+        return entries
+
+    soup = get_soup(content, parser=parser, parse_only=INDEX_STRAINER)
+    index = soup.find("div", {"id": "easyindex-index"})
+
+    # If that's not picked anything up, fall back to parsing everything
+    if index is None:
+        soup = get_soup(content, parser=parser)
+        index = soup.find("div", {"id": "easyindex-index"})
+
+    for item in index.find_all("li"):
+        entries.append((item.text, item.find("a").get("href")))
+
+    return entries
+
+
+def get_game_entry(
+    long_name,
+    url,
+    general_config,
+    regex_config,
+):
+    """Classify an entry from the game index
+
+    Pulls out the short name, and whether the game has NSPs/XCIs,
+    updates and DLC. Returns None if it's a forbidden title
+
+    Args:
+        long_name (string): Full name, as in the index
+        url (string): Game URL
+        general_config (dict): General configuration
+        regex_config (dict): Regex configuration
+    """
+
+    if long_name in general_config["forbidden_titles"]:
+        return None
+
+    nsp_xci_variations = regex_config["nsp_variations"] + regex_config["xci_variations"]
+    short_name = get_game_name(long_name, nsp_xci_variations=nsp_xci_variations)
+
+    # Pull out whether NSP/XCI, and whether it has updates/DLCs
+    remaining_name = long_name.replace(short_name, "")
+    has_nsp = check_has_filetype(remaining_name, regex_config["nsp_variations"])
+    has_xci = check_has_filetype(remaining_name, regex_config["xci_variations"])
+    has_update = check_has_filetype(remaining_name, regex_config["update_variations"])
+    has_dlc = check_has_filetype(remaining_name, regex_config["dlc_variations"])
+
+    game = {
+        "long_name": long_name,
+        "short_name": short_name,
+        "url": url,
+        "has_nsp": has_nsp,
+        "has_xci": has_xci,
+        "has_update": has_update,
+        "has_dlc": has_dlc,
+    }
+
+    return game
+
+
+def iter_index_entries(chunks):
+    """Pull (long name, URL) pairs out of the game index as it comes in
+
+    Feeds chunks of the index to an incremental lxml parser, yielding
+    each entry as soon as its <li> has been closed, rather than waiting
+    for the whole page
+
+    Args:
+        chunks (iterable): Chunks of raw HTML, in order
+    """
+
+    parser = None
+    index_element = None
+
+    for chunk in chunks:
+
+        # Set up the parser once we can see the declared encoding
+        if parser is None:
+            encoding = EncodingDetector.find_declared_encoding(chunk, is_html=True)
+            parser = lxml.etree.HTMLPullParser(
+                events=("start", "end"),
+                encoding=encoding or "utf-8",
+            )
+
+        parser.feed(chunk)
+
+        for event, element in parser.read_events():
+
+            if event == "start":
+                if element.tag == "div" and element.get("id") == "easyindex-index":
+                    index_element = element
+                continue
+
+            if element is index_element:
+                index_element = None
+
+            elif index_element is not None and element.tag == "li":
+                long_name = "".join(element.itertext())
+                url = element.find(".//a").get("href")
+
+                # We're done with this entry, so free it up
+                element.clear()
+
+                yield long_name, url
+
+    if parser is not None:
+        parser.close()
+
+
+def iter_game_index(
+    general_config,
+    regex_config,
+    nxbrew_url,
+    chunk_size=65536,
+):
+    """Stream the game index, yielding games as they're parsed
+
+    The index is fetched through the HTML cache, so if it's fresh this
+    comes straight from disk. Otherwise it's parsed while it downloads,
+    so the first games come through long before the page has finished
+
+    Args:
+        general_config (dict): General configuration
+        regex_config (dict): Regex configuration
+        nxbrew_url (string): NXBrew URL
+        chunk_size (int): Size of each chunk to parse, in bytes.
+            Defaults to 65536
+    """
+
+    html_cache = get_html_cache(general_config.get("html_cache", None))
+    chunks = html_cache.iter_content(
+        get_index_url(nxbrew_url),
+        chunk_size=chunk_size,
+    )
+
+    urls = set()
+
+    for long_name, url in iter_index_entries(chunks):
+
+        game = get_game_entry(
+            long_name,
+            url,
+            general_config=general_config,
+            regex_config=regex_config,
+        )
+
+        # If there are any forbidden titles, skip them here
+        if game is None:
+            continue
+
+        if url in urls:
+            raise ValueError(f"Duplicate URLs found: {url}")
+        urls.add(url)
+
+        yield game
+
+
 def get_game_dict(
     general_config,
     regex_config,
@@ -52,49 +312,36 @@ def get_game_dict(
 
     game_dict = {}
 
-    url = urljoin(nxbrew_url, "Index/game-index/games/")
+    url = get_index_url(nxbrew_url)
 
-    # Load in the HTML
-    game_html = get_html_page(
+    # Load in the HTML. This is cached, and only fully re-downloaded if it changes
+    content = get_html_content(
         url,
-        cache_filename="game_index.html",
+        cache=True,
+        cache_config=general_config.get("html_cache", None),
+    )
+    entries = get_index_entries(
+        content,
+        parser=general_config.get("index_parser", "lxml-xpath"),
     )
-    index = game_html.find("div", {"id": "easyindex-index"})
 
-    nsp_xci_variations = regex_config["nsp_variations"] + regex_config["xci_variations"]
-    for item in index.find_all("li"):
+    for long_name, url in entries:
 
-        # Get the long name, the short name, and the URL
-        long_name = item.text
+        game = get_game_entry(
+            long_name,
+            url,
+            general_config=general_config,
+            regex_config=regex_config,
+        )
 
         # If there are any forbidden titles, skip them here
-        if long_name in general_config["forbidden_titles"]:
+        if game is None:
             continue
 
-        short_name = get_game_name(long_name, nsp_xci_variations=nsp_xci_variations)
-        url = item.find("a").get("href")
-
         if url in game_dict:
             raise ValueError(f"Duplicate URLs found: {url}")
 
-        # Pull out whether NSP/XCI, and whether it has updates/DLCs
-        remaining_name = long_name.replace(short_name, "")
-        has_nsp = check_has_filetype(remaining_name, regex_config["nsp_variations"])
-        has_xci = check_has_filetype(remaining_name, regex_config["xci_variations"])
-        has_update = check_has_filetype(
-            remaining_name, regex_config["update_variations"]
-        )
-        has_dlc = check_has_filetype(remaining_name, regex_config["dlc_variations"])
-
-        game_dict[url] = {
-            "long_name": long_name,
-            "short_name": short_name,
-            "url": url,
-            "has_nsp": has_nsp,
-            "has_xci": has_xci,
-            "has_update": has_update,
-            "has_dlc": has_dlc,
-        }
+        game_dict[url] = game
 
     return game_dict
 
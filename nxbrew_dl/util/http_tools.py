@@ -0,0 +1,179 @@
+import threading
+
+import requests
+from curl_cffi import CurlHttpVersion
+from curl_cffi import requests as cffi_requests
+from requests.adapters import HTTPAdapter
+
+# Default transport settings. These can be overridden by the "http" section
+# of the general config, via configure_http
+HTTP_CONFIG = {
+    "timeout": 30,
+    "pool_connections": 10,
+    "pool_maxsize": 4,
+    "max_retries": 2,
+    "http2": True,
+}
+
+SESSION = None
+SESSION_LOCK = threading.Lock()
+
+# curl handles can't be shared between threads, so keep one session per thread
+CFFI_SESSIONS = threading.local()
+CFFI_GENERATION = 0
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+
+    def __init__(
+        self,
+        timeout=None,
+        **kwargs,
+    ):
+        """HTTP adapter that applies a default timeout to every request
+
+        Args:
+            timeout (float): Default timeout, in seconds. Defaults to None,
+                which will wait forever
+            **kwargs: Passed to HTTPAdapter
+        """
+
+        super().__init__(**kwargs)
+
+        self.timeout = timeout
+
+    def send(self, request, **kwargs):
+        """Send a request, using the default timeout if none is given"""
+
+        if kwargs.get("timeout", None) is None:
+            kwargs["timeout"] = self.timeout
+
+        return super().send(request, **kwargs)
+
+
+def configure_http(http_config=None):
+    """Update the transport settings, and reset the shared sessions
+
+    Sessions are only reset if the settings have actually changed, so
+    calling this again with the same config keeps the connection pool.
+    The old session isn't closed, since other threads may still be using
+    it. It'll be cleaned up once they're done with it
+
+    Args:
+        http_config (dict): Dictionary of HTTP configuration, as in
+            the "http" section of the general config. Defaults to None,
+            which will keep the current settings
+    """
+
+    global SESSION, CFFI_GENERATION
+
+    if http_config is None:
+        return HTTP_CONFIG
+
+    with SESSION_LOCK:
+        new_http_config = {**HTTP_CONFIG, **http_config}
+        if new_http_config == HTTP_CONFIG:
+            return HTTP_CONFIG
+
+        HTTP_CONFIG.update(http_config)
+
+        SESSION = None
+
+        # Per-thread sessions will be rebuilt on their next use
+        CFFI_GENERATION += 1
+
+    return HTTP_CONFIG
+
+
+def get_session():
+    """Get the shared, pooled requests session
+
+    Connections are kept alive and reused between calls, with a limited
+    number of connections per host
+    """
+
+    global SESSION
+
+    with SESSION_LOCK:
+        if SESSION is None:
+            session = requests.Session()
+
+            adapter = TimeoutHTTPAdapter(
+                timeout=HTTP_CONFIG["timeout"],
+                pool_connections=HTTP_CONFIG["pool_connections"],
+                pool_maxsize=HTTP_CONFIG["pool_maxsize"],
+                pool_block=True,
+                max_retries=HTTP_CONFIG["max_retries"],
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+            SESSION = session
+
+    return SESSION
+
+
+def get_cffi_session():
+    """Get a curl_cffi session for the current thread
+
+    These are used where we need to impersonate a browser. Connections
+    are kept alive between calls, and will use HTTP/2 where available.
+    Cookies are not cleared between calls, so do that if needed
+    """
+
+    session = getattr(CFFI_SESSIONS, "session", None)
+    generation = getattr(CFFI_SESSIONS, "generation", None)
+
+    if session is None or generation != CFFI_GENERATION:
+
+        if session is not None:
+            session.close()
+
+        kwargs = {
+            "timeout": HTTP_CONFIG["timeout"],
+        }
+        if HTTP_CONFIG["http2"]:
+            kwargs["http_version"] = CurlHttpVersion.V2TLS
+        else:
+            kwargs["http_version"] = CurlHttpVersion.V1_1
+
+        session = cffi_requests.Session(**kwargs)
+
+        CFFI_SESSIONS.session = session
+        CFFI_SESSIONS.generation = CFFI_GENERATION
+
+    return session
+
+
+def http_get(
+    url,
+    **kwargs,
+):
+    """GET a URL through the shared session
+
+    Args:
+        url (str): URL to get
+        **kwargs: Passed to requests.Session.get
+    """
+
+    session = get_session()
+    r = session.get(url, **kwargs)
+
+    return r
+
+
+def http_post(
+    url,
+    **kwargs,
+):
+    """POST to a URL through the shared session
+
+    Args:
+        url (str): URL to post to
+        **kwargs: Passed to requests.Session.post
+    """
+
+    session = get_session()
+    r = session.post(url, **kwargs)
+
+    return r
@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import time
+import unicodedata
+from urllib.parse import urlparse
+
+
+def normalise_name(name):
+    """Normalise a game name for matching, ignoring case, accents and punctuation
+
+    Args:
+        name (str): Game name
+    """
+
+    name = unicodedata.normalize("NFKD", name)
+    name = name.encode("ascii", "ignore").decode("ascii")
+    name = re.sub(r"[^a-z0-9]+", "", name.lower())
+
+    return name
+
+
+def get_index_state(game):
+    """Get the parts of an index entry that change when a game gets new files
+
+    Args:
+        game (dict): Game dictionary, from get_game_dict
+    """
+
+    return game["long_name"], game["has_update"], game["has_dlc"]
+
+
+def diff_game_dicts(
+    old_game_dict,
+    new_game_dict,
+):
+    """Work out what's changed between two versions of the game index
+
+    Entries are first matched by URL path, so domain changes don't count.
+    If the name has changed, it counts as renamed, and if the name is the
+    same but the long name or update/DLC flags have changed, it counts
+    as changed. Anything left over is then matched by normalised short
+    name, to catch games that have moved URL, which also count as renamed.
+    Everything else has been added or removed
+
+    Returns a dictionary of "added", "removed", and "changed" lists of
+    game dictionaries, and a "renamed" list of {"old": ..., "new": ...}
+    dictionaries
+
+    Args:
+        old_game_dict (dict): Previous game index, from get_game_dict
+        new_game_dict (dict): Current game index, from get_game_dict
+    """
+
+    delta = {
+        "added": [],
+        "removed": [],
+        "renamed": [],
+        "changed": [],
+    }
+
+    old_paths = {urlparse(url).path: game for url, game in old_game_dict.items()}
+    new_paths = {urlparse(url).path: game for url, game in new_game_dict.items()}
+
+    unmatched_old = {}
+    unmatched_new = {}
+
+    for url_path, new_game in new_paths.items():
+        old_game = old_paths.get(url_path, None)
+
+        if old_game is None:
+            unmatched_new[url_path] = new_game
+        elif normalise_name(old_game["short_name"]) != normalise_name(
+            new_game["short_name"]
+        ):
+            delta["renamed"].append({"old": old_game, "new": new_game})
+        elif get_index_state(old_game) != get_index_state(new_game):
+            delta["changed"].append(new_game)
+
+    for url_path, old_game in old_paths.items():
+        if url_path not in new_paths:
+            unmatched_old[url_path] = old_game
+
+    # Now see if anything's just moved
+    old_names = {}
+    for old_game in unmatched_old.values():
+        old_names.setdefault(normalise_name(old_game["short_name"]), []).append(
+            old_game
+        )
+
+    for new_game in unmatched_new.values():
+        old_games = old_names.get(normalise_name(new_game["short_name"]), [])
+
+        if len(old_games) > 0:
+            delta["renamed"].append({"old": old_games.pop(0), "new": new_game})
+        else:
+            delta["added"].append(new_game)
+
+    for old_games in old_names.values():
+        delta["removed"].extend(old_games)
+
+    return delta
+
+
+class IndexSnapshot:
+
+    def __init__(
+        self,
+        filename="index_snapshot.json",
+    ):
+        """Persisted snapshot of the parsed game index
+
+        Used to work out what's changed in the index since we last looked
+
+        Args:
+            filename (str): File to store the snapshot in. Defaults to
+                "index_snapshot.json"
+        """
+
+        self.filename = filename
+
+        self.game_dict, self.updated = self.load()
+
+    def load(self):
+        """Load the snapshot. Returns the game dictionary, and when it was saved"""
+
+        if not os.path.exists(self.filename):
+            return None, None
+
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None, None
+
+        return snapshot["game_dict"], snapshot["updated"]
+
+    def save(self):
+        """Save the snapshot, atomically replacing the old one"""
+
+        tmp_file = f"{self.filename}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"updated": self.updated, "game_dict": self.game_dict}, f)
+        os.replace(tmp_file, self.filename)
+
+    def update(
+        self,
+        game_dict,
+    ):
+        """Update the snapshot, returning what's changed since last time
+
+        If there's no previous snapshot, returns None, since we can't
+        say what's new
+
+        Args:
+            game_dict (dict): Current game index, from get_game_dict
+        """
+
+        delta = None
+        if self.game_dict is not None:
+            delta = diff_game_dicts(self.game_dict, game_dict)
+
+        self.game_dict = game_dict
+        self.updated = time.time()
+        self.save()
+
+        return delta
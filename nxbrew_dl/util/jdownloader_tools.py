@@ -0,0 +1,652 @@
+import threading
+import time
+
+from myjdapi.exception import MYJDException
+
+
+class LockedJDownloaderDevice:
+
+    def __init__(
+        self,
+        obj,
+        lock=None,
+    ):
+        """Wrap a JDownloader device, so only one API call happens at a time
+
+        myjdapi keeps a single request ID per connection, so calls from
+        multiple threads will clash. This wraps the device (and its
+        linkgrabber, downloads, etc.) so every call goes through a lock
+
+        Args:
+            obj: Object to wrap, generally a myjdapi.Jddevice
+            lock (threading.RLock): Lock to use. Defaults to None,
+                which will create a new one
+        """
+
+        if lock is None:
+            lock = threading.RLock()
+
+        self.obj = obj
+        self.lock = lock
+
+    def __getattr__(self, name):
+        attr = getattr(self.obj, name)
+
+        if callable(attr):
+
+            def locked_call(*args, **kwargs):
+                with self.lock:
+                    return attr(*args, **kwargs)
+
+            return locked_call
+
+        # Sub-APIs (linkgrabber, downloads, ...) hold a reference to the device
+        if hasattr(attr, "device"):
+            return LockedJDownloaderDevice(attr, lock=self.lock)
+
+        return attr
+
+
+class JDownloaderWaiter:
+
+    def __init__(
+        self,
+        jd_device,
+        use_events=True,
+        min_interval=0.5,
+        max_interval=10,
+        backoff=1.5,
+        event_poll_timeout=2000,
+        logger=None,
+    ):
+        """Wait on JDownloader state without hammering the API
+
+        Where possible, this will subscribe to the My.JDownloader event API,
+        so that waits return as soon as something changes. Otherwise (or if
+        events aren't wanted), will poll with an interval that starts short
+        and backs off while nothing changes. Listening for events holds the
+        device's connection open, so this should ideally get a separate
+        connection from everything else
+
+        Args:
+            jd_device (myjdapi.Jddevice): JDownloader device
+            use_events (bool): If True, will try to use the event API.
+                Defaults to True
+            min_interval (float): Shortest time between polls, in seconds.
+                Defaults to 0.5
+            max_interval (float): Longest time between polls, in seconds.
+                Defaults to 10
+            backoff (float): Factor to increase the poll interval by each
+                time nothing has changed. Defaults to 1.5
+            event_poll_timeout (int): How long the event API will hold a
+                request open waiting for events, in milliseconds. This should
+                stay below the My.JDownloader request timeout. Defaults to
+                2000
+            logger (logging.Logger): Logger to use. Defaults to None,
+                which will not log anything
+        """
+
+        self.jd_device = jd_device
+        self.use_events = use_events
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.event_poll_timeout = event_poll_timeout
+        self.logger = logger
+
+        self.subscription_id = None
+        self.n_event_failures = 0
+        self.max_event_failures = 3
+
+    def subscribe(self):
+        """Subscribe to JDownloader events. Returns True if successful"""
+
+        if not self.use_events:
+            return False
+
+        if self.subscription_id is not None:
+            return True
+
+        try:
+            subscription = self.jd_device.action(
+                "/events/subscribe",
+                [[".*"], []],
+            )
+            subscription_id = subscription["subscriptionid"]
+
+            # Keep the subscription alive for a while between waits
+            self.jd_device.action(
+                "/events/changesubscriptiontimeouts",
+                [subscription_id, self.event_poll_timeout, 300000],
+            )
+        except (MYJDException, KeyError, TypeError):
+            if self.logger is not None:
+                self.logger.debug("JDownloader events not available, will poll instead")
+            self.use_events = False
+            return False
+
+        self.subscription_id = subscription_id
+
+        return True
+
+    def unsubscribe(self):
+        """Remove any event subscription"""
+
+        if self.subscription_id is None:
+            return True
+
+        try:
+            self.jd_device.action("/events/unsubscribe", [self.subscription_id])
+        except MYJDException:
+            pass
+
+        self.subscription_id = None
+
+        return True
+
+    def listen(self):
+        """Block until JDownloader sends events, or the poll timeout is hit
+
+        Returns True if events were received. If anything goes wrong, will
+        drop back to polling, and give up on events entirely if this keeps
+        happening
+        """
+
+        try:
+            events = self.jd_device.action(
+                "/events/listen",
+                [self.subscription_id],
+            )
+        except MYJDException:
+            if self.logger is not None:
+                self.logger.debug("Lost JDownloader event subscription")
+            self.subscription_id = None
+            self.n_event_failures += 1
+            if self.n_event_failures >= self.max_event_failures:
+                self.use_events = False
+            return False
+
+        self.n_event_failures = 0
+
+        return events is not None and len(events) > 0
+
+    def wait(
+        self,
+        interval,
+    ):
+        """Wait for JDownloader events, or just sleep if there aren't any
+
+        Returns True if events were received
+
+        Args:
+            interval (float): Time to sleep for if we're not using events
+        """
+
+        if self.subscribe():
+            listen_start = time.time()
+            got_events = self.listen()
+
+            # Never go faster than the minimum interval, even if events
+            # are flooding in
+            listen_time = time.time() - listen_start
+            if listen_time < self.min_interval:
+                time.sleep(self.min_interval - listen_time)
+
+            if self.subscription_id is not None:
+                return got_events
+
+        time.sleep(interval)
+
+        return False
+
+
+class JDownloaderState:
+
+    def __init__(
+        self,
+        jd_device,
+        waiter,
+        logger=None,
+        max_failures=10,
+    ):
+        """Local mirror of the JDownloader linkgrabber and download list
+
+        A single background thread keeps a snapshot of packages in the
+        linkgrabber and download list, indexed by UUID and by name, along
+        with the links for any packages we're watching. Waiting code reads
+        from this rather than querying JDownloader itself. The poller
+        refreshes whenever JDownloader sends events, or otherwise backs off
+        while nothing changes. Where possible, only the packages we're
+        watching are queried. Everything is pulled in if we're looking for
+        a package by name, or a watched package has gone missing
+
+        Args:
+            jd_device (LockedJDownloaderDevice): JDownloader device. Should
+                be wrapped so calls are thread-safe
+            waiter (JDownloaderWaiter): Waiter used to pace the polling
+            logger (logging.Logger): Logger to use. Defaults to None,
+                which will not log anything
+            max_failures (int): Number of consecutive failed refreshes
+                before giving up. Defaults to 10
+        """
+
+        self.jd_device = jd_device
+        self.waiter = waiter
+        self.logger = logger
+        self.max_failures = max_failures
+
+        self.condition = threading.Condition()
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+        # Snapshot generation. Incremented every time something is changed,
+        # so waits can make sure they're looking at a fresh snapshot
+        self.generation = 0
+        self.requested_generation = 0
+        self.error = None
+
+        self.watched_packages = set()
+        self.watched_names = set()
+
+        self.packages = {
+            "linkgrabber": {},
+            "downloads": {},
+        }
+        self.packages_by_name = {
+            "linkgrabber": {},
+            "downloads": {},
+        }
+        self.links = {
+            "linkgrabber": {},
+            "downloads": {},
+        }
+
+    def start(self):
+        """Start the background poller, if it's not already running"""
+
+        if self.thread is not None and self.thread.is_alive():
+            return True
+
+        self.stopping.clear()
+        self.error = None
+        self.thread = threading.Thread(target=self.poll, daemon=True)
+        self.thread.start()
+
+        return True
+
+    def stop(self):
+        """Stop the background poller"""
+
+        self.stopping.set()
+        self.wake.set()
+
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+        self.waiter.unsubscribe()
+
+        return True
+
+    def poll(self):
+        """Keep refreshing the snapshot until we're told to stop
+
+        The snapshot is only refreshed when JDownloader sends events, when
+        we've been asked for a fresh one, or once the current poll interval
+        has passed
+        """
+
+        interval = self.waiter.min_interval
+        n_failures = 0
+        refresh_due = True
+        last_refresh = 0
+
+        try:
+            while not self.stopping.is_set():
+
+                if refresh_due or time.time() - last_refresh >= interval:
+                    try:
+                        changed = self.refresh()
+                        n_failures = 0
+                    except MYJDException as e:
+                        changed = False
+                        n_failures += 1
+                        if self.logger is not None:
+                            self.logger.debug(f"Failed to query JDownloader: {e}")
+
+                        if n_failures >= self.max_failures:
+                            with self.condition:
+                                self.error = e
+                                self.condition.notify_all()
+                            return
+
+                    last_refresh = time.time()
+
+                    # Back off while nothing's changing
+                    if changed:
+                        interval = self.waiter.min_interval
+                    else:
+                        interval = min(
+                            interval * self.waiter.backoff, self.waiter.max_interval
+                        )
+
+                # Wait for something to happen. If we've been asked for a fresh
+                # snapshot, go straight away
+                if self.wake.is_set() or self.stopping.is_set():
+                    self.wake.clear()
+                    refresh_due = True
+                    continue
+
+                if self.waiter.subscribe():
+                    refresh_due = self.waiter.wait(interval)
+                else:
+                    self.wake.wait(interval)
+                    refresh_due = True
+
+                if self.wake.is_set():
+                    refresh_due = True
+                self.wake.clear()
+
+        except Exception as e:
+            # Anything else would kill the thread quietly, leaving anyone
+            # waiting on the snapshot waiting forever
+            if self.logger is not None:
+                self.logger.warning(f"JDownloader poller failed: {e}")
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    def refresh(self):
+        """Refresh the snapshot. Returns True if anything has changed"""
+
+        with self.condition:
+            generation = self.requested_generation
+            watched_packages = list(self.watched_packages)
+            full_query = len(self.watched_names) > 0
+
+        # If we're not looking for anything by name, just get the packages
+        # we're watching, unless some have disappeared (e.g. moved to the
+        # download list), in which case we need to go looking for them
+        if full_query or len(watched_packages) == 0:
+            packages = self.query_packages()
+        else:
+            packages = self.query_packages(watched_packages)
+
+            found_packages = set(
+                [p["uuid"] for list_name in packages for p in packages[list_name]]
+            )
+            if any([p not in found_packages for p in watched_packages]):
+                packages = self.query_packages()
+
+        # Only pull links for the packages we care about
+        links = {
+            "linkgrabber": [],
+            "downloads": [],
+        }
+        if len(watched_packages) > 0:
+            links["linkgrabber"] = self.jd_device.linkgrabber.query_links(
+                [
+                    {
+                        "packageUUIDs": watched_packages,
+                        "availability": True,
+                        "host": True,
+                        "maxResults": -1,
+                        "startAt": 0,
+                    }
+                ]
+            )
+            links["downloads"] = self.jd_device.downloads.query_links(
+                [
+                    {
+                        "packageUUIDs": watched_packages,
+                        "bytesLoaded": True,
+                        "bytesTotal": True,
+                        "extractionStatus": True,
+                        "finished": True,
+                        "running": True,
+                        "status": True,
+                        "maxResults": -1,
+                        "startAt": 0,
+                    }
+                ]
+            )
+
+        # Build up the indices
+        new_packages = {}
+        new_packages_by_name = {}
+        new_links = {}
+        for list_name in ["linkgrabber", "downloads"]:
+            new_packages[list_name] = {}
+            new_packages_by_name[list_name] = {}
+            new_links[list_name] = {}
+
+            for p in packages[list_name]:
+                new_packages[list_name][p["uuid"]] = p
+                new_packages_by_name[list_name].setdefault(p["name"], []).append(p)
+
+            for l in links[list_name]:
+                new_links[list_name].setdefault(l["packageUUID"], []).append(l)
+
+        with self.condition:
+            changed = (
+                new_packages != self.packages
+                or new_links != self.links
+                or generation != self.generation
+            )
+
+            self.packages = new_packages
+            self.packages_by_name = new_packages_by_name
+            self.links = new_links
+            self.generation = generation
+
+            self.condition.notify_all()
+
+        return changed
+
+    def query_packages(
+        self,
+        package_ids=None,
+    ):
+        """Query packages in the linkgrabber and download list
+
+        Args:
+            package_ids (list): Package UUIDs to get. Defaults to None,
+                which will get everything
+        """
+
+        if package_ids is None:
+            package_ids = []
+
+        packages = {
+            "linkgrabber": self.jd_device.linkgrabber.query_packages(
+                [
+                    {
+                        "packageUUIDs": package_ids,
+                        "childCount": True,
+                        "maxResults": -1,
+                        "startAt": 0,
+                    }
+                ]
+            ),
+            "downloads": self.jd_device.downloads.query_packages(
+                [
+                    {
+                        "packageUUIDs": package_ids,
+                        "bytesLoaded": True,
+                        "bytesTotal": True,
+                        "childCount": True,
+                        "finished": True,
+                        "running": True,
+                        "speed": True,
+                        "status": True,
+                        "maxResults": -1,
+                        "startAt": 0,
+                    }
+                ]
+            ),
+        }
+
+        return packages
+
+    def invalidate(self):
+        """Flag that we've changed something in JDownloader
+
+        Wakes the poller up for a fresh snapshot, and returns the generation
+        that snapshot will have, to pass to wait_until
+        """
+
+        with self.condition:
+            self.requested_generation += 1
+            generation = self.requested_generation
+
+        self.wake.set()
+
+        return generation
+
+    def watch(
+        self,
+        package_id,
+    ):
+        """Start tracking links for a package
+
+        Args:
+            package_id (int): Package UUID
+        """
+
+        with self.condition:
+            self.watched_packages.add(package_id)
+
+        return self.invalidate()
+
+    def unwatch(
+        self,
+        package_id,
+    ):
+        """Stop tracking links for a package
+
+        Args:
+            package_id (int): Package UUID
+        """
+
+        with self.condition:
+            self.watched_packages.discard(package_id)
+
+        return True
+
+    def watch_name(
+        self,
+        name,
+    ):
+        """Start looking out for a package by name
+
+        While any names are being watched, the snapshot will include
+        every package, so they can be found with get_package
+
+        Args:
+            name (str): Package name
+        """
+
+        with self.condition:
+            self.watched_names.add(name)
+
+        return self.invalidate()
+
+    def unwatch_name(
+        self,
+        name,
+    ):
+        """Stop looking out for a package by name
+
+        Args:
+            name (str): Package name
+        """
+
+        with self.condition:
+            self.watched_names.discard(name)
+
+        return True
+
+    def get_package(
+        self,
+        package_id=None,
+        name=None,
+        list_name="downloads",
+    ):
+        """Get a package from the snapshot, by UUID or by name
+
+        Returns None if the package isn't found. If looking up by name and
+        there are several, will return the first
+
+        Args:
+            package_id (int): Package UUID. Defaults to None
+            name (str): Package name. Defaults to None
+            list_name (str): Either "linkgrabber" or "downloads". Defaults
+                to "downloads"
+        """
+
+        with self.condition:
+            if package_id is not None:
+                return self.packages[list_name].get(package_id, None)
+
+            packages = self.packages_by_name[list_name].get(name, [])
+            if len(packages) == 0:
+                return None
+
+            return packages[0]
+
+    def get_links(
+        self,
+        package_id,
+        list_name="downloads",
+    ):
+        """Get links for a watched package from the snapshot
+
+        Args:
+            package_id (int): Package UUID
+            list_name (str): Either "linkgrabber" or "downloads". Defaults
+                to "downloads"
+        """
+
+        with self.condition:
+            return list(self.links[list_name].get(package_id, []))
+
+    def wait_until(
+        self,
+        check,
+        generation=None,
+        timeout=None,
+    ):
+        """Wait until a check against the snapshot returns something truthy
+
+        Args:
+            check (callable): Function to call. Should return something
+                falsy while we should keep waiting
+            generation (int): If set, will only check snapshots at least
+                this fresh, as returned by invalidate. Defaults to None
+            timeout (float): Maximum time to wait, in seconds. Defaults
+                to None, which will wait forever
+        """
+
+        self.start()
+
+        start_time = time.time()
+
+        with self.condition:
+            while True:
+
+                if self.error is not None:
+                    raise self.error
+
+                if generation is None or self.generation >= generation:
+                    result = check()
+                    if result:
+                        return result
+
+                wait_time = None
+                if timeout is not None:
+                    wait_time = timeout - (time.time() - start_time)
+                    if wait_time <= 0:
+                        raise TimeoutError("Timed out waiting on JDownloader")
+
+                self.condition.wait(wait_time)
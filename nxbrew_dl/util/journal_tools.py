@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+
+# States an item goes through, in order
+JOURNAL_STATES = [
+    "parsed",
+    "resolved",
+    "submitted",
+    "downloading",
+    "extracting",
+    "done",
+]
+
+
+def get_journal_key(
+    url,
+    dl_key,
+    full_name,
+):
+    """Get the journal key for a downloadable item
+
+    Args:
+        url (str): Game URL
+        dl_key (str): Download tag, e.g. "base_game_nsp"
+        full_name (str): Full name of the item
+    """
+
+    return f"{url}|{dl_key}|{full_name}"
+
+
+class JobJournal:
+
+    def __init__(
+        self,
+        filename="journal.json",
+    ):
+        """Crash-safe, on-disk journal of download jobs
+
+        Each item we download moves through a series of states (page
+        parsed, links resolved, submitted to JDownloader, downloading,
+        extracting, and done). Every change is written out straight away,
+        replacing the journal atomically, so if we die part way through a
+        run we can pick up from the last state that made it to disk
+        rather than starting from scratch
+
+        Args:
+            filename (str): File to store the journal in. Defaults to
+                "journal.json"
+        """
+
+        self.filename = filename
+
+        self.lock = threading.Lock()
+
+        self.entries = self.load()
+
+    def load(self):
+        """Load the journal from disk"""
+
+        if not os.path.exists(self.filename):
+            return {}
+
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+        return entries
+
+    def save(self):
+        """Save the journal, making sure it's on disk before replacing the old one"""
+
+        tmp_file = f"{self.filename}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.filename)
+
+    def update(
+        self,
+        key,
+        state,
+        **kwargs,
+    ):
+        """Move an item to a new state, saving along any extra info
+
+        Will only write to disk if something has actually changed
+
+        Args:
+            key (str): Journal key, from get_journal_key
+            state (str): New state. Should be one of JOURNAL_STATES
+            **kwargs: Extra info to store with the entry
+        """
+
+        if state not in JOURNAL_STATES:
+            raise ValueError(f"state should be one of {JOURNAL_STATES}")
+
+        with self.lock:
+            entry = self.entries.get(key, {})
+
+            new_entry = {**entry, **kwargs, "state": state}
+            if new_entry == entry:
+                return False
+
+            new_entry["updated"] = time.time()
+            self.entries[key] = new_entry
+            self.save()
+
+        return True
+
+    def get(
+        self,
+        key,
+    ):
+        """Get a journal entry. Returns None if it's not there
+
+        Args:
+            key (str): Journal key, from get_journal_key
+        """
+
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None:
+                entry = dict(entry)
+
+        return entry
+
+    def remove(
+        self,
+        key,
+    ):
+        """Remove an entry from the journal
+
+        Args:
+            key (str): Journal key, from get_journal_key
+        """
+
+        with self.lock:
+            if key not in self.entries:
+                return False
+
+            self.entries.pop(key)
+            self.save()
+
+        return True
+
+    def get_entries(
+        self,
+        states=None,
+    ):
+        """Get journal entries, optionally only for certain states
+
+        Args:
+            states (list): States to get entries for. Defaults to None,
+                which will return everything
+        """
+
+        with self.lock:
+            entries = {
+                key: dict(entry)
+                for key, entry in self.entries.items()
+                if states is None or entry["state"] in states
+            }
+
+        return entries
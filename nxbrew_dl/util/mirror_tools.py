@@ -0,0 +1,255 @@
+import json
+import os
+import threading
+import time
+
+
+class MirrorScoreboard:
+
+    def __init__(
+        self,
+        filename="mirror_stats.json",
+        half_life=86400,
+        min_samples=2,
+        degraded_online_rate=0.5,
+    ):
+        """Persistent health and throughput statistics for download sites
+
+        For each download site, we keep track of how often links are
+        online, how long JDownloader takes to check them, and the download
+        speed we actually get. Everything is exponentially decayed, so
+        recent history counts for more, and is used to reorder download
+        sites so that healthy, fast sites are tried first and degraded
+        ones get pushed to the back
+
+        Args:
+            filename (str): File to store statistics in. Defaults to
+                "mirror_stats.json"
+            half_life (float): Time (in seconds) for old statistics to
+                decay to half their weight. Defaults to 86400
+            min_samples (float): Minimum (decayed) number of checks before
+                we'll consider a site degraded. Defaults to 2
+            degraded_online_rate (float): Sites with an online rate below
+                this are considered degraded. Defaults to 0.5
+        """
+
+        self.filename = filename
+        self.half_life = half_life
+        self.min_samples = min_samples
+        self.degraded_online_rate = degraded_online_rate
+
+        self.lock = threading.Lock()
+
+        self.stats = self.load()
+
+    def load(self):
+        """Load statistics from disk"""
+
+        if not os.path.exists(self.filename):
+            return {}
+
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+        return stats
+
+    def save(self):
+        """Save statistics, atomically replacing the old file"""
+
+        tmp_file = f"{self.filename}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.stats, f, indent=4, sort_keys=True)
+        os.replace(tmp_file, self.filename)
+
+    def get_site(
+        self,
+        dl_site,
+        now=None,
+    ):
+        """Get statistics for a site, decayed to the current time
+
+        Args:
+            dl_site (str): Download site
+            now (float): Current time. Defaults to None, which will use
+                time.time()
+        """
+
+        if now is None:
+            now = time.time()
+
+        site = self.stats.get(dl_site, None)
+        if site is None:
+            return {
+                "checks": 0,
+                "online": 0,
+                "time_to_online": 0,
+                "downloads": 0,
+                "speed": 0,
+                "updated": now,
+            }
+
+        # Decay everything down to now
+        factor = 0.5 ** (max(now - site["updated"], 0) / self.half_life)
+
+        site = {k: v * factor if k != "updated" else v for k, v in site.items()}
+        site["updated"] = now
+
+        return site
+
+    def record_check(
+        self,
+        dl_site,
+        online,
+        time_to_online=None,
+    ):
+        """Record a link availability check for a site
+
+        Args:
+            dl_site (str): Download site
+            online (bool): Whether all the links were online
+            time_to_online (float): Time (in seconds) it took
+                JDownloader to check the links. Defaults to None
+        """
+
+        with self.lock:
+            site = self.get_site(dl_site)
+
+            site["checks"] += 1
+            if online:
+                site["online"] += 1
+                if time_to_online is not None:
+                    site["time_to_online"] += time_to_online
+
+            self.stats[dl_site] = site
+            self.save()
+
+    def record_download(
+        self,
+        dl_site,
+        speed,
+    ):
+        """Record the download speed achieved for a site
+
+        Args:
+            dl_site (str): Download site
+            speed (float): Average download speed, in bytes per second
+        """
+
+        if speed is None or speed <= 0:
+            return
+
+        with self.lock:
+            site = self.get_site(dl_site)
+
+            site["downloads"] += 1
+            site["speed"] += speed
+
+            self.stats[dl_site] = site
+            self.save()
+
+    def get_summary(
+        self,
+        dl_site,
+    ):
+        """Get a summary of a site's recent health
+
+        Returns a dictionary of the online rate, mean time to online (in
+        seconds), mean download speed (in bytes per second), whether we've
+        checked the site enough to judge it, and whether the site is
+        currently degraded
+
+        Args:
+            dl_site (str): Download site
+        """
+
+        with self.lock:
+            site = self.get_site(dl_site)
+
+        # Start from an even prior, so sites we know nothing about sit in
+        # the middle
+        online_rate = (site["online"] + 1) / (site["checks"] + 2)
+
+        time_to_online = None
+        if site["online"] > 0:
+            time_to_online = site["time_to_online"] / site["online"]
+
+        speed = None
+        if site["downloads"] > 0:
+            speed = site["speed"] / site["downloads"]
+
+        sampled = site["checks"] >= self.min_samples
+        degraded = sampled and online_rate < self.degraded_online_rate
+
+        summary = {
+            "online_rate": online_rate,
+            "time_to_online": time_to_online,
+            "speed": speed,
+            "sampled": sampled,
+            "degraded": degraded,
+        }
+
+        return summary
+
+    def sort_sites(
+        self,
+        dl_sites,
+    ):
+        """Reorder download sites based on their recent history
+
+        The configured priority order is kept, except that degraded sites
+        go to the back, so they're only used if nothing else works. Sites
+        we have enough history for can swap places with each other, ranked
+        by online rate weighted by how their download speed compares to
+        the fastest site, but sites we know little about keep their place
+
+        Args:
+            dl_sites (list): Download sites, in priority order
+        """
+
+        summaries = {dl_site: self.get_summary(dl_site) for dl_site in dl_sites}
+
+        speeds = [s["speed"] for s in summaries.values() if s["speed"] is not None]
+        best_speed = max(speeds) if len(speeds) > 0 else None
+
+        def get_score(dl_site):
+            summary = summaries[dl_site]
+
+            score = summary["online_rate"]
+            if summary["speed"] is not None and best_speed:
+                score *= (summary["speed"] / best_speed) ** 0.5
+
+            # Round, so small differences don't shuffle the priority order
+            return -round(score, 1)
+
+        healthy = [s for s in dl_sites if not summaries[s]["degraded"]]
+        degraded = [s for s in dl_sites if summaries[s]["degraded"]]
+
+        # Only shuffle sites with enough history between the slots they
+        # already hold
+        sampled = sorted(
+            [s for s in healthy if summaries[s]["sampled"]],
+            key=get_score,
+        )
+        sampled_iter = iter(sampled)
+        healthy = [
+            next(sampled_iter) if summaries[s]["sampled"] else s for s in healthy
+        ]
+
+        return healthy + degraded
+
+    def get_degraded_sites(
+        self,
+        dl_sites,
+    ):
+        """Get which of a list of download sites are currently degraded
+
+        Args:
+            dl_sites (list): Download sites
+        """
+
+        return [
+            dl_site for dl_site in dl_sites if self.get_summary(dl_site)["degraded"]
+        ]
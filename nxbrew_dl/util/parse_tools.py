@@ -0,0 +1,268 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+from bs4 import SoupStrainer, Tag
+
+from .download_tools import get_paragraph_from_tag, parse_download_paragraphs
+from .html_tools import get_soup
+from .regex_tools import parse_languages
+
+# Everything we need from a game page is in a paragraph (languages and
+# download links), or a meta tag (thumbnail)
+GAME_PAGE_STRAINER = SoupStrainer(["meta", "p"])
+
+# Keep one process pool per size, so everything shares the same workers
+PARSE_POOLS = {}
+PARSE_POOLS_LOCK = threading.Lock()
+
+
+def get_parse_config(general_config):
+    """Pull out the parts of the general config needed to parse a game page
+
+    This is much smaller than the full config, so cheaper to send
+    over to worker processes
+
+    Args:
+        general_config (dict): General configuration
+    """
+
+    parse_config = {
+        "regions": list(general_config["regions"].keys()),
+        "regionless_titles": general_config["regionless_titles"],
+        "languages": general_config["languages"],
+        "implied_languages": general_config["implied_languages"],
+        "dl_sites": general_config["dl_sites"],
+        "dl_mappings": general_config["dl_mappings"],
+        "html_parser": general_config.get("html_parser", "lxml"),
+        "partial_parsing": general_config.get("partial_parsing", True),
+    }
+
+    return parse_config
+
+
+class PageAnalysis(NamedTuple):
+    """Everything we parse out of a game page"""
+
+    thumb_url: Optional[str]
+    languages: list
+    found_language: bool
+    dl_dict: Optional[dict]
+
+
+def analyse_page(
+    soup,
+    parse_config,
+    language_prefs=None,
+):
+    """Pull the thumbnail, languages and download links out of a game page
+
+    Rather than searching the page separately for each of these, this
+    walks the page once, picking up the og:image thumbnail, the first
+    <strong> mentioning languages, and every paragraph after the
+    "Download Links" heading as it goes
+
+    Args:
+        soup (bs4.BeautifulSoup): soup object to parse
+        parse_config (dict): Parsing configuration, from get_parse_config
+        language_prefs (list): Languages we want. If none of these are on
+            the page, we won't parse the download links. Defaults to None,
+            which will always parse the download links
+    """
+
+    thumb_url = None
+    langs = None
+    paragraphs = None
+
+    for tag in soup.descendants:
+
+        if not isinstance(tag, Tag):
+            continue
+
+        if tag.name == "p":
+            if paragraphs is not None:
+                paragraphs.append(get_paragraph_from_tag(tag))
+
+        elif tag.name == "strong":
+            text = tag.text.lower()
+
+            # Languages are in the text straight after the <strong> tag
+            if langs is None and "language" in text:
+                langs = parse_languages(
+                    tag.next_sibling.text,
+                    lang_dict=parse_config["languages"],
+                )
+
+            # Everything after here might be download links
+            if paragraphs is None and "download links" in text:
+                paragraphs = []
+
+        elif tag.name == "meta":
+            if thumb_url is None and tag.get("property", None) == "og:image":
+                thumb_url = tag["content"]
+
+    if langs is None:
+        langs = []
+    langs.sort()
+
+    # If the language we want isn't in here, then don't go any further
+    if language_prefs is not None:
+        if not any([lang in language_prefs for lang in langs]):
+            return PageAnalysis(
+                thumb_url=thumb_url,
+                languages=langs,
+                found_language=False,
+                dl_dict=None,
+            )
+
+    if paragraphs is None:
+        raise ValueError("No download links found")
+
+    dl_dict = parse_download_paragraphs(
+        paragraphs,
+        regions=parse_config["regions"],
+        regionless_titles=parse_config["regionless_titles"],
+        languages=parse_config["languages"],
+        implied_languages=parse_config["implied_languages"],
+        dl_sites=parse_config["dl_sites"],
+        dl_mappings=parse_config["dl_mappings"],
+    )
+
+    return PageAnalysis(
+        thumb_url=thumb_url,
+        languages=langs,
+        found_language=True,
+        dl_dict=dl_dict,
+    )
+
+
+def parse_game_page(
+    content,
+    parse_config,
+    language_prefs=None,
+):
+    """Parse everything we want out of a game page
+
+    Returns a dictionary of the thumbnail URL, the page languages, whether
+    we found a requested language, and the full download dictionary
+    (None if there's no requested language). This is all plain data, so
+    is cheap to send back from a worker process, unlike the soup
+
+    Args:
+        content (bytes): Raw HTML of the game page
+        parse_config (dict): Parsing configuration, from get_parse_config
+        language_prefs (list): Languages we want. If none of these are on
+            the page, we won't parse the download links. Defaults to None,
+            which will always parse the download links
+    """
+
+    parser = parse_config.get("html_parser", "lxml")
+
+    # Start by only building the bits of the page we need. If that's
+    # missed anything (e.g. the page layout has changed), then fall back
+    # to parsing everything
+    if parse_config.get("partial_parsing", True):
+        soup = get_soup(content, parser=parser, parse_only=GAME_PAGE_STRAINER)
+
+        try:
+            page_analysis = analyse_page(
+                soup,
+                parse_config=parse_config,
+                language_prefs=language_prefs,
+            )
+            if page_analysis.thumb_url is not None and len(page_analysis.languages) > 0:
+                return page_analysis._asdict()
+        except ValueError:
+            pass
+
+    soup = get_soup(content, parser=parser)
+
+    page_analysis = analyse_page(
+        soup,
+        parse_config=parse_config,
+        language_prefs=language_prefs,
+    )
+
+    return page_analysis._asdict()
+
+
+def get_parse_pool(max_workers=None):
+    """Get a (shared) process pool for parsing pages
+
+    Returns None if max_workers is 0, in which case pages should be
+    parsed in the calling thread
+
+    Args:
+        max_workers (int): Number of worker processes. Defaults to None,
+            which will use one per CPU
+    """
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers <= 0:
+        return None
+
+    with PARSE_POOLS_LOCK:
+        if max_workers not in PARSE_POOLS:
+            # Don't fork, since by now we'll have threads (and their locks)
+            # running that the workers would inherit
+            PARSE_POOLS[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    return PARSE_POOLS[max_workers]
+
+
+def submit_parse(
+    pool,
+    content,
+    parse_config,
+    language_prefs=None,
+):
+    """Parse a game page in the process pool, returning a future
+
+    If there's no pool, or it's broken (e.g. a worker has died), will
+    parse in the calling thread instead, so the future is already done
+
+    Args:
+        pool (ProcessPoolExecutor): Process pool, from get_parse_pool.
+            Can be None
+        content (bytes): Raw HTML of the game page
+        parse_config (dict): Parsing configuration, from get_parse_config
+        language_prefs (list): Languages we want. Defaults to None
+    """
+
+    if pool is not None:
+        try:
+            return pool.submit(
+                parse_game_page,
+                content,
+                parse_config,
+                language_prefs,
+            )
+        except (BrokenProcessPool, RuntimeError):
+
+            # Get rid of the broken pool, so the next caller gets a new one
+            with PARSE_POOLS_LOCK:
+                for max_workers in list(PARSE_POOLS):
+                    if PARSE_POOLS[max_workers] is pool:
+                        PARSE_POOLS.pop(max_workers)
+
+    future = Future()
+    try:
+        future.set_result(
+            parse_game_page(
+                content,
+                parse_config,
+                language_prefs,
+            )
+        )
+    except Exception as e:
+        future.set_exception(e)
+
+    return future
@@ -1,5 +1,31 @@
 import re
 
+# Compiled language patterns, keyed by the language dictionary items
+LANG_PATTERNS = {}
+
+
+def get_lang_patterns(lang_dict):
+    """Get compiled (long name, short pattern, long pattern) tuples for languages
+
+    These are compiled once per language dictionary and reused, since
+    parsing languages is done a lot
+
+    Args:
+        lang_dict (dict): Dictionary of languages
+    """
+
+    key = tuple(lang_dict.items())
+
+    lang_patterns = LANG_PATTERNS.get(key, None)
+    if lang_patterns is None:
+        lang_patterns = [
+            (long_lang, re.compile(short_lang), re.compile(long_lang))
+            for long_lang, short_lang in lang_dict.items()
+        ]
+        LANG_PATTERNS[key] = lang_patterns
+
+    return lang_patterns
+
 
 def get_game_name(
     f,
@@ -76,8 +102,7 @@ def parse_languages(
     if lang_dict is None:
         return []
 
-    long_langs = list(lang_dict.keys())
-    short_langs = [lang_dict[l] for l in long_langs]
+    lang_patterns = get_lang_patterns(lang_dict)
 
     f_split = f.split(",")
 
@@ -87,19 +112,19 @@ def parse_languages(
         # Strip any leading whitespace
         fs = fs.strip()
 
-        for i, short_lang in enumerate(short_langs):
+        for long_lang, short_pattern, long_pattern in lang_patterns:
 
             # Do a first pass where we check against short languages
-            short_match = re.match(short_lang, fs, flags=re.NOFLAG)
+            short_match = short_pattern.match(fs)
             if short_match:
-                langs.append(long_langs[i])
+                langs.append(long_lang)
 
                 # If we do have a short match, move on
                 continue
 
             # Do a first pass where we check against short languages
-            long_match = re.match(long_langs[i], fs, flags=re.NOFLAG)
+            long_match = long_pattern.match(fs)
             if long_match:
-                langs.append(long_langs[i])
+                langs.append(long_lang)
 
     return langs
@@ -0,0 +1,239 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Keep one worker per trash directory, so repeated runs share the same queue
+TRASH_WORKERS = {}
+TRASH_WORKERS_LOCK = threading.Lock()
+
+
+def get_trash_worker(
+    trash_dir,
+    logger=None,
+):
+    """Get a (shared) background deletion worker for a trash directory
+
+    Args:
+        trash_dir (str): Trash directory
+        logger (logging.Logger): Logger instance. Defaults to None
+    """
+
+    trash_dir = os.path.abspath(trash_dir)
+
+    with TRASH_WORKERS_LOCK:
+        if trash_dir not in TRASH_WORKERS:
+            TRASH_WORKERS[trash_dir] = TrashWorker(trash_dir, logger=logger)
+
+        worker = TRASH_WORKERS[trash_dir]
+        if logger is not None:
+            worker.logger = logger
+
+    return worker
+
+
+def wait_for_trash():
+    """Block until every trash worker has finished deleting"""
+
+    with TRASH_WORKERS_LOCK:
+        workers = list(TRASH_WORKERS.values())
+
+    for worker in workers:
+        worker.wait()
+
+    return True
+
+
+def remove_path(path):
+    """Delete a file or directory, returning the number of bytes freed
+
+    Directories are removed bottom-up, adding up file sizes as we go, so
+    we only walk the tree once. Anything that can't be removed is skipped
+
+    Args:
+        path (str): Path to delete
+    """
+
+    if os.path.islink(path) or not os.path.isdir(path):
+        size = os.lstat(path).st_size
+        os.remove(path)
+        return size
+
+    size = 0
+    for root, dirs, files in os.walk(path, topdown=False):
+        for f in files:
+            full_path = os.path.join(root, f)
+            try:
+                file_size = os.lstat(full_path).st_size
+                os.remove(full_path)
+                size += file_size
+            except OSError:
+                pass
+
+        # Symlinks to directories aren't walked into, so just unlink them
+        for d in dirs:
+            full_path = os.path.join(root, d)
+            try:
+                if os.path.islink(full_path):
+                    os.remove(full_path)
+                else:
+                    os.rmdir(full_path)
+            except OSError:
+                pass
+
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+    return size
+
+
+class TrashWorker:
+
+    def __init__(
+        self,
+        trash_dir,
+        logger=None,
+    ):
+        """Delete directories in the background
+
+        Directories are first renamed into a trash directory, which is
+        instant if it's on the same filesystem, so they're out of the way
+        straight away. The actual deletion, which can take a while for big
+        games, then happens in a background thread. Anything left in the
+        trash from a previous run is cleared out too
+
+        Args:
+            trash_dir (str): Trash directory. Should be on the same
+                filesystem as the things being deleted
+            logger (logging.Logger): Logger instance. Defaults to None,
+                which won't log progress
+        """
+
+        self.trash_dir = trash_dir
+        self.logger = logger
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.progress = {
+            "queued": 0,
+            "deleted": 0,
+            "bytes_deleted": 0,
+        }
+
+        # Pick up anything left over from last time
+        if os.path.exists(self.trash_dir):
+            for f in os.listdir(self.trash_dir):
+                self.enqueue(os.path.join(self.trash_dir, f))
+
+    def delete(
+        self,
+        path,
+    ):
+        """Move a path to the trash, and delete it in the background
+
+        If it can't be moved (e.g. it's on another filesystem), it'll
+        just be deleted in place
+
+        Args:
+            path (str): Path to delete
+        """
+
+        if not os.path.exists(path):
+            return False
+
+        if not os.path.exists(self.trash_dir):
+            os.makedirs(self.trash_dir)
+
+        trash_path = os.path.join(
+            self.trash_dir,
+            f"{uuid.uuid4().hex}_{os.path.basename(os.path.normpath(path))}",
+        )
+
+        try:
+            os.rename(path, trash_path)
+        except OSError:
+            trash_path = path
+
+        self.enqueue(trash_path)
+
+        return True
+
+    def enqueue(
+        self,
+        path,
+    ):
+        """Queue up a path for deletion, starting the worker if needed
+
+        Args:
+            path (str): Path to delete
+        """
+
+        with self.lock:
+            self.progress["queued"] += 1
+            self.queue.put(path)
+
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+        return True
+
+    def run(self):
+        """Work through the deletion queue"""
+
+        while True:
+
+            try:
+                path = self.queue.get(timeout=1)
+            except queue.Empty:
+                with self.lock:
+                    if self.queue.empty():
+                        self.thread = None
+                        return
+                continue
+
+            try:
+                start_time = time.time()
+
+                size = 0
+                if os.path.lexists(path):
+                    size = remove_path(path)
+
+                with self.lock:
+                    self.progress["deleted"] += 1
+                    self.progress["bytes_deleted"] += size
+                    progress = dict(self.progress)
+
+                if self.logger is not None:
+                    self.logger.info(
+                        f"Reclaimed {size / 1024 ** 2:.1f}MB in {time.time() - start_time:.1f}s "
+                        f"({progress['deleted']}/{progress['queued']} deleted, "
+                        f"{progress['bytes_deleted'] / 1024 ** 2:.1f}MB total)"
+                    )
+            except OSError as e:
+                if self.logger is not None:
+                    self.logger.warning(f"Could not delete {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def get_progress(self):
+        """Get deletion progress
+
+        Returns a dictionary of the number of paths queued and deleted,
+        and the total bytes deleted so far
+        """
+
+        with self.lock:
+            return dict(self.progress)
+
+    def wait(self):
+        """Block until everything queued has been deleted"""
+
+        self.queue.join()
+
+        return True
@@ -0,0 +1,630 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from urllib.parse import urlparse, urlunparse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    url TEXT PRIMARY KEY,
+    url_path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    thumb_url TEXT
+);
+CREATE INDEX IF NOT EXISTS games_url_path ON games (url_path);
+CREATE TABLE IF NOT EXISTS items (
+    url TEXT NOT NULL REFERENCES games (url) ON UPDATE CASCADE ON DELETE CASCADE,
+    dl_key TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    PRIMARY KEY (url, dl_key, full_name)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class UserCache(MutableMapping):
+
+    def __init__(
+        self,
+        filename="cache.db",
+        json_file=None,
+        timeout=30,
+    ):
+        """SQLite-backed store of what's been downloaded
+
+        Acts like the old cache dictionary, mapping game URLs to entries of
+        the game name, thumbnail URL, and downloaded items for each download
+        type. Entries write straight through to the database, but changes
+        are better made through add_game, add_item etc., which only touch
+        the rows that have changed. The database is in WAL mode, so several
+        processes can safely read and write at once
+
+        Args:
+            filename (str): Database file. Defaults to "cache.db"
+            json_file (str): Old JSON cache file. If set, and it hasn't
+                been imported before, will be imported into the database.
+                Defaults to None
+            timeout (float): Time (in seconds) to wait for other processes
+                to finish writing. Defaults to 30
+        """
+
+        self.filename = filename
+        self.timeout = timeout
+
+        # SQLite connections can't be shared between threads, so keep one per thread
+        self.local = threading.local()
+
+        conn = self.get_connection()
+        conn.executescript(SCHEMA)
+
+        if json_file is not None:
+            self.import_json(json_file)
+
+    def get_connection(self):
+        """Get a database connection for the current thread"""
+
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            conn = sqlite3.connect(
+                self.filename,
+                timeout=self.timeout,
+                isolation_level=None,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self.local.conn = conn
+
+        return conn
+
+    def transaction(self):
+        """Start a write transaction, taking the lock straight away
+
+        Use as a context manager. Will commit at the end, or roll back
+        if anything goes wrong
+        """
+
+        return Transaction(self.get_connection())
+
+    def import_json(
+        self,
+        json_file,
+    ):
+        """Import an old JSON cache, if we haven't already
+
+        Args:
+            json_file (str): Path to JSON cache file
+        """
+
+        if not os.path.exists(json_file):
+            return False
+
+        with self.transaction() as conn:
+
+            imported = conn.execute(
+                "SELECT value FROM meta WHERE key = 'imported_json'"
+            ).fetchone()
+            if imported is not None:
+                return False
+
+            with open(json_file, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+
+            for url, entry in cache.items():
+                self.set_entry(conn, url, entry)
+
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('imported_json', ?)",
+                (os.path.abspath(json_file),),
+            )
+
+        return True
+
+    def set_entry(
+        self,
+        conn,
+        url,
+        entry,
+    ):
+        """Write a full cache entry, replacing what's there
+
+        Args:
+            conn (sqlite3.Connection): Database connection
+            url (str): Game URL
+            entry (dict): Cache entry, with name, thumb_url, and lists
+                of downloaded items
+        """
+
+        conn.execute(
+            "INSERT INTO games (url, url_path, name, thumb_url) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (url) DO UPDATE SET "
+            "name = excluded.name, thumb_url = excluded.thumb_url",
+            (url, urlparse(url).path, entry["name"], entry.get("thumb_url", None)),
+        )
+        conn.execute("DELETE FROM items WHERE url = ?", (url,))
+
+        for dl_key, full_names in entry.items():
+            if dl_key in ["name", "thumb_url"]:
+                continue
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (url, dl_key, full_name) VALUES (?, ?, ?)",
+                [(url, dl_key, full_name) for full_name in full_names],
+            )
+
+    def __getitem__(
+        self,
+        url,
+    ):
+        """Get a cache entry, which reads and writes through to the database
+
+        Args:
+            url (str): Game URL
+        """
+
+        if url not in self:
+            raise KeyError(url)
+
+        return UserCacheEntry(self, url)
+
+    def __setitem__(
+        self,
+        url,
+        entry,
+    ):
+        """Write a full cache entry, replacing what's there
+
+        Args:
+            url (str): Game URL
+            entry (dict): Cache entry
+        """
+
+        with self.transaction() as conn:
+            self.set_entry(conn, url, entry)
+
+    def __delitem__(
+        self,
+        url,
+    ):
+        """Remove a game, and everything downloaded for it, from the cache
+
+        Args:
+            url (str): Game URL
+        """
+
+        with self.transaction() as conn:
+            cur = conn.execute("DELETE FROM games WHERE url = ?", (url,))
+            if cur.rowcount == 0:
+                raise KeyError(url)
+
+    def __contains__(
+        self,
+        url,
+    ):
+        """Check whether a URL is in the cache
+
+        Args:
+            url (str): Game URL
+        """
+
+        row = (
+            self.get_connection()
+            .execute("SELECT 1 FROM games WHERE url = ?", (url,))
+            .fetchone()
+        )
+
+        return row is not None
+
+    def __iter__(self):
+        """Iterate over the cached URLs"""
+
+        rows = self.get_connection().execute("SELECT url FROM games").fetchall()
+
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        """Get the number of cached games"""
+
+        return self.get_connection().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def add_game(
+        self,
+        url,
+        name,
+        thumb_url=None,
+    ):
+        """Add a game to the cache, if it's not already there
+
+        Args:
+            url (str): Game URL
+            name (str): Game name
+            thumb_url (str): Thumbnail URL. Defaults to None
+        """
+
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO games (url, url_path, name, thumb_url) "
+                "VALUES (?, ?, ?, ?)",
+                (url, urlparse(url).path, name, thumb_url),
+            )
+
+        return True
+
+    def set_thumb_url(
+        self,
+        url,
+        thumb_url,
+    ):
+        """Set the thumbnail URL for a game
+
+        Args:
+            url (str): Game URL
+            thumb_url (str): Thumbnail URL
+        """
+
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE games SET thumb_url = ? WHERE url = ?", (thumb_url, url)
+            )
+
+        return True
+
+    def add_item(
+        self,
+        url,
+        dl_key,
+        full_name,
+    ):
+        """Record an item as downloaded
+
+        Args:
+            url (str): Game URL
+            dl_key (str): Download type, e.g. "base_game_nsp"
+            full_name (str): Full name of the item
+        """
+
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO items (url, dl_key, full_name) VALUES (?, ?, ?)",
+                (url, dl_key, full_name),
+            )
+
+        return True
+
+    def has_item(
+        self,
+        url,
+        dl_key,
+        full_name,
+    ):
+        """Check whether an item has been downloaded
+
+        Args:
+            url (str): Game URL
+            dl_key (str): Download type, e.g. "base_game_nsp"
+            full_name (str): Full name of the item
+        """
+
+        row = (
+            self.get_connection()
+            .execute(
+                "SELECT 1 FROM items WHERE url = ? AND dl_key = ? AND full_name = ?",
+                (url, dl_key, full_name),
+            )
+            .fetchone()
+        )
+
+        return row is not None
+
+    def remove_dl_key(
+        self,
+        dl_key,
+    ):
+        """Remove every item of a download type, e.g. all DLC, from the cache
+
+        Args:
+            dl_key (str): Download type, e.g. "dlc"
+        """
+
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM items WHERE dl_key = ?", (dl_key,))
+
+        return True
+
+    def rename_url(
+        self,
+        old_url,
+        new_url,
+    ):
+        """Move a cache entry to a new URL
+
+        If there's already an entry for the new URL, the two are merged,
+        keeping the name of the existing entry
+
+        Args:
+            old_url (str): Current game URL
+            new_url (str): New game URL
+        """
+
+        if old_url == new_url:
+            return True
+
+        with self.transaction() as conn:
+
+            existing = conn.execute(
+                "SELECT 1 FROM games WHERE url = ?", (new_url,)
+            ).fetchone()
+
+            if existing is None:
+                conn.execute(
+                    "UPDATE games SET url = ?, url_path = ? WHERE url = ?",
+                    (new_url, urlparse(new_url).path, old_url),
+                )
+                return True
+
+            conn.execute(
+                "INSERT OR IGNORE INTO items (url, dl_key, full_name) "
+                "SELECT ?, dl_key, full_name FROM items WHERE url = ? ORDER BY rowid",
+                (new_url, old_url),
+            )
+            conn.execute(
+                "UPDATE games SET thumb_url = COALESCE(thumb_url, "
+                "(SELECT thumb_url FROM games WHERE url = ?)) WHERE url = ?",
+                (old_url, new_url),
+            )
+            conn.execute("DELETE FROM games WHERE url = ?", (old_url,))
+
+        return True
+
+    def get_url_by_path(
+        self,
+        url_path,
+    ):
+        """Find the cached URL with a particular path, e.g. if the domain's changed
+
+        Returns None if there isn't one
+
+        Args:
+            url_path (str): URL path
+        """
+
+        row = (
+            self.get_connection()
+            .execute("SELECT url FROM games WHERE url_path = ?", (url_path,))
+            .fetchone()
+        )
+
+        if row is None:
+            return None
+
+        return row[0]
+
+    def get_paths(self):
+        """Get a dictionary of URL path to URL for everything in the cache"""
+
+        rows = self.get_connection().execute("SELECT url_path, url FROM games")
+
+        return {url_path: url for url_path, url in rows}
+
+    def remap_domain(
+        self,
+        base_url,
+    ):
+        """Move every cached URL over to a new domain, keeping the paths
+
+        Anything that would clash with a URL already in the cache is left
+        alone. Returns the number of URLs that were moved
+
+        Args:
+            base_url (str): New base URL, e.g. the NXBrew URL
+        """
+
+        base_url = urlparse(base_url)
+
+        n_remapped = 0
+
+        with self.transaction() as conn:
+
+            rows = conn.execute("SELECT url, url_path FROM games").fetchall()
+
+            for url, url_path in rows:
+                parsed_url = urlparse(url)
+                if (
+                    parsed_url.scheme == base_url.scheme
+                    and parsed_url.netloc == base_url.netloc
+                ):
+                    continue
+
+                new_url = urlunparse(
+                    parsed_url._replace(scheme=base_url.scheme, netloc=base_url.netloc)
+                )
+
+                cur = conn.execute(
+                    "UPDATE OR IGNORE games SET url = ? WHERE url = ?",
+                    (new_url, url),
+                )
+                n_remapped += cur.rowcount
+
+        return n_remapped
+
+
+class UserCacheEntry(MutableMapping):
+
+    def __init__(
+        self,
+        user_cache,
+        url,
+    ):
+        """A single game in the user cache, read from and written to the database
+
+        Maps "name" and "thumb_url" to the game name and thumbnail URL, and
+        each download type to a tuple of the items downloaded for it. Item
+        tuples can't be changed in place, so set the whole download type
+        (or use UserCache.add_item) to change them
+
+        Args:
+            user_cache (UserCache): User cache
+            url (str): Game URL
+        """
+
+        self.user_cache = user_cache
+        self.url = url
+
+    def get_row(self):
+        """Get the name and thumbnail URL for the game"""
+
+        row = (
+            self.user_cache.get_connection()
+            .execute("SELECT name, thumb_url FROM games WHERE url = ?", (self.url,))
+            .fetchone()
+        )
+        if row is None:
+            raise KeyError(self.url)
+
+        return row
+
+    def __getitem__(
+        self,
+        key,
+    ):
+        """Get the name, thumbnail URL, or items for a download type
+
+        Args:
+            key (str): "name", "thumb_url", or a download type
+        """
+
+        name, thumb_url = self.get_row()
+
+        if key == "name":
+            return name
+
+        if key == "thumb_url":
+            if thumb_url is None:
+                raise KeyError(key)
+            return thumb_url
+
+        rows = (
+            self.user_cache.get_connection()
+            .execute(
+                "SELECT full_name FROM items WHERE url = ? AND dl_key = ? "
+                "ORDER BY rowid",
+                (self.url, key),
+            )
+            .fetchall()
+        )
+        if len(rows) == 0:
+            raise KeyError(key)
+
+        return tuple([row[0] for row in rows])
+
+    def __setitem__(
+        self,
+        key,
+        value,
+    ):
+        """Set the name, thumbnail URL, or items for a download type
+
+        Args:
+            key (str): "name", "thumb_url", or a download type
+            value: New value. For download types, a list of item names
+        """
+
+        with self.user_cache.transaction() as conn:
+            if key in ["name", "thumb_url"]:
+                cur = conn.execute(
+                    f"UPDATE games SET {key} = ? WHERE url = ?", (value, self.url)
+                )
+                if cur.rowcount == 0:
+                    raise KeyError(self.url)
+                return
+
+            conn.execute(
+                "DELETE FROM items WHERE url = ? AND dl_key = ?", (self.url, key)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (url, dl_key, full_name) VALUES (?, ?, ?)",
+                [(self.url, key, full_name) for full_name in value],
+            )
+
+    def __delitem__(
+        self,
+        key,
+    ):
+        """Remove the thumbnail URL, or all items for a download type
+
+        Args:
+            key (str): "thumb_url", or a download type
+        """
+
+        if key == "name":
+            raise KeyError("Cannot remove the name of a cached game")
+
+        with self.user_cache.transaction() as conn:
+            if key == "thumb_url":
+                cur = conn.execute(
+                    "UPDATE games SET thumb_url = NULL "
+                    "WHERE url = ? AND thumb_url IS NOT NULL",
+                    (self.url,),
+                )
+            else:
+                cur = conn.execute(
+                    "DELETE FROM items WHERE url = ? AND dl_key = ?", (self.url, key)
+                )
+            if cur.rowcount == 0:
+                raise KeyError(key)
+
+    def __iter__(self):
+        """Iterate over the name, thumbnail URL (if set), and download types"""
+
+        name, thumb_url = self.get_row()
+
+        keys = ["name"]
+        if thumb_url is not None:
+            keys.append("thumb_url")
+
+        rows = self.user_cache.get_connection().execute(
+            "SELECT dl_key FROM items WHERE url = ? "
+            "GROUP BY dl_key ORDER BY MIN(rowid)",
+            (self.url,),
+        )
+        keys.extend([row[0] for row in rows])
+
+        return iter(keys)
+
+    def __len__(self):
+        """Get the number of keys in the entry"""
+
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Transaction:
+
+    def __init__(
+        self,
+        conn,
+    ):
+        """Context manager for an immediate write transaction
+
+        Args:
+            conn (sqlite3.Connection): Database connection
+        """
+
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
@@ -1,4 +1,7 @@
+import multiprocessing
+
 from nxbrew_dl import run_nxbrew_gui
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     run_nxbrew_gui()
@@ -0,0 +1,140 @@
+"""Check the HTML cache against a local server
+
+The server hands out an ETag with every page, and answers with a 304 if
+it's sent back. Pages under /error/ always fail
+"""
+
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from nxbrew_dl.util import HTMLCache
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(
+            (self.path, self.headers.get("If-None-Match", None))
+        )
+
+        if self.path.startswith("/error/"):
+            self.send_response(503)
+            self.end_headers()
+            self.wfile.write(b"Service unavailable")
+            return
+
+        etag = f'"{self.server.version}"'
+        if self.headers.get("If-None-Match", None) == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = f"{self.path} v{self.server.version}".encode()
+
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    server.requests = []
+    server.version = 1
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server, path):
+    """Get the full URL for a path on the local server
+
+    Args:
+        server (http.server.HTTPServer): Local server
+        path (str): Path to get
+    """
+
+    return f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def test_fresh_entries_are_served_from_cache(tmp_path, server):
+    cache = HTMLCache(cache_dir=str(tmp_path), ttl=600)
+    url = get_url(server, "/game")
+
+    assert cache.get(url) == b"/game v1"
+    assert cache.get(url) == b"/game v1"
+
+    assert len(server.requests) == 1
+    assert cache.is_fresh(url)
+
+    stats = cache.get_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+def test_stale_entries_are_revalidated(tmp_path, server):
+    cache = HTMLCache(cache_dir=str(tmp_path), ttl=0)
+    url = get_url(server, "/game")
+
+    assert cache.get(url) == b"/game v1"
+    time.sleep(0.01)
+    assert not cache.is_fresh(url)
+
+    # Unchanged, so we get a 304 and the cached copy
+    assert cache.get(url) == b"/game v1"
+    assert server.requests[-1] == ("/game", '"1"')
+    assert cache.get_stats()["revalidated"] == 1
+
+    # Changed, so we get the new page
+    server.version = 2
+    assert cache.get(url) == b"/game v2"
+    assert cache.get_stats()["misses"] == 2
+
+
+def test_iter_content_revalidates(tmp_path, server):
+    cache = HTMLCache(cache_dir=str(tmp_path), ttl=0)
+    url = get_url(server, "/game")
+
+    assert b"".join(cache.iter_content(url, chunk_size=2)) == b"/game v1"
+    assert b"".join(cache.iter_content(url, chunk_size=2)) == b"/game v1"
+
+    assert server.requests[-1] == ("/game", '"1"')
+    assert cache.get_stats()["revalidated"] == 1
+
+
+def test_errors_are_not_cached(tmp_path, server):
+    cache = HTMLCache(cache_dir=str(tmp_path), ttl=600)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        cache.fetch(get_url(server, "/error/page"))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        list(cache.iter_content(get_url(server, "/error/stream")))
+
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_index_is_flushed(tmp_path, server):
+    cache = HTMLCache(cache_dir=str(tmp_path), ttl=600, flush_interval=600)
+    url = get_url(server, "/game")
+
+    cache.get(url)
+    cache.flush()
+
+    new_cache = HTMLCache(cache_dir=str(tmp_path), ttl=600)
+    assert new_cache.get(url) == b"/game v1"
+    assert len(server.requests) == 1
@@ -0,0 +1,96 @@
+"""Check download link parsing against a set of saved game pages
+
+Each page in data/game_pages has a matching .json file with what the
+original (multi-pass) parser found for it, or the error it raised. The
+single-pass parser, and everything built on top of it, should agree
+"""
+
+import glob
+import json
+import os
+
+import pytest
+
+import nxbrew_dl
+from nxbrew_dl.util import (
+    HTML_PARSERS,
+    get_dl_dict,
+    get_parse_config,
+    get_soup,
+    load_yml,
+    parse_game_page,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "game_pages")
+
+PAGES = sorted(
+    [
+        os.path.splitext(os.path.basename(f))[0]
+        for f in glob.glob(os.path.join(DATA_DIR, "*.html"))
+    ]
+)
+
+
+@pytest.fixture(scope="module")
+def general_config():
+    mod_dir = os.path.dirname(nxbrew_dl.__file__)
+    return load_yml(os.path.join(mod_dir, "configs", "general.yml"))
+
+
+def load_page(name):
+    """Load the HTML for a saved page, and what we expect to get out of it
+
+    Args:
+        name (str): Page name
+    """
+
+    with open(os.path.join(DATA_DIR, f"{name}.html"), "rb") as f:
+        content = f.read()
+
+    with open(os.path.join(DATA_DIR, f"{name}.json"), "r", encoding="utf-8") as f:
+        expected = json.load(f)
+
+    return content, expected
+
+
+@pytest.mark.parametrize("parser", HTML_PARSERS)
+@pytest.mark.parametrize("name", PAGES)
+def test_get_dl_dict(general_config, name, parser):
+    content, expected = load_page(name)
+    soup = get_soup(content, parser=parser)
+
+    kwargs = {
+        "regions": list(general_config["regions"].keys()),
+        "regionless_titles": general_config["regionless_titles"],
+        "languages": general_config["languages"],
+        "implied_languages": general_config["implied_languages"],
+        "dl_sites": general_config["dl_sites"],
+        "dl_mappings": general_config["dl_mappings"],
+    }
+
+    if "error" in expected:
+        with pytest.raises(ValueError, match=expected["error"]):
+            get_dl_dict(soup, **kwargs)
+        return
+
+    assert get_dl_dict(soup, **kwargs) == expected
+
+
+@pytest.mark.parametrize("partial_parsing", [True, False])
+@pytest.mark.parametrize("name", PAGES)
+def test_parse_game_page(general_config, name, partial_parsing):
+    content, expected = load_page(name)
+
+    parse_config = get_parse_config(general_config)
+    parse_config["partial_parsing"] = partial_parsing
+
+    if "error" in expected:
+        with pytest.raises(ValueError, match=expected["error"]):
+            parse_game_page(content, parse_config)
+        return
+
+    page_info = parse_game_page(content, parse_config)
+
+    assert page_info["found_language"]
+    assert page_info["thumb_url"] is not None
+    assert page_info["dl_dict"] == expected
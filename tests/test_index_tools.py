@@ -0,0 +1,134 @@
+"""Check changes between two versions of the game index are picked up properly"""
+
+from nxbrew_dl.util import diff_game_dicts, normalise_name
+
+
+def make_game(
+    url,
+    short_name,
+    long_name=None,
+    has_update=False,
+    has_dlc=False,
+):
+    """Make an index entry, as from get_game_dict
+
+    Args:
+        url (str): Game URL
+        short_name (str): Short game name
+        long_name (str): Long game name. Defaults to None, which will
+            use the short name
+        has_update (bool): Whether the game has an update. Defaults to False
+        has_dlc (bool): Whether the game has DLC. Defaults to False
+    """
+
+    if long_name is None:
+        long_name = short_name
+
+    return {
+        "long_name": long_name,
+        "short_name": short_name,
+        "url": url,
+        "has_nsp": True,
+        "has_xci": False,
+        "has_update": has_update,
+        "has_dlc": has_dlc,
+    }
+
+
+def get_game_dict(*games):
+    """Make a game index from a list of entries
+
+    Args:
+        *games (dict): Index entries, from make_game
+    """
+
+    return {game["url"]: game for game in games}
+
+
+def test_normalise_name():
+    assert normalise_name("Pokémon: Let's Go!") == normalise_name("POKEMON LETS GO")
+
+
+def test_no_changes():
+    old_game_dict = get_game_dict(make_game("https://nxbrew.net/game/", "Game"))
+
+    # Only the domain has changed, so this is the same game
+    new_game_dict = get_game_dict(make_game("https://new-nxbrew.net/game/", "Game"))
+
+    delta = diff_game_dicts(old_game_dict, new_game_dict)
+
+    assert delta == {
+        "added": [],
+        "removed": [],
+        "renamed": [],
+        "changed": [],
+    }
+
+
+def test_added_removed_changed():
+    old_game = make_game("https://nxbrew.net/old-game/", "Old Game")
+    game = make_game("https://nxbrew.net/game/", "Game")
+    new_game = make_game("https://nxbrew.net/new-game/", "New Game")
+
+    updated_game = make_game(
+        "https://nxbrew.net/game/",
+        "Game",
+        long_name="Game + Update",
+        has_update=True,
+    )
+
+    delta = diff_game_dicts(
+        get_game_dict(old_game, game),
+        get_game_dict(updated_game, new_game),
+    )
+
+    assert delta["added"] == [new_game]
+    assert delta["removed"] == [old_game]
+    assert delta["changed"] == [updated_game]
+    assert delta["renamed"] == []
+
+
+def test_renamed():
+    game = make_game("https://nxbrew.net/game/", "Game")
+    renamed_game = make_game("https://nxbrew.net/game/", "Game: Deluxe Edition")
+
+    delta = diff_game_dicts(get_game_dict(game), get_game_dict(renamed_game))
+
+    assert delta["renamed"] == [{"old": game, "new": renamed_game}]
+    assert delta["added"] == []
+    assert delta["removed"] == []
+
+
+def test_moved():
+    game = make_game("https://nxbrew.net/game-switch/", "Pokémon: Let's Go")
+    moved_game = make_game("https://nxbrew.net/game/", "Pokemon - Lets Go")
+
+    other_game = make_game("https://nxbrew.net/other-game/", "Other Game")
+    new_game = make_game("https://nxbrew.net/new-game/", "New Game")
+
+    # The URL has changed, but the name hasn't (give or take punctuation), so
+    # it's the same game
+    delta = diff_game_dicts(
+        get_game_dict(game, other_game),
+        get_game_dict(moved_game, new_game),
+    )
+
+    assert delta["renamed"] == [{"old": game, "new": moved_game}]
+    assert delta["added"] == [new_game]
+    assert delta["removed"] == [other_game]
+    assert delta["changed"] == []
+
+
+def test_duplicate_names():
+    old_games = [
+        make_game("https://nxbrew.net/game-1/", "Game"),
+        make_game("https://nxbrew.net/game-2/", "Game"),
+    ]
+    new_game = make_game("https://nxbrew.net/game/", "Game")
+
+    # Only one can have moved, so the other's been removed
+    delta = diff_game_dicts(get_game_dict(*old_games), get_game_dict(new_game))
+
+    assert delta["renamed"] == [{"old": old_games[0], "new": new_game}]
+    assert delta["removed"] == [old_games[1]]
+    assert delta["added"] == []
@@ -0,0 +1,78 @@
+"""Check the job journal survives being reloaded part way through a run"""
+
+import json
+import os
+
+import pytest
+
+from nxbrew_dl.util import JobJournal, get_journal_key
+
+KEY = get_journal_key(
+    "https://nxbrew.net/game/",
+    dl_key="base_game_nsp",
+    full_name="Game: Base",
+)
+
+
+@pytest.fixture
+def journal_file(tmp_path):
+    return str(tmp_path / "journal.json")
+
+
+def test_update(journal_file):
+    journal = JobJournal(journal_file)
+
+    assert journal.update(KEY, "parsed", job={"name": "Game"})
+    assert journal.update(KEY, "resolved", resolved_links={"a": "b"})
+
+    # Nothing's changed, so nothing to write
+    assert not journal.update(KEY, "resolved", resolved_links={"a": "b"})
+
+    # Extra info is kept between states
+    entry = journal.get(KEY)
+    assert entry["state"] == "resolved"
+    assert entry["job"] == {"name": "Game"}
+    assert entry["resolved_links"] == {"a": "b"}
+
+    with pytest.raises(ValueError):
+        journal.update(KEY, "not_a_state")
+
+
+def test_resume(journal_file):
+    journal = JobJournal(journal_file)
+
+    other_key = get_journal_key(
+        "https://nxbrew.net/other-game/",
+        dl_key="dlc",
+        full_name="Other Game: DLC",
+    )
+
+    journal.update(KEY, "submitted", job={"name": "Game"})
+    journal.update(other_key, "done", job={"name": "Other Game"})
+
+    # Picking things up in a new run should find everything where we left it
+    new_journal = JobJournal(journal_file)
+
+    assert new_journal.get_entries().keys() == {KEY, other_key}
+    assert new_journal.get_entries(states=["submitted"]).keys() == {KEY}
+    assert new_journal.get(KEY)["job"] == {"name": "Game"}
+
+    assert new_journal.remove(other_key)
+    assert not new_journal.remove(other_key)
+
+    assert JobJournal(journal_file).get_entries().keys() == {KEY}
+
+
+def test_bad_journal(journal_file):
+    with open(journal_file, "w", encoding="utf-8") as f:
+        f.write("{not json")
+
+    journal = JobJournal(journal_file)
+    assert journal.get_entries() == {}
+
+    # Should be replaced cleanly, with nothing left lying around
+    journal.update(KEY, "parsed")
+
+    with open(journal_file, "r", encoding="utf-8") as f:
+        assert json.load(f)[KEY]["state"] == "parsed"
+    assert not os.path.exists(f"{journal_file}.tmp")
@@ -0,0 +1,77 @@
+"""Check directories are moved out of the way, then deleted in the background"""
+
+import os
+
+from nxbrew_dl.util import TrashWorker
+
+
+def make_game_dir(path, n_files=3, file_size=1024):
+    """Make a directory of files to delete, returning its total size
+
+    Args:
+        path (pathlib.Path): Directory to make
+        n_files (int): Number of files. Defaults to 3
+        file_size (int): Size of each file, in bytes. Defaults to 1024
+    """
+
+    sub_dir = path / "sub"
+    sub_dir.mkdir(parents=True)
+
+    for i in range(n_files):
+        with open(sub_dir / f"file_{i}.nsp", "wb") as f:
+            f.write(b"\0" * file_size)
+
+    return n_files * file_size
+
+
+def test_delete(tmp_path):
+    game_dir = tmp_path / "Games" / "Game"
+    size = make_game_dir(game_dir)
+
+    worker = TrashWorker(str(tmp_path / "trash"))
+    assert worker.delete(str(game_dir))
+
+    # Should be gone straight away, even if it's still being deleted
+    assert not game_dir.exists()
+
+    worker.wait()
+
+    assert os.listdir(tmp_path / "trash") == []
+    assert worker.get_progress() == {
+        "queued": 1,
+        "deleted": 1,
+        "bytes_deleted": size,
+    }
+
+    # Nothing there, so nothing to do
+    assert not worker.delete(str(game_dir))
+
+
+def test_leftovers(tmp_path):
+    trash_dir = tmp_path / "trash"
+    size = make_game_dir(trash_dir / "left_over_Game")
+
+    # Anything left in the trash from last time should be cleared out
+    worker = TrashWorker(str(trash_dir))
+    worker.wait()
+
+    assert os.listdir(trash_dir) == []
+    assert worker.get_progress()["bytes_deleted"] == size
+
+
+def test_symlinks(tmp_path):
+    keep_dir = tmp_path / "Keep"
+    size = make_game_dir(keep_dir)
+
+    game_dir = tmp_path / "Games" / "Game"
+    game_dir.mkdir(parents=True)
+    os.symlink(keep_dir, game_dir / "link")
+
+    worker = TrashWorker(str(tmp_path / "trash"))
+    worker.delete(str(game_dir))
+    worker.wait()
+
+    # Only the link should go, not what it points to
+    assert not game_dir.exists()
+    assert len(os.listdir(keep_dir / "sub")) == 3
+    assert worker.get_progress()["bytes_deleted"] < size
@@ -0,0 +1,143 @@
+"""Check the SQLite user cache behaves like the old cache dictionary"""
+
+import json
+
+import pytest
+
+from nxbrew_dl.util import UserCache
+
+URL = "https://nxbrew.net/game/"
+NEW_URL = "https://nxbrew.net/game-renamed/"
+
+
+@pytest.fixture
+def user_cache(tmp_path):
+    return UserCache(str(tmp_path / "cache.db"))
+
+
+def test_entries(user_cache):
+    user_cache.add_game(URL, "Game")
+    user_cache.add_item(URL, "base_game_nsp", "Game v1")
+    user_cache.add_item(URL, "DLC", "Game DLC 1")
+    user_cache.add_item(URL, "DLC", "Game DLC 2")
+
+    assert URL in user_cache
+    assert user_cache.has_item(URL, "DLC", "Game DLC 2")
+    assert not user_cache.has_item(URL, "DLC", "Game DLC 3")
+
+    # Items come back as tuples, in the order they were added
+    entry = user_cache[URL]
+    assert entry["name"] == "Game"
+    assert entry["DLC"] == ("Game DLC 1", "Game DLC 2")
+    assert "thumb_url" not in entry
+
+    # Entries write straight through
+    entry["DLC"] = ["Game DLC 3"]
+    entry["thumb_url"] = "https://nxbrew.net/thumb.jpg"
+
+    assert dict(user_cache[URL]) == {
+        "name": "Game",
+        "thumb_url": "https://nxbrew.net/thumb.jpg",
+        "base_game_nsp": ("Game v1",),
+        "DLC": ("Game DLC 3",),
+    }
+
+    user_cache.remove_dl_key("DLC")
+    assert "DLC" not in user_cache[URL]
+
+    del user_cache[URL]
+    assert URL not in user_cache
+    with pytest.raises(KeyError):
+        user_cache[URL]
+
+
+def test_rename_url(user_cache):
+    user_cache.add_game(URL, "Game", thumb_url="https://nxbrew.net/thumb.jpg")
+    user_cache.add_item(URL, "DLC", "Game DLC 1")
+
+    user_cache.rename_url(URL, NEW_URL)
+
+    assert URL not in user_cache
+    assert user_cache[NEW_URL]["DLC"] == ("Game DLC 1",)
+    assert user_cache.get_url_by_path("/game-renamed/") == NEW_URL
+
+
+def test_rename_url_merge(user_cache):
+    user_cache.add_game(URL, "Game", thumb_url="https://nxbrew.net/thumb.jpg")
+    user_cache.add_item(URL, "DLC", "Game DLC 1")
+    user_cache.add_item(URL, "DLC", "Game DLC 2")
+
+    # Something's already at the new URL, so the two should be merged
+    user_cache.add_game(NEW_URL, "Game (Renamed)")
+    user_cache.add_item(NEW_URL, "DLC", "Game DLC 2")
+    user_cache.add_item(NEW_URL, "base_game_nsp", "Game v1")
+
+    user_cache.rename_url(URL, NEW_URL)
+
+    assert URL not in user_cache
+    assert len(user_cache) == 1
+    assert dict(user_cache[NEW_URL]) == {
+        "name": "Game (Renamed)",
+        "thumb_url": "https://nxbrew.net/thumb.jpg",
+        "DLC": ("Game DLC 2", "Game DLC 1"),
+        "base_game_nsp": ("Game v1",),
+    }
+
+
+def test_import_json(tmp_path):
+    json_file = tmp_path / "cache.json"
+    old_cache = {
+        URL: {
+            "name": "Game",
+            "thumb_url": "https://nxbrew.net/thumb.jpg",
+            "base_game_nsp": ["Game v1"],
+            "DLC": ["Game DLC 1", "Game DLC 2"],
+        },
+        NEW_URL: {
+            "name": "Other Game",
+        },
+    }
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(old_cache, f)
+
+    db_file = str(tmp_path / "cache.db")
+    user_cache = UserCache(db_file, json_file=str(json_file))
+
+    assert len(user_cache) == 2
+    assert dict(user_cache[URL]) == {
+        "name": "Game",
+        "thumb_url": "https://nxbrew.net/thumb.jpg",
+        "base_game_nsp": ("Game v1",),
+        "DLC": ("Game DLC 1", "Game DLC 2"),
+    }
+    assert dict(user_cache[NEW_URL]) == {"name": "Other Game"}
+
+    # Only imported once, so anything since isn't overwritten
+    user_cache.add_item(URL, "DLC", "Game DLC 3")
+
+    user_cache = UserCache(db_file, json_file=str(json_file))
+    assert user_cache[URL]["DLC"] == ("Game DLC 1", "Game DLC 2", "Game DLC 3")
+
+
+def test_remap_domain(user_cache):
+    user_cache.add_game("https://old-nxbrew.net/game/", "Game")
+    user_cache.add_item("https://old-nxbrew.net/game/", "DLC", "Game DLC 1")
+    user_cache.add_game("http://nxbrew.net/other-game/", "Other Game")
+    user_cache.add_game(URL, "Game (Already Moved)")
+    user_cache.add_game("https://old-nxbrew.net/third-game/", "Third Game")
+
+    n_remapped = user_cache.remap_domain("https://nxbrew.net")
+
+    # Anything that would clash is left where it is
+    assert n_remapped == 2
+    assert sorted(user_cache) == [
+        "https://nxbrew.net/game/",
+        "https://nxbrew.net/other-game/",
+        "https://nxbrew.net/third-game/",
+        "https://old-nxbrew.net/game/",
+    ]
+    assert user_cache[URL]["name"] == "Game (Already Moved)"
+    assert user_cache["https://old-nxbrew.net/game/"]["DLC"] == ("Game DLC 1",)
+
+    # Nothing left to do
+    assert user_cache.remap_domain("https://nxbrew.net") == 0